@@ -17,542 +17,752 @@ Cleaned-up version
     <params>
         <param field="Address" label="IP Address" width="200px" required="false" default="127.0.0.1" />
         <param field="Port" label="TCP Port" width="200px" required="false" default="1470" />
-        <param field="Mode1" label="Device ID" width="40px" required="true" default="1" />
+        <param field="Mode1" label="Device IDs" width="100px" required="true" default="1" />
         <param field="Mode2" label="Debug" width="75px">
             <options>
                 <option label="True" value="Debug"/>
                 <option label="False" value="Normal"  default="true" />
             </options>
         </param>
+        <param field="Mode3" label="Protocol" width="150px">
+            <options>
+                <option label="RTU over TCP" value="RTU" default="true" />
+                <option label="Modbus TCP" value="TCP"/>
+                <option label="Serial RS-485" value="Serial"/>
+            </options>
+        </param>
+        <param field="SerialPort" label="Serial Port" width="150px" required="false" default="/dev/ttyUSB0" />
+        <param field="Mode5" label="Diagnostics" width="75px">
+            <options>
+                <option label="Devices" value="Devices"/>
+                <option label="Off" value="Off"  default="true" />
+            </options>
+        </param>
+        <param field="Mode6" label="Options" width="300px" required="false" default="" />
     </params>
 </plugin>
 """
 
 import Domoticz  # tested on Python 3.9.2 in Domoticz 2024.7
+import json
+import os
 import time
-import socket
-import binascii
-
-from modbus_crc import add_crc, check_crc
-
 
-SOCKET_TIMEOUT = 2.0         # seconds
-MAX_RETRIES = 2              # modest retry to avoid hanging Domoticz
+from powerworld.breaker import CLOSED, CircuitBreaker
+from powerworld.capture import CaptureWriter
+from powerworld.endpoint import create_server
+from powerworld.energy import EnergyMeter
+from powerworld.faults import FaultIndex
+from powerworld.history import History
+from powerworld.logger import DEBUG, ERROR, INFO, Changes, Logger, changed_values
+from powerworld.options import DEFAULTS, parse_options
+from powerworld.planner import Scheduler, affected, plan_reads
+from powerworld.publish import PublishCache
+from powerworld.regmap import load_register_map
+from powerworld.rs485 import SerialConnection
+from powerworld.registers import REGISTERS, REGISTER_SPACE, TIERS, Decoder, frequency_mode, register_space
+from powerworld.timing import BusLoad, RttEstimator
+from powerworld.transport import GatewayConnection, ModbusTcpConnection
+from powerworld.worker import PollWorker, Pump
+from powerworld.writes import RegisterWrite, WriteEngine
+
+
+HEARTBEAT = 10               # seconds
+FAST_HEARTBEAT = 1           # seconds, while waiting for the read-back of a command
+UNIT_STRIDE = 40             # heat pump n (from 0) uses Units n * 40 + 1 ... n * 40 + 39
+MAX_PUMPS = 6                # Units 241 and up are the plugin's own diagnostic devices
+
+# diagnostic devices (hardware parameter "Diagnostics")
+UNIT_POLL_LATENCY = 241
+UNIT_ERROR_RATE = 242
+UNIT_GOOD_POLL_AGE = 243
+UNIT_STATS_DUMP = 244
+STATS_FILE = 'powerworld_stats.json'
+DEBUG_FILE = 'powerworld_debug.log'  # the recent log messages, written with the stats file
+ENERGY_SAVE = 600            # seconds between saves of the energy counters
+CAPTURE_FILE = 'powerworld_capture.bin'
+
+# Units that show heat pump values
+REGISTER_UNITS = frozenset(unit for reg in REGISTERS for unit in reg.units)
 
 
 class BasePlugin:
     def __init__(self):
-        # number of heartbeats to wait before next read; Domoticz HB is 10s -> 3*10s = 30s
-        self.runInterval = 3
+        self.conn = None
+        self.decoder = None
+        self.worker = None
+        self.server = None
+        self.slaves = [1]
+        self.pumps = []
+        self.writers = []
+        self.faults = {}
+        self.meters = {}
+        self.energy_saved = 0.0
+        self.published = {}
+        self.last_values = {}
+        self.log = Logger(emit)
+        self.timed_out = set()
+        self.options = dict(DEFAULTS)
+        self.registers = REGISTERS
+        self.readable = None
+        self.absent_units = frozenset()
+        self.space = REGISTER_SPACE
+        self.used_units = frozenset()
+        self.cache = None
+        self.publish_units = None
+        self.awaiting = 0
+        self.awaiting_since = 0.0
         return
 
     def onStart(self):
-        Domoticz.Log("PowerWorld-Modbus plugin start")
-        self.runInterval = 3
-
-        # Devices aanmaken
+        self.log.level = DEBUG if Parameters['Mode2'] == 'Debug' else INFO
+        self.log.info("PowerWorld-Modbus plugin start")
+        try:
+            self.options = parse_options(Parameters["Mode6"])
+        except ValueError as err:
+            self.log.error(f"PowerWorld options ignored, using the defaults: {err}")
+        try:
+            self.slaves = parse_slaves(Parameters["Mode1"])
+        except ValueError as err:
+            self.log.error(f"PowerWorld not started: {err}")
+            return
+        if self.options['register_map']:
+            path = os.path.join(Parameters['HomeFolder'], self.options['register_map'])
+            try:
+                self.registers, self.readable, absent = load_register_map(path)
+                self.log.info(f"Register map {path} loaded")
+                if absent:
+                    units = sorted({unit for reg in REGISTERS if reg.name in absent for unit in reg.units})
+                    self.absent_units = frozenset(index * UNIT_STRIDE + unit for index in range(len(self.slaves))
+                                                  for unit in units)
+                    self.log.info(f"PowerWorld register map: {', '.join(sorted(absent))} not available, "
+                                   f"devices of Units {', '.join(map(str, units))} are not updated")
+            except ValueError as err:
+                self.log.error(f"PowerWorld register map ignored: {err}")
+        self.space = register_space(self.registers)
+
+        # Devices aanmaken, one Unit range per heat pump
+        for index, slave in enumerate(self.slaves):
+            self.create_devices(index * UNIT_STRIDE, f"Pump {slave} " if index else "")
+
+        if Parameters["Mode5"] == "Devices":
+            if UNIT_POLL_LATENCY not in Devices:
+                opt = {"Custom": "1;ms"}
+                Domoticz.Device(Name="Poll latency", Unit=UNIT_POLL_LATENCY, Type=243, Subtype=31, Options=opt, Used=1).Create()
+            if UNIT_ERROR_RATE not in Devices:
+                Domoticz.Device(Name="Poll error rate", Unit=UNIT_ERROR_RATE, Type=243, Subtype=6, Used=1).Create()
+            if UNIT_GOOD_POLL_AGE not in Devices:
+                opt = {"Custom": "1;s"}
+                Domoticz.Device(Name="Last good poll age", Unit=UNIT_GOOD_POLL_AGE, Type=243, Subtype=31, Options=opt, Used=1).Create()
+            if UNIT_STATS_DUMP not in Devices:
+                Domoticz.Device(Name="Write stats file", Unit=UNIT_STATS_DUMP, Type=244, Subtype=73, Switchtype=9, Used=1).Create()
+
+        # one gateway session (or serial port) for all reads and writes, used only by the poll worker
+        estimator = RttEstimator(self.options['min_timeout'], self.options['timeout'], min_gap=self.options['min_gap'])
+        if Parameters["Mode3"] == "Serial":
+            self.conn = SerialConnection(Parameters["SerialPort"], self.options['baud'], self.options['parity'],
+                                         self.options['stopbits'], self.options['timeout'], self.options['retries'],
+                                         estimator=estimator)
+        elif Parameters["Mode3"] == "TCP":
+            self.conn = ModbusTcpConnection(Parameters["Address"], Parameters["Port"], self.options['timeout'],
+                                            self.options['retries'], estimator=estimator,
+                                            pipeline=self.options['pipeline'])
+        else:
+            self.conn = GatewayConnection(Parameters["Address"], Parameters["Port"], self.options['timeout'],
+                                          self.options['retries'], estimator=estimator)
+        if self.options['capture'] > 0:
+            path = os.path.join(Parameters['HomeFolder'], CAPTURE_FILE)
+            try:
+                self.conn.recorder = CaptureWriter(path, int(self.options['capture'] * 1024 * 1024))
+                self.log.info(f"Recording Modbus traffic to {path}")
+            except OSError as err:
+                self.log.error(f"PowerWorld capture not started: {err}")
+        self.decoder = Decoder(self.registers)
+        self.cache = self.create_cache()
+        # all heat pumps share the connection and the worker; each has its own image, schedule and breaker
+        self.pumps = [Pump(slave, None, self.space * 2,
+                           CircuitBreaker(self.options['backoff'], self.options['backoff_max']),
+                           self.create_history())
+                      for slave in self.slaves]
+        self.writers = [WriteEngine(pump.image, pump.stamps, self.options['rmw_age'], self.options['fc16'] == 1)
+                        for pump in self.pumps]
+        self.restore_energy()
+        self.update_plan()
+        self.worker = PollWorker(self.conn, read_heatpump, self.decoder.decode, self.pumps,
+                                 BusLoad(self.options['bus_load'], self.options['stretch']))
+        self.worker.start()
+        if self.options['http_port'] or self.options['http_bind'].startswith('/'):
+            self.start_server()
+
+        Domoticz.Heartbeat(HEARTBEAT)
+
+    def start_server(self):
+        """Serve the snapshots to other consumers, so they do not poll the heat pump themselves."""
+        bind, port = self.options['http_bind'], self.options['http_port']
+        try:
+            self.server = create_server(self.pumps, bind, port, self.registers)
+        except OSError as err:
+            self.log.error(f"PowerWorld snapshot endpoint not started: {err}")
+            return
+        self.server.start()
+        self.log.info(f"Serving snapshots on {bind if bind.startswith('/') else f'http://{bind}:{port}/'}")
+
+    def create_cache(self):
+        return PublishCache({
+            'temperature': self.options['db_temp'],
+            'power': self.options['db_power'],
+            'current': self.options['db_current'],
+            'voltage': self.options['db_voltage'],
+        }, self.options['max_age'])
+
+    def create_history(self):
+        """
+        A ring buffer for the configured hours of images at the fast poll
+        period, within this heat pump's share of history_mb, or None.
+        """
+        size = self.space * 2
+        slots = int(self.options['history'] * 3600 / self.options['fast'])
+        limit = int(self.options['history_mb'] * 1e6 / len(self.slaves) / (size + 8))
+        if slots > limit:
+            self.log.info(f"History limited by history_mb to {limit * self.options['fast'] / 3600:.1f} h per heat pump")
+            slots = limit
+        if slots < 1:
+            return None
+        history = History(slots, size)
+        self.log.info(f"Keeping {slots} register images ({history.nbytes / 1e6:.1f} MB) per heat pump in memory")
+        return history
+
+    def create_devices(self, offset, prefix):
+        """Create the devices of one heat pump, numbered from offset + 1."""
         # 1. Operation mode (selector)
-        if 1 not in Devices:
+        if offset + 1 not in Devices:
             opt = {
                 "LevelNames": "Off|Hot water|Heating|Cooling|Hot water + heating|Hot water + cooling",
                 "LevelOffHidden": "false",
                 "SelectorStyle": "1"
             }
-            Domoticz.Device(Name="Operation mode", Unit=1, Type=244, Subtype=62, Switchtype=18, Options=opt, Used=1).Create()
-
-        if 2 not in Devices:
-            Domoticz.Device(Name="Water inlet temp.", Unit=2, Type=80, Subtype=5, Used=1).Create()
-        if 3 not in Devices:
-            Domoticz.Device(Name="Water outlet temp.", Unit=3, Type=80, Subtype=5, Used=1).Create()
-        if 4 not in Devices:
-            Domoticz.Device(Name="Ambient temp.", Unit=4, Type=80, Subtype=5, Used=1).Create()
-        if 5 not in Devices:
-            Domoticz.Device(Name="Boiler temp.", Unit=5, Type=80, Subtype=5, Used=1).Create()
-        if 6 not in Devices:
-            Domoticz.Device(Name="Suction gas temp.", Unit=6, Type=80, Subtype=5, Used=0).Create()
-        if 7 not in Devices:
-            Domoticz.Device(Name="Evaporator coil temp.", Unit=7, Type=80, Subtype=5, Used=0).Create()
-        if 8 not in Devices:
-            Domoticz.Device(Name="Internal coil temp.", Unit=8, Type=80, Subtype=5, Used=0).Create()
-        if 9 not in Devices:
-            Domoticz.Device(Name="Discharge gas temp.", Unit=9, Type=80, Subtype=5, Used=0).Create()
-        if 10 not in Devices:
-            Domoticz.Device(Name="Low pressure conversion temp.", Unit=10, Type=80, Subtype=5, Used=0).Create()
-
-        if 11 not in Devices:
+            Domoticz.Device(Name=prefix + "Operation mode", Unit=offset + 1, Type=244, Subtype=62, Switchtype=18, Options=opt, Used=1).Create()
+
+        if offset + 2 not in Devices:
+            Domoticz.Device(Name=prefix + "Water inlet temp.", Unit=offset + 2, Type=80, Subtype=5, Used=1).Create()
+        if offset + 3 not in Devices:
+            Domoticz.Device(Name=prefix + "Water outlet temp.", Unit=offset + 3, Type=80, Subtype=5, Used=1).Create()
+        if offset + 4 not in Devices:
+            Domoticz.Device(Name=prefix + "Ambient temp.", Unit=offset + 4, Type=80, Subtype=5, Used=1).Create()
+        if offset + 5 not in Devices:
+            Domoticz.Device(Name=prefix + "Boiler temp.", Unit=offset + 5, Type=80, Subtype=5, Used=1).Create()
+        if offset + 6 not in Devices:
+            Domoticz.Device(Name=prefix + "Suction gas temp.", Unit=offset + 6, Type=80, Subtype=5, Used=0).Create()
+        if offset + 7 not in Devices:
+            Domoticz.Device(Name=prefix + "Evaporator coil temp.", Unit=offset + 7, Type=80, Subtype=5, Used=0).Create()
+        if offset + 8 not in Devices:
+            Domoticz.Device(Name=prefix + "Internal coil temp.", Unit=offset + 8, Type=80, Subtype=5, Used=0).Create()
+        if offset + 9 not in Devices:
+            Domoticz.Device(Name=prefix + "Discharge gas temp.", Unit=offset + 9, Type=80, Subtype=5, Used=0).Create()
+        if offset + 10 not in Devices:
+            Domoticz.Device(Name=prefix + "Low pressure conversion temp.", Unit=offset + 10, Type=80, Subtype=5, Used=0).Create()
+
+        if offset + 11 not in Devices:
             opt = {'ValueStep': '1', 'ValueMin': '28', 'ValueMax': '70', 'ValueUnit': '°C'}
-            Domoticz.Device(Name="Setpoint hot water", Unit=11, Type=242, Subtype=1, Options=opt, Used=1).Create()
-        if 12 not in Devices:
+            Domoticz.Device(Name=prefix + "Setpoint hot water", Unit=offset + 11, Type=242, Subtype=1, Options=opt, Used=1).Create()
+        if offset + 12 not in Devices:
             opt = {'ValueStep': '1', 'ValueMin': '15', 'ValueMax': '70', 'ValueUnit': '°C'}
-            Domoticz.Device(Name="Setpoint heating", Unit=12, Type=242, Subtype=1, Options=opt, Used=1).Create()
-
-        if 13 not in Devices:
-            Domoticz.Device(Name="Fan 1 speed", Unit=13, Type=243, Subtype=7, Used=0).Create()
-        if 14 not in Devices:
-            Domoticz.Device(Name="Fan 2 speed", Unit=14, Type=243, Subtype=7, Used=0).Create()
-        if 15 not in Devices:
-            Domoticz.Device(Name="COP", Unit=15, Type=243, Subtype=31, Used=1).Create()
-        if 16 not in Devices:
-            Domoticz.Device(Name="Water pump speed", Unit=16, Type=243, Subtype=6, Used=0).Create()
-        if 17 not in Devices:
-            Domoticz.Device(Name="Three-way valve", Unit=17, Type=244, Subtype=73, Switchtype=0, Image=9, Used=1).Create()
-        if 18 not in Devices:
-            Domoticz.Device(Name="Boiler heater", Unit=18, Type=244, Subtype=73, Switchtype=0, Image=9, Used=1).Create()
-        if 19 not in Devices:
-            Domoticz.Device(Name="DC bus voltage", Unit=19, Type=243, Subtype=8, Used=0).Create()
-
-        if 20 not in Devices:
+            Domoticz.Device(Name=prefix + "Setpoint heating", Unit=offset + 12, Type=242, Subtype=1, Options=opt, Used=1).Create()
+
+        if offset + 13 not in Devices:
+            Domoticz.Device(Name=prefix + "Fan 1 speed", Unit=offset + 13, Type=243, Subtype=7, Used=0).Create()
+        if offset + 14 not in Devices:
+            Domoticz.Device(Name=prefix + "Fan 2 speed", Unit=offset + 14, Type=243, Subtype=7, Used=0).Create()
+        if offset + 15 not in Devices:
+            Domoticz.Device(Name=prefix + "COP", Unit=offset + 15, Type=243, Subtype=31, Used=1).Create()
+        if offset + 16 not in Devices:
+            Domoticz.Device(Name=prefix + "Water pump speed", Unit=offset + 16, Type=243, Subtype=6, Used=0).Create()
+        if offset + 17 not in Devices:
+            Domoticz.Device(Name=prefix + "Three-way valve", Unit=offset + 17, Type=244, Subtype=73, Switchtype=0, Image=9, Used=1).Create()
+        if offset + 18 not in Devices:
+            Domoticz.Device(Name=prefix + "Boiler heater", Unit=offset + 18, Type=244, Subtype=73, Switchtype=0, Image=9, Used=1).Create()
+        if offset + 19 not in Devices:
+            Domoticz.Device(Name=prefix + "DC bus voltage", Unit=offset + 19, Type=243, Subtype=8, Used=0).Create()
+
+        if offset + 20 not in Devices:
             opt = {"Custom": "1;Hz"}
-            Domoticz.Device(Name="Compressor frequency", Unit=20, Type=243, Subtype=31, Options=opt, Used=0).Create()
-        if 21 not in Devices:
-            Domoticz.Device(Name="Compressor current", Unit=21, Type=243, Subtype=23, Used=0).Create()
-        if 22 not in Devices:
+            Domoticz.Device(Name=prefix + "Compressor frequency", Unit=offset + 20, Type=243, Subtype=31, Options=opt, Used=0).Create()
+        if offset + 21 not in Devices:
+            Domoticz.Device(Name=prefix + "Compressor current", Unit=offset + 21, Type=243, Subtype=23, Used=0).Create()
+        if offset + 22 not in Devices:
             opt = {'EnergyMeterMode': '0'}
-            Domoticz.Device(Name="Compressor power", Unit=22, Type=243, Subtype=29, Options=opt, Used=1).Create()
-        if 23 not in Devices:
-            Domoticz.Device(Name="Low pressure value", Unit=23, Type=243, Subtype=9, Used=0).Create()
-        if 24 not in Devices:
-            Domoticz.Device(Name="Defrosting", Unit=24, Type=244, Subtype=73, Switchtype=0, Image=9, Used=0).Create()
-        if 25 not in Devices:
-            Domoticz.Device(Name="Anti Freezing", Unit=25, Type=244, Subtype=73, Switchtype=0, Image=9, Used=1).Create()
-        if 26 not in Devices:
-            Domoticz.Device(Name="Mains voltage", Unit=26, Type=243, Subtype=8, Used=0).Create()
-        if 27 not in Devices:
-            Domoticz.Device(Name="Consumed current device", Unit=27, Type=243, Subtype=23, Used=0).Create()
-        if 28 not in Devices:
+            Domoticz.Device(Name=prefix + "Compressor power", Unit=offset + 22, Type=243, Subtype=29, Options=opt, Used=1).Create()
+        if offset + 23 not in Devices:
+            Domoticz.Device(Name=prefix + "Low pressure value", Unit=offset + 23, Type=243, Subtype=9, Used=0).Create()
+        if offset + 24 not in Devices:
+            Domoticz.Device(Name=prefix + "Defrosting", Unit=offset + 24, Type=244, Subtype=73, Switchtype=0, Image=9, Used=0).Create()
+        if offset + 25 not in Devices:
+            Domoticz.Device(Name=prefix + "Anti Freezing", Unit=offset + 25, Type=244, Subtype=73, Switchtype=0, Image=9, Used=1).Create()
+        if offset + 26 not in Devices:
+            Domoticz.Device(Name=prefix + "Mains voltage", Unit=offset + 26, Type=243, Subtype=8, Used=0).Create()
+        if offset + 27 not in Devices:
+            Domoticz.Device(Name=prefix + "Consumed current device", Unit=offset + 27, Type=243, Subtype=23, Used=0).Create()
+        if offset + 28 not in Devices:
             opt = {'EnergyMeterMode': '0'}
-            Domoticz.Device(Name="Consumed power device", Unit=28, Type=243, Subtype=29, Options=opt, Used=1).Create()
-        if 29 not in Devices:
+            Domoticz.Device(Name=prefix + "Consumed power device", Unit=offset + 28, Type=243, Subtype=29, Options=opt, Used=1).Create()
+        if offset + 29 not in Devices:
             opt = {"Custom": "1;m3/h"}
-            Domoticz.Device(Name="Waterflow", Unit=29, Type=243, Subtype=31, Options=opt, Used=0).Create()
+            Domoticz.Device(Name=prefix + "Waterflow", Unit=offset + 29, Type=243, Subtype=31, Options=opt, Used=0).Create()
 
-        if 30 not in Devices:
+        if offset + 30 not in Devices:
             opt = {
                 "LevelNames": "Intermittent|Always run|Stop after target",
                 "LevelOffHidden": "true",
                 "SelectorStyle": "1"
             }
-            Domoticz.Device(Name="Pump at target temp.", Unit=30, Type=244, Subtype=62, Switchtype=18, Options=opt, Used=1).Create()
-        if 31 not in Devices:
+            Domoticz.Device(Name=prefix + "Pump at target temp.", Unit=offset + 30, Type=244, Subtype=62, Switchtype=18, Options=opt, Used=1).Create()
+        if offset + 31 not in Devices:
             opt = {'ValueStep': '1', 'ValueMin': '1', 'ValueMax': '30', 'ValueUnit': 'minutes'}
-            Domoticz.Device(Name="Pump on-off cycle", Unit=31, Type=242, Subtype=1, Options=opt, Used=1).Create()
-        if 32 not in Devices:
-            Domoticz.Device(Name="Water Pump", Unit=32, Type=244, Subtype=73, Switchtype=0, Image=9, Used=1).Create()
-        if 33 not in Devices:
-            Domoticz.Device(Name="Chassis electric heating", Unit=33, Type=244, Subtype=73, Switchtype=0, Image=9, Used=0).Create()
-        if 34 not in Devices:
-            Domoticz.Device(Name="Crankshaft electric heating", Unit=34, Type=244, Subtype=73, Switchtype=0, Image=9, Used=0).Create()
-        if 35 not in Devices:
-            Domoticz.Device(Name="Error state", Unit=35, Type=243, Subtype=22, Used=1).Create()
-        if 36 not in Devices:
+            Domoticz.Device(Name=prefix + "Pump on-off cycle", Unit=offset + 31, Type=242, Subtype=1, Options=opt, Used=1).Create()
+        if offset + 32 not in Devices:
+            Domoticz.Device(Name=prefix + "Water Pump", Unit=offset + 32, Type=244, Subtype=73, Switchtype=0, Image=9, Used=1).Create()
+        if offset + 33 not in Devices:
+            Domoticz.Device(Name=prefix + "Chassis electric heating", Unit=offset + 33, Type=244, Subtype=73, Switchtype=0, Image=9, Used=0).Create()
+        if offset + 34 not in Devices:
+            Domoticz.Device(Name=prefix + "Crankshaft electric heating", Unit=offset + 34, Type=244, Subtype=73, Switchtype=0, Image=9, Used=0).Create()
+        if offset + 35 not in Devices:
+            Domoticz.Device(Name=prefix + "Error state", Unit=offset + 35, Type=243, Subtype=22, Used=1).Create()
+        if offset + 36 not in Devices:
             opt = {
                 "LevelNames": "Smart|Powerful|Silent|Holiday",
                 "LevelOffHidden": "true",
                 "SelectorStyle": "1"
             }
-            Domoticz.Device(Name="Frequency mode", Unit=36, Type=244, Subtype=62, Switchtype=18, Options=opt, Used=1).Create()
+            Domoticz.Device(Name=prefix + "Frequency mode", Unit=offset + 36, Type=244, Subtype=62, Switchtype=18, Options=opt, Used=1).Create()
 
-        Domoticz.Heartbeat(10)
+        # 37-39. Computed from flow, temperatures and power
+        if offset + 37 not in Devices:
+            opt = {'EnergyMeterMode': '0'}
+            Domoticz.Device(Name=prefix + "Heat output", Unit=offset + 37, Type=243, Subtype=29, Options=opt, Used=1).Create()
+        if offset + 38 not in Devices:
+            Domoticz.Device(Name=prefix + "COP (rolling)", Unit=offset + 38, Type=243, Subtype=31, Used=1).Create()
+        if offset + 39 not in Devices:
+            Domoticz.Device(Name=prefix + "SCOP", Unit=offset + 39, Type=243, Subtype=31, Used=1).Create()
 
     def onStop(self):
-        Domoticz.Log("PowerWorld-Modbus plugin stop")
+        self.log.info("PowerWorld-Modbus plugin stop")
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+        if self.worker is not None:
+            self.worker.stop()
+            self.flush_worker_log()
+            self.save_energy()
+            if self.conn.recorder is not None:
+                self.conn.recorder.close()
+            stats = self.conn.stats
+            self.log.info(f"Gateway: {stats['requests']} requests over {stats['connects']} connections "
+                         f"({self.conn.connections_saved} connections saved, {stats['connect_failures']} failed connects)")
+            framing = self.conn.framer.stats
+            self.log.info(f"Framing: {framing['fragmented']} fragmented responses reassembled, "
+                         f"{framing['crc_errors']} CRC errors, {framing['stray_bytes']} stray bytes skipped")
+            telemetry = self.worker.telemetry
+            self.log.info(f"Polls: {telemetry.polls} ({telemetry.failed} failed), "
+                         f"round trip p50 {telemetry.conn.rtt.percentile(50) * 1000:.0f} ms, "
+                         f"p99 {telemetry.conn.rtt.percentile(99) * 1000:.0f} ms, "
+                         f"{stats['retries']} retries, {stats['timeouts']} timeouts")
+
+    def flush_worker_log(self):
+        for level, msg, args, key in self.worker.drain_messages():
+            self.log.log(level, msg, *args, key=key)
+
+    def update_plan(self):
+        """
+        Rebuild the polling schedule when devices were enabled or disabled.
+        Only registers that feed a used device are read.
+        """
+        used = frozenset(unit for unit, device in Devices.items() if device.Used)
+        if used == self.used_units and all(pump.scheduler is not None for pump in self.pumps):
+            return
+        self.used_units = used
+        periods = {tier: self.options[tier] for tier in TIERS}
+        for index, pump in enumerate(self.pumps):
+            offset = index * UNIT_STRIDE
+            units = {unit - offset for unit in used if 0 < unit - offset <= UNIT_STRIDE}
+            # the worker picks up the new schedule on its next round
+            pump.scheduler = Scheduler(self.registers, units, periods, self.options['gap'], self.options['max_block'],
+                                       self.readable)
+            label = f"Heat pump {pump.slave}: " if len(self.pumps) > 1 else ""
+            for tier in TIERS:
+                plan = pump.scheduler.plan(frozenset([tier]))
+                self.log.info(f"{label}Polling {len(pump.scheduler.addresses[tier])} {tier} registers every {periods[tier]} s "
+                             f"in {len(plan)} requests: " + ', '.join(f'0x{start:04X}+{count}' for start, count in plan))
+
+    def onDeviceModified(self, Unit):
+        if self.worker is not None:
+            self.update_plan()
 
     def onHeartbeat(self):
-        self.runInterval -= 1
-        if self.runInterval > 0:
+        # only publish what the poll worker has read; never touch the network here
+        if self.worker is None:
+            return
+        self.flush_worker_log()
+        self.update_plan()
+        # check before taking the snapshot: a finished command has already stored its read-back
+        command_done = self.awaiting and (self.worker.jobs_done >= self.awaiting
+                                          or time.monotonic() - self.awaiting_since > 30)
+        snapshots = [pump.latest for pump in self.pumps]
+        if command_done:
+            self.awaiting = 0
+            Domoticz.Heartbeat(HEARTBEAT)
+        self.publish_diagnostics()
+        if time.monotonic() - self.energy_saved >= ENERGY_SAVE:
+            self.save_energy()
+        for index, pump in enumerate(self.pumps):
+            if pump.breaker.state != CLOSED and pump not in self.timed_out:
+                self.mark_timed_out(index, pump)
+            self.take_snapshot(index, pump, snapshots[index])
+
+    def take_snapshot(self, index, pump, snapshot):
+        """Publish the snapshot of one heat pump, unless it was published before."""
+        previous = self.published.get(pump)
+        if snapshot is None or snapshot is previous:
+            return
+        self.published[pump] = snapshot
+        if snapshot.error is not None:
+            self.log_cycle(index, pump, snapshot)
+            self.log.info("PowerWorld read error (heat pump %s): %s", pump.slave, snapshot.error,
+                          key=('read error', pump.slave))
             return
 
-        self.runInterval = 3  # reset
-
-        DevID = Parameters["Mode1"].zfill(2)
+        # a targeted refresh only updates its own Units, unless a poll was never published
+        offset = index * UNIT_STRIDE
+        units = snapshot.units
+        if units is not None and (previous is None or snapshot.seq != previous.seq + 1):
+            units = None
+        started = time.monotonic()
+        updates = (0, 0)
         try:
-            data1 = get_data_range_from_heatpump(Parameters, DevID + '0300000078')
-            data2 = get_data_range_from_heatpump(Parameters, DevID + '0300780078')
-            data3 = get_data_range_from_heatpump(Parameters, DevID + '0300F00078')
-            data4 = get_data_range_from_heatpump(Parameters, DevID + '0301680007')
-            raw_data = (data1 + data2 + data3 + data4).hex().upper()
-
-            # alle velden uitlezen
-            unit_state = get_bit_value(get_single_data(raw_data, '003F', 0), 0)
-            operation_mode = get_single_data(raw_data, '0043', 0)
-            water_in_temp = round(get_single_data(raw_data, '000E', 0.10), 1)
-            water_out_temp = round(get_single_data(raw_data, '0012', 0.10), 1)
-            ambient_temp = round(get_single_data(raw_data, '0011', 0.50), 1)
-            boiler_temp = round(get_single_data(raw_data, '000F', 0.10), 1)
-            suction_gas_temp = get_single_data(raw_data, '0015', 0)
-            evap_temp = get_single_data(raw_data, '0016', 0)
-            internal_temp = get_single_data(raw_data, '001A', 0)
-            discharge_temp = get_single_data(raw_data, '001B', 0)
-            low_press_conv_temp = round(get_single_data(raw_data, '0028', 0.10), 1)
-            hot_water_sp = get_single_data(raw_data, '00BE', 0)
-            heating_sp = get_single_data(raw_data, '00C0', 0)
-            fan1 = get_single_data(raw_data, '0026', 0)
-            fan2 = get_single_data(raw_data, '0027', 0)
-            cop = round(get_single_data(raw_data, '0037', 0.10), 1)
-            water_pump_speed = round(get_single_data(raw_data, '002A', 0.10), 1)
-            three_way = get_bit_value(get_single_data(raw_data, '0005', 0), 6)
-            elec_boiler = get_bit_value(get_single_data(raw_data, '0005', 0), 7)
-            dc_bus = get_single_data(raw_data, '0021', 0)
-            comp_freq = get_single_data(raw_data, '001E', 0)
-            comp_current = get_single_data(raw_data, '0023', 0)
-            comp_power = get_single_data(raw_data, '002E', 0)
-            low_press_val = round(get_single_data(raw_data, '002B', 0.01), 2)
-            defrosting = get_bit_value(get_single_data(raw_data, '0003', 0), 7)
-            mains_voltage = get_single_data(raw_data, '0031', 0)
-            cons_current = round(get_single_data(raw_data, '0032', 0.10), 1)
-            cons_power = get_single_data(raw_data, '0035', 0)
-            waterflow = round(get_single_data(raw_data, '0030', 0.01), 2)
-            pump_target = get_single_data(raw_data, '015B', 0)
-            pump_cycle = get_single_data(raw_data, '015C', 0)
-            chassis_heat = get_bit_value(get_single_data(raw_data, '0005', 0), 0)
-            crank_heat = get_bit_value(get_single_data(raw_data, '0006', 0), 1)
-            fault_1 = get_single_data(raw_data, '0007', 0)
-            fault_2 = get_single_data(raw_data, '0008', 0)
-            fault_3 = get_single_data(raw_data, '0009', 0)
-            fault_4 = get_single_data(raw_data, '000A', 0)
-            fault_5 = get_single_data(raw_data, '000B', 0)
-            fault_6 = get_single_data(raw_data, '000C', 0)
-            fault_7 = get_single_data(raw_data, '000D', 0)
-            freq_mode = calculate_frequency_mode(raw_data)
-
-            anti_freezing = 0
-            if crank_heat == 1:
-                anti_freezing = 1
-
-            water_pump = 1 if water_pump_speed > 0 else 0
-
-            error_level, error_text = interpret_errors(
-                fault_1, fault_2, fault_3, fault_4, fault_5, fault_6, fault_7
-            )
-            if error_text.startswith("Secondary anti-freezing") or error_text.startswith("Level 1 anti-freezing"):
-                anti_freezing = 1
-
-            def upd(u, n, s):
-                if u in Devices:
-                    Devices[u].Update(nValue=n, sValue=str(s))
-
-            if 1 in Devices:
-                if unit_state == 0:
-                    Devices[1].Update(nValue=0, sValue='0')
-                else:
-                    Devices[1].Update(nValue=1, sValue=str((operation_mode + 1) * 10))
-
-            upd(2, 0, water_in_temp)
-            upd(3, 0, water_out_temp)
-            upd(4, 0, ambient_temp)
-            upd(5, 0, boiler_temp)
-            upd(6, 0, suction_gas_temp)
-            upd(7, 0, evap_temp)
-            upd(8, 0, internal_temp)
-            upd(9, 0, discharge_temp)
-            upd(10, 0, low_press_conv_temp)
-
-            if 11 in Devices:
-                Devices[11].Update(nValue=int(hot_water_sp), sValue=str(hot_water_sp))
-            if 12 in Devices:
-                Devices[12].Update(nValue=int(heating_sp), sValue=str(heating_sp))
-
-            upd(13, 0, fan1)
-            upd(14, 0, fan2)
-            if 15 in Devices:
-                Devices[15].Update(nValue=int(cop), sValue=str(cop))
-            upd(16, 0, water_pump_speed)
-            if 17 in Devices:
-                Devices[17].Update(nValue=int(three_way), sValue="")
-            if 18 in Devices:
-                Devices[18].Update(nValue=int(elec_boiler), sValue="")
-            upd(19, 0, dc_bus)
-            upd(20, 0, comp_freq)
-            upd(21, 0, comp_current)
-            if 22 in Devices:
-                Devices[22].Update(nValue=0, sValue=str(int(comp_power)) + ';0')
-            upd(23, 0, low_press_val)
-            if 24 in Devices:
-                Devices[24].Update(nValue=int(defrosting), sValue="")
-            if 25 in Devices:
-                Devices[25].Update(nValue=int(anti_freezing), sValue="")
-            upd(26, 0, mains_voltage)
-            upd(27, 0, cons_current)
-            if 28 in Devices:
-                Devices[28].Update(nValue=0, sValue=str(int(cons_power)) + ';0')
-            upd(29, 0, waterflow)
-            if 30 in Devices:
-                Devices[30].Update(nValue=1, sValue=str((pump_target + 1) * 10))
-            if 31 in Devices:
-                Devices[31].Update(nValue=int(pump_cycle), sValue=str(pump_cycle))
-            if 32 in Devices:
-                Devices[32].Update(nValue=int(water_pump), sValue="")
-            if 33 in Devices:
-                Devices[33].Update(nValue=int(chassis_heat), sValue="")
-            if 34 in Devices:
-                Devices[34].Update(nValue=int(crank_heat), sValue="")
-            if 35 in Devices:
-                Devices[35].Update(nValue=int(error_level), sValue=error_text)
-            if 36 in Devices:
-                Devices[36].Update(nValue=1, sValue=str(freq_mode))
-
-            Domoticz.Heartbeat(10)
-
-            if Parameters['Mode2'] == 'Debug':
-                Domoticz.Log('------ PowerWorld Modbus Data ------')
-                Domoticz.Log(f'Unit: {"On" if unit_state == 1 else "Off"}')
-                Domoticz.Log(f'Operation mode: {operation_mode_text(operation_mode)}')
-                Domoticz.Log(f'Water inlet temp.: {water_in_temp} C')
-                Domoticz.Log(f'Water outlet temp.: {water_out_temp} C')
-                Domoticz.Log(f'Ambient temp.: {ambient_temp} C')
-                Domoticz.Log(f'Boiler temp.: {boiler_temp} C')
-                Domoticz.Log(f'Suction gas temp.: {suction_gas_temp} C')
-                Domoticz.Log(f'Evaporator coil temp.: {evap_temp} C')
-                Domoticz.Log(f'Internal coil temp.: {internal_temp} C')
-                Domoticz.Log(f'Discharge gas temp.: {discharge_temp} C')
-                Domoticz.Log(f'Low pressure conv. temp.: {low_press_conv_temp} C')
-                Domoticz.Log(f'Hot water setpoint: {hot_water_sp} C')
-                Domoticz.Log(f'Heating setpoint: {heating_sp} C')
-                Domoticz.Log(f'Fan1: {fan1} rpm')
-                Domoticz.Log(f'Fan2: {fan2} rpm')
-                Domoticz.Log(f'COP: {cop}')
-                Domoticz.Log(f'Water pump speed: {water_pump_speed} %')
-                Domoticz.Log(f'Three-way valve: {"On" if three_way == 1 else "Off"}')
-                Domoticz.Log(f'Electric boiler heater: {"On" if elec_boiler == 1 else "Off"}')
-                Domoticz.Log(f'DC bus voltage: {dc_bus} V')
-                Domoticz.Log(f'Compressor frequency: {comp_freq} Hz')
-                Domoticz.Log(f'Compressor current: {comp_current} A')
-                Domoticz.Log(f'Compressor power: {comp_power} W')
-                Domoticz.Log(f'Low pressure value: {low_press_val} Bar')
-                Domoticz.Log(f'Defrosting: {"On" if defrosting == 1 else "Off"}')
-                Domoticz.Log(f'Anti freezing: {"On" if anti_freezing == 1 else "Off"}')
-                Domoticz.Log(f'Mains voltage: {mains_voltage} V')
-                Domoticz.Log(f'Consumed current device: {cons_current} A')
-                Domoticz.Log(f'Consumed power device: {cons_power} W')
-                Domoticz.Log(f'Waterflow: {waterflow} m3/h')
-                Domoticz.Log(f'Pump on target temp: {pump_target}')
-                Domoticz.Log(f'Pump on-off cycle: {pump_cycle} min')
-                Domoticz.Log(f'Water Pump: {"On" if water_pump == 1 else "Off"}')
-                Domoticz.Log(f'Chassis electric heating: {"On" if chassis_heat == 1 else "Off"}')
-                Domoticz.Log(f'Crankshaft electric heating: {"On" if crank_heat == 1 else "Off"}')
-                Domoticz.Log(f'Error text: {error_text}')
-                Domoticz.Log(f'Frequency mode: {freq_mode}')
-                Domoticz.Log('------------------------------------')
-
+            updates = self.publish(offset, snapshot, units)
+            if units is None and pump in self.timed_out:
+                self.clear_timed_out(index, pump)
         except Exception as err:
-            Domoticz.Log(f"PowerWorld read error: {err}")
-            Domoticz.Heartbeat(5)
-            self.runInterval = 1
-
+            self.log.error("PowerWorld publish error: %s", err)
+        self.worker.telemetry.published(time.monotonic() - started)
+        self.log_cycle(index, pump, snapshot, updates)
+
+    def restore_energy(self):
+        """One energy meter per heat pump, continuing the counters saved in the plugin configuration."""
+        config = Domoticz.Configuration()
+        for index, pump in enumerate(self.pumps):
+            meter = EnergyMeter(self.options['cop_window'] * 60)
+            state = config.get(f'energy_{pump.slave}')
+            if state:
+                try:
+                    meter.restore(state)
+                except (KeyError, TypeError, ValueError) as err:
+                    self.log.error(f"PowerWorld energy counters of heat pump {pump.slave} not restored: {err}")
+            self.meters[index * UNIT_STRIDE] = meter
+        self.energy_saved = time.monotonic()
+
+    def save_energy(self):
+        config = Domoticz.Configuration()
+        for index, pump in enumerate(self.pumps):
+            config[f'energy_{pump.slave}'] = self.meters[index * UNIT_STRIDE].state()
+        Domoticz.Configuration(config)
+        self.energy_saved = time.monotonic()
+
+    def mark_timed_out(self, index, pump):
+        """
+        Show the heat pump devices as timed out (red header) while the heat
+        pump does not answer, instead of leaving their last values up as if
+        they were current. The next good poll updates all of them again.
+        """
+        self.timed_out.add(pump)
+        offset = index * UNIT_STRIDE
+        for unit in sorted(self.used_units & {offset + unit for unit in REGISTER_UNITS}):
+            device = Devices[unit]
+            device.Update(nValue=device.nValue, sValue=device.sValue, TimedOut=1)
+            self.cache.forget(unit)
+
+    def clear_timed_out(self, index, pump):
+        """
+        After the first good poll, clear the devices that publish() left
+        alone: COP and SCOP without a ratio yet and absent registers.
+        """
+        self.timed_out.discard(pump)
+        offset = index * UNIT_STRIDE
+        for unit in sorted(self.used_units & {offset + unit for unit in REGISTER_UNITS}):
+            device = Devices[unit]
+            if device.TimedOut:
+                device.Update(nValue=device.nValue, sValue=device.sValue, TimedOut=0)
+
+    def log_cycle(self, index, pump, snapshot, updates=(0, 0)):
+        """
+        One debug line per taken snapshot: what the requests to this heat pump
+        did since its previous one, the device updates and the values that changed since
+        the previous good snapshot. It is formatted only if it is written.
+        """
+        delta = self.worker.telemetry.cycle(pump.slave)
+        changes = Changes()
+        if snapshot.error is None:
+            values = dict(snapshot.values)
+            values['operation_mode'] = operation_mode_text(values['operation_mode'])
+            faults = self.faults.get(index * UNIT_STRIDE)
+            if faults is not None:
+                values['faults'] = faults.decode(values).text
+            changes = changed_values(self.last_values.get(pump), values)
+            self.last_values[pump] = values
+        self.log.debug("Heat pump %s cycle %d: %s in %.0f ms (decode %.2f ms), %d requests, %d retries, "
+                       "%d timeouts, %d CRC errors, %d connects, %d/%d bytes sent/received, "
+                       "%d devices updated, %d unchanged; %s",
+                       pump.slave, snapshot.seq, 'failed' if snapshot.error else 'ok', snapshot.duration * 1000,
+                       snapshot.decode * 1000, delta['requests'], delta['retries'], delta['timeouts'],
+                       delta['crc_errors'], delta['connects'], delta['bytes_sent'], delta['bytes_received'],
+                       updates[0], updates[1], changes)
+
+    def publish_diagnostics(self):
+        """Update the diagnostic devices, if they were created."""
+        if UNIT_POLL_LATENCY not in Devices:
+            return
+        telemetry = self.worker.telemetry
+        self.publish_units = None
+        latency = round(telemetry.poll.percentile(90) * 1000)
+        self.update_device(UNIT_POLL_LATENCY, 0, latency)
+        self.update_device(UNIT_ERROR_RATE, 0, round(telemetry.error_rate(), 1))
+        self.update_device(UNIT_GOOD_POLL_AGE, 0, round(telemetry.last_good_age()))
+
+    def write_stats(self):
+        """Dump the telemetry as JSON, and the recent log messages, into the plugin folder."""
+        path = os.path.join(Parameters['HomeFolder'], STATS_FILE)
+        stats = self.worker.telemetry.as_dict()
+        stats['devices'] = {'published': self.cache.published_total, 'suppressed': self.cache.suppressed_total}
+        if self.server is not None:
+            stats['endpoint'] = self.server.as_dict()
+        stats['history'] = {pump.slave: pump.history.as_dict() for pump in self.pumps if pump.history is not None}
+        stats['log'] = {'ring': len(self.log.ring), 'suppressed': self.log.suppressed}
+        try:
+            with open(path, 'w') as f:
+                json.dump(stats, f, indent=2)
+            count = self.log.dump(os.path.join(Parameters['HomeFolder'], DEBUG_FILE))
+        except OSError as err:
+            self.log.error(f"PowerWorld stats not written: {err}")
+            return
+        self.log.info(f"PowerWorld stats and the last {count} log messages written to {path} and {DEBUG_FILE}")
+
+    def update_device(self, unit, nValue, sValue, kind=None, number=None):
+        """
+        Update a used device unless the publish cache reports no change.
+        number is the numeric value compared against the deadband for kind.
+        """
+        if unit not in self.used_units or unit in self.absent_units:
+            return
+        if self.publish_units is not None and unit not in self.publish_units:
+            return
+        sValue = str(sValue)
+        if self.cache.changed(unit, nValue, sValue, kind, number):
+            Devices[unit].Update(nValue=nValue, sValue=sValue)
+
+    def publish(self, offset, snapshot, units=None):
+        """
+        Publish the decoded values to all devices of the heat pump whose Units
+        start at offset + 1, or only to the given Units. Returns the numbers
+        of devices updated and left unchanged.
+        """
+        self.publish_units = units
+        v = snapshot.values
+        freq_mode = frequency_mode(v)
+
+        anti_freezing = 0
+        if v['crank_heat'] == 1:
+            anti_freezing = 1
+
+        water_pump = 1 if v['water_pump_speed'] > 0 else 0
+
+        # one fault index per heat pump, it skips decoding while the fault words do not change
+        faults = self.faults.get(offset)
+        if faults is None:
+            faults = self.faults[offset] = FaultIndex()
+        error_level, error_text, _, frost = faults.decode(v)
+        if frost:
+            anti_freezing = 1
+
+        meter = self.meters.get(offset)
+        if meter is None:
+            meter = self.meters[offset] = EnergyMeter(self.options['cop_window'] * 60)
+        # a read-back after a command has not read the power registers again
+        if units is None:
+            meter.update(snapshot.time, v)
+
+        def dev(u, nValue, sValue, kind=None, number=None):
+            self.update_device(offset + u, nValue, sValue, kind, number)
+
+        def upd(u, value, kind=None):
+            dev(u, 0, value, kind, value)
+
+        if v['unit_state'] == 0:
+            dev(1, 0, '0')
+        else:
+            dev(1, 1, (v['operation_mode'] + 1) * 10)
+
+        upd(2, v['water_in_temp'], 'temperature')
+        upd(3, v['water_out_temp'], 'temperature')
+        upd(4, v['ambient_temp'], 'temperature')
+        upd(5, v['boiler_temp'], 'temperature')
+        upd(6, v['suction_gas_temp'], 'temperature')
+        upd(7, v['evap_temp'], 'temperature')
+        upd(8, v['internal_temp'], 'temperature')
+        upd(9, v['discharge_temp'], 'temperature')
+        upd(10, v['low_press_conv_temp'], 'temperature')
+
+        dev(11, int(v['hot_water_sp']), v['hot_water_sp'])
+        dev(12, int(v['heating_sp']), v['heating_sp'])
+
+        upd(13, v['fan1'])
+        upd(14, v['fan2'])
+        dev(15, int(v['cop']), v['cop'])
+        upd(16, v['water_pump_speed'])
+        dev(17, int(v['three_way']), "")
+        dev(18, int(v['elec_boiler']), "")
+        upd(19, v['dc_bus'], 'voltage')
+        upd(20, v['comp_freq'])
+        upd(21, v['comp_current'], 'current')
+        dev(22, 0, f"{int(v['comp_power'])};{meter.compressor_wh:.0f}", 'power', v['comp_power'])
+        upd(23, v['low_press_val'])
+        dev(24, int(v['defrosting']), "")
+        dev(25, int(anti_freezing), "")
+        upd(26, v['mains_voltage'], 'voltage')
+        upd(27, v['cons_current'], 'current')
+        dev(28, 0, f"{int(v['cons_power'])};{meter.device_wh:.0f}", 'power', v['cons_power'])
+        upd(29, v['waterflow'])
+        dev(30, 1, (v['pump_target'] + 1) * 10)
+        dev(31, int(v['pump_cycle']), v['pump_cycle'])
+        dev(32, int(water_pump), "")
+        dev(33, int(v['chassis_heat']), "")
+        dev(34, int(v['crank_heat']), "")
+        dev(35, int(error_level), error_text)
+        dev(36, 1, freq_mode)
+        dev(37, 0, f"{meter.heat_w:.0f};{meter.heat_wh:.0f}", 'power', meter.heat_w)
+        cop = meter.cop.ratio()
+        if cop is not None:
+            upd(38, round(cop, 2))
+        scop = meter.scop.ratio()
+        if scop is not None:
+            upd(39, round(scop, 2))
+
+        return self.cache.cycle()
 
     def onCommand(self, Unit, Command, Level, Hue):
-        Domoticz.Log(f"Command for {Devices[Unit].Name if Unit in Devices else Unit} -> {Command} ({Level})")
+        self.log.info(f"Command for {Devices[Unit].Name if Unit in Devices else Unit} -> {Command} ({Level})")
+        if Unit == UNIT_STATS_DUMP:
+            self.write_stats()
+            return
         sValue = str(Level)
         nValue = int(Level)
+        index, base = divmod(Unit - 1, UNIT_STRIDE)
+        if self.worker is None or index >= len(self.pumps):
+            return
+        pump, writer = self.pumps[index], self.writers[index]
+        offset = index * UNIT_STRIDE
+
+        if pump.breaker.state != CLOSED:
+            self.log.error(f"PowerWorld command ignored: heat pump {pump.slave} not reachable")
+            return
 
-        if Unit == 1:
-            # main operation
-            unit_state_val = get_data_from_heatpump(Parameters, '3F')
-            unit_state_bit = get_bit_value(unit_state_val, 0)
-            # operation mode reg
-            if Level == 0:
-                # unit off -> clear bit 0
-                new_val = clear_bit(unit_state_val, 0)
-                write_data_to_heatpump(Parameters, '3F', new_val)
-            elif Level == 10:
-                # hot water
-                if unit_state_bit == 0:
-                    new_val = set_bit(unit_state_val, 0)
-                    write_data_to_heatpump(Parameters, '3F', new_val)
-                write_data_to_heatpump(Parameters, '43', 0)
-            elif Level == 20:
-                # heating
-                if unit_state_bit == 0:
-                    new_val = set_bit(unit_state_val, 0)
-                    write_data_to_heatpump(Parameters, '3F', new_val)
-                write_data_to_heatpump(Parameters, '43', 1)
-            elif Level == 30:
-                # cooling
-                if unit_state_bit == 0:
-                    new_val = set_bit(unit_state_val, 0)
-                    write_data_to_heatpump(Parameters, '3F', new_val)
-                write_data_to_heatpump(Parameters, '43', 2)
-            elif Level == 40:
-                # hot water + heating
-                if unit_state_bit == 0:
-                    new_val = set_bit(unit_state_val, 0)
-                    write_data_to_heatpump(Parameters, '3F', new_val)
-                write_data_to_heatpump(Parameters, '43', 3)
-            elif Level == 50:
-                # hot water + cooling
-                if unit_state_bit == 0:
-                    new_val = set_bit(unit_state_val, 0)
-                    write_data_to_heatpump(Parameters, '3F', new_val)
-                write_data_to_heatpump(Parameters, '43', 4)
-
-        elif Unit == 11:
-            # P03
-            write_data_to_heatpump(Parameters, 'BE', Level)
-        elif Unit == 12:
-            # P05
-            write_data_to_heatpump(Parameters, 'C0', Level)
-        elif Unit == 30:
-            # pump at target temp
-            if Level == 10:
-                write_data_to_heatpump(Parameters, '015B', 0)
-            elif Level == 20:
-                write_data_to_heatpump(Parameters, '015B', 1)
-            elif Level == 30:
-                write_data_to_heatpump(Parameters, '015B', 2)
-        elif Unit == 36:
-            # frequency mode
-            val40 = get_data_from_heatpump(Parameters, '0040')
-            val41 = get_data_from_heatpump(Parameters, '0041')
-            power_bit = get_bit_value(val40, 4)
-            silent_bit = get_bit_value(val40, 5)
-            holiday_bit = get_bit_value(val41, 1)
-
-            if Level == 10:
-                # smart = alles uit
-                if power_bit == 1:
-                    val40 = clear_bit(val40, 4)
-                if silent_bit == 1:
-                    val40 = clear_bit(val40, 5)
-                if holiday_bit == 1:
-                    val41 = clear_bit(val41, 1)
-            elif Level == 20:
-                # powerful
-                if power_bit == 0:
-                    val40 = set_bit(val40, 4)
-                if silent_bit == 1:
-                    val40 = clear_bit(val40, 5)
-                if holiday_bit == 1:
-                    val41 = clear_bit(val41, 1)
-            elif Level == 30:
-                # silent
-                if power_bit == 1:
-                    val40 = clear_bit(val40, 4)
-                if silent_bit == 0:
-                    val40 = set_bit(val40, 5)
-                if holiday_bit == 1:
-                    val41 = clear_bit(val41, 1)
-            elif Level == 40:
-                # holiday
-                if power_bit == 1:
-                    val40 = clear_bit(val40, 4)
-                if silent_bit == 1:
-                    val40 = clear_bit(val40, 5)
-                if holiday_bit == 0:
-                    val41 = set_bit(val41, 1)
-
-            write_data_to_heatpump(Parameters, '0040', val40)
-            write_data_to_heatpump(Parameters, '0041', val41)
+        # the bus is owned by the poll worker, queue the writes there
+        writes = command_writes(base + 1, Level)
+        if writes:
+            # read back what the command touched, plus the registers that feed the same devices
+            addresses, units = affected(self.registers, {w.address for w in writes})
+            readback = plan_reads(addresses, self.options['gap'], self.options['max_block'], self.readable)
+            units = {offset + unit for unit in units}
+
+            def job(conn):
+                try:
+                    writer.execute(conn, pump.slave, writes, pump.scheduler)
+                finally:
+                    self.worker.refresh(pump, readback, units)
+
+            self.awaiting = self.worker.submit(pump, job)
+            self.awaiting_since = time.monotonic()
+            # pick up the read-back within a second instead of on the next regular heartbeat
+            Domoticz.Heartbeat(FAST_HEARTBEAT)
 
         if Unit in Devices:
             Devices[Unit].Update(nValue=nValue, sValue=sValue)
             Devices[Unit].Refresh()
+            # the device now shows the requested value, publish the next read value regardless
+            self.cache.forget(Unit)
 
 
 # ---------- helper functions ----------
 
-def get_data_from_heatpump(params, device_address_hex):
-    """
-    Read single register. device_address_hex: e.g. '3F'
-    Returns int
-    """
-    host = params["Address"]
-    port = int(params["Port"])
-    devid = params["Mode1"].zfill(2)
-    req_hex = devid + '03' + device_address_hex.zfill(4) + '0001'
-    req = binascii.unhexlify(req_hex)
-    req_crc = add_crc(req)
-
-    for attempt in range(MAX_RETRIES):
-        try:
-            with socket.create_connection((host, port), timeout=SOCKET_TIMEOUT) as s:
-                s.send(req_crc)
-                resp = s.recv(32)
-            if not resp:
-                continue
-            if not check_crc(resp):
-                continue
-            bytecount = resp[2]
-            if bytecount == 1:
-                return resp[3]
-            elif bytecount == 2:
-                return (resp[3] << 8) + resp[4]
-        except OSError as e:
-            Domoticz.Log(f"Read single reg error: {e}")
-            time.sleep(0.1)
-    raise Exception("No valid response for single read")
-
-
-def get_data_range_from_heatpump(params, request_hex_str):
-    """
-    Read multiple registers.
-    request_hex_str: full hex string, already with dev ID, function, start, count
-    Returns bytes of the data payload (without mbap/crc)
-    """
-    host = params["Address"]
-    port = int(params["Port"])
-    req = binascii.unhexlify(request_hex_str)
-    req_crc = add_crc(req)
+def emit(level, text):
+    """Write a message of the plugin's Logger to the Domoticz log."""
+    if level >= ERROR:
+        Domoticz.Error(text)
+    else:
+        Domoticz.Log(text)
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            with socket.create_connection((host, port), timeout=SOCKET_TIMEOUT) as s:
-                s.send(req_crc)
-                resp = s.recv(512)
-            if not resp:
-                continue
-            if not check_crc(resp):
-                continue
-            # skip: id(1), func(1), bytecount(1)  -> data .. last 2 bytes = crc
-            bytecount = resp[2]
-            data = resp[3:3 + bytecount]
-            return data
-        except OSError as e:
-            Domoticz.Log(f"Read range error: {e}")
-            time.sleep(0.1)
-    raise Exception("No valid response for range read")
-
-
-def get_single_data(inputstring, startaddress, factor):
-    start = int(startaddress, 16) * 4
-    end = start + 4
-    out_hex = inputstring[start:end]
-    value = int(out_hex, 16)
-    if factor > 0:
-        value = round(value * factor, 1)
-    if value > 65280:
-        value = value - 65535
-    return value
-
-
-def write_data_to_heatpump(params, device_address_hex, value):
-    host = params["Address"]
-    port = int(params["Port"])
-    devid = params["Mode1"].zfill(2)
-    payload_hex = devid + '06' + str(device_address_hex).zfill(4) + hex(int(value))[2:].zfill(4)
-    payload = binascii.unhexlify(payload_hex)
-    payload_crc = add_crc(payload)
-    Domoticz.Log(f"Write: {payload_hex}")
 
+def parse_slaves(text):
+    """
+    Slave IDs from the "Device IDs" parameter, e.g. "1" or "1,2,3".
+    Raises ValueError for an invalid or too long list.
+    """
     try:
-        with socket.create_connection((host, port), timeout=SOCKET_TIMEOUT) as s:
-            s.send(payload_crc)
-            _ = s.recv(32)
-    except OSError as e:
-        Domoticz.Log(f"Write error: {e}")
-
+        slaves = [int(item) for item in text.replace(' ', '').split(',') if item]
+    except ValueError:
+        raise ValueError(f"invalid device IDs '{text}'") from None
+    if not slaves or len(set(slaves)) != len(slaves) or not all(1 <= slave <= 247 for slave in slaves):
+        raise ValueError(f"invalid device IDs '{text}'")
+    if len(slaves) > MAX_PUMPS:
+        raise ValueError(f"at most {MAX_PUMPS} heat pumps per gateway")
+    return slaves
 
-def get_bit_value(x, bit_number):
-    if x is None:
-        return 0
-    return (int(x) >> bit_number) & 0x1
 
-
-def set_bit(value, bit):
-    return int(value) | (1 << bit)
+def read_heatpump(conn, slave, plan, image):
+    """
+    Read the planned (start, count) register blocks of one heat pump into its
+    register image (raw words from address 0). Runs on the poll worker thread.
+    """
+    for (start, count), data in zip(plan, conn.read_blocks(slave, plan)):
+        image[start * 2:(start + count) * 2] = data
 
 
-def clear_bit(value, bit):
-    return int(value) & ~(1 << bit)
+def command_writes(Unit, Level):
+    """
+    Register changes for a device command, as a list of RegisterWrite.
+    Bit changes are applied to the current register value by the WriteEngine.
+    """
+    if Unit == 1:
+        # main operation
+        if Level == 0:
+            # unit off -> clear bit 0
+            return [RegisterWrite(0x3F, clear_mask=0x01)]
+        if Level in (10, 20, 30, 40, 50):
+            # unit on, then hot water / heating / cooling / hot water + heating / hot water + cooling
+            return [RegisterWrite(0x3F, set_mask=0x01), RegisterWrite(0x43, Level // 10 - 1)]
+    elif Unit == 11:
+        # P03
+        return [RegisterWrite(0xBE, Level)]
+    elif Unit == 12:
+        # P05
+        return [RegisterWrite(0xC0, Level)]
+    elif Unit == 30:
+        # pump at target temp
+        if Level in (10, 20, 30):
+            return [RegisterWrite(0x15B, Level // 10 - 1)]
+    elif Unit == 36:
+        # frequency mode: 0x40 bit 4 = powerful, bit 5 = silent, 0x41 bit 1 = holiday
+        if Level == 10:
+            # smart = alles uit
+            return [RegisterWrite(0x40, clear_mask=0x30), RegisterWrite(0x41, clear_mask=0x02)]
+        if Level == 20:
+            # powerful
+            return [RegisterWrite(0x40, set_mask=0x10, clear_mask=0x20), RegisterWrite(0x41, clear_mask=0x02)]
+        if Level == 30:
+            # silent
+            return [RegisterWrite(0x40, set_mask=0x20, clear_mask=0x10), RegisterWrite(0x41, clear_mask=0x02)]
+        if Level == 40:
+            # holiday
+            return [RegisterWrite(0x40, clear_mask=0x30), RegisterWrite(0x41, set_mask=0x02)]
+    return []
 
 
 def operation_mode_text(level):
@@ -565,103 +775,6 @@ def operation_mode_text(level):
     }.get(level, 'Unknown')
 
 
-def calculate_frequency_mode(inputstring):
-    out = 10
-    if get_bit_value(get_single_data(inputstring, '0040', 0), 4) == 1:
-        out = 20
-    if get_bit_value(get_single_data(inputstring, '0040', 0), 5) == 1:
-        out = 30
-    if get_bit_value(get_single_data(inputstring, '0041', 0), 1) == 1:
-        out = 40
-    return out
-
-
-def interpret_errors(f1, f2, f3, f4, f5, f6, f7):
-    level = 1
-    text = "None"
-
-    def bit(v, b):
-        return get_bit_value(v, b) == 1
-
-    if f1 != 0:
-        level = 4
-        if bit(f1, 0):
-            text = 'Er 14 Water tank temperature failure'
-        elif bit(f1, 1):
-            text = 'Er 21 Ambient temperature failure'
-        elif bit(f1, 2):
-            text = 'Er 16 Evaporator coil temperature failure'
-        elif bit(f1, 4):
-            text = 'Er 27 Water outlet temperature failure'
-        elif bit(f1, 5):
-            text = 'Er 05 High pressure fault'
-        elif bit(f1, 6):
-            text = 'Er 06 Low pressure fault'
-        else:
-            level, text = 3, 'Unknown error (1)'
-
-    if f2 != 0:
-        level = 4
-        if bit(f2, 0):
-            text = 'Er 03 Water flow fault'
-        elif bit(f2, 2):
-            text = 'Er 32 Heating outlet water temperature too high'
-        else:
-            level, text = 3, 'Unknown error (2)'
-
-    if f3 != 0:
-        if bit(f3, 1):
-            level, text = 4, 'Er 18 Exhaust gas temperature failure'
-
-    if f4 != 0:
-        level = 4
-        if bit(f4, 0):
-            text = 'Er 15 Water inlet temperature failure'
-        elif bit(f4, 1):
-            text = 'Er 12 Exhaust gas too high protection'
-        elif bit(f4, 5):
-            text = 'Er 23 Cooling outlet water overcooling'
-        elif bit(f4, 6):
-            text = 'Er 29 Suction gas temperature failure'
-        else:
-            level, text = 3, 'Unknown error (4)'
-
-    if f5 != 0:
-        level = 4
-        if bit(f5, 0):
-            text = 'Er 69 Pressure too low protection'
-        elif bit(f5, 2):
-            text = 'Er 33 Evaporator coil temperature too high'
-        elif bit(f5, 3):
-            text = 'Er 42 Cooling pipe temperature sensor fault'
-        elif bit(f5, 5):
-            text = 'Er 72 DC fan communication fault'
-        elif bit(f5, 7):
-            text = 'Er 67 Low pressure sensor fault'
-        else:
-            level, text = 3, 'Unknown error (5)'
-
-    if f6 != 0:
-        if bit(f6, 4):
-            level, text = 2, 'Secondary anti-freezing'
-        elif bit(f6, 5):
-            level, text = 2, 'Level 1 anti-freezing'
-        else:
-            level, text = 3, 'Unknown error (6)'
-
-    if f7 != 0:
-        level = 4
-        if bit(f7, 4):
-            text = 'Er 10 communication fault with frequency module'
-        elif bit(f7, 5):
-            text = 'Er 66 DC fan 2 fault'
-        elif bit(f7, 6):
-            text = 'Er 64 DC fan 1 fault'
-        else:
-            level, text = 3, 'Unknown error (7)'
-
-    return level, text
-
 global _plugin
 _plugin = BasePlugin()
 
@@ -681,6 +794,11 @@ def onHeartbeat():
     _plugin.onHeartbeat()
 
 
+def onDeviceModified(Unit):
+    global _plugin
+    _plugin.onDeviceModified(Unit)
+
+
 def onCommand(Unit, Command, Level, Hue):
     global _plugin
     _plugin.onCommand(Unit, Command, Level, Hue)
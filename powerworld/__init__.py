@@ -0,0 +1,6 @@
+"""
+Support code for the PowerWorld heat pump Domoticz plugin.
+
+Everything in this package is independent of the Domoticz runtime so it can
+be reused by the plugin itself and by command line tools.
+"""
@@ -0,0 +1,232 @@
+"""
+Bulk analysis of recorded poll cycles with NumPy.
+
+Only used by tools/analyze.py; the plugin itself does not import this module
+and does not need NumPy. Captures are turned into one row per poll cycle
+(time, slave and the raw words the register table refers to) by viewing the
+rebuilt register images through a structured dtype with np.frombuffer, so
+no register is converted one value at a time. Scaling, signedness and bit
+extraction are then applied per column, and per-day figures are computed
+with grouped sums (np.bincount) and reductions over the whole array.
+"""
+
+import numpy as np
+
+from .capture import poll_images, read_capture
+from .registers import REGISTERS, register_space
+
+
+FAULT_ADDRESSES = tuple(sorted({reg.address for reg in REGISTERS if reg.name.startswith('fault_')}))
+
+DAILY = np.dtype([
+    ('day', 'datetime64[D]'),
+    ('slave', 'u1'),
+    ('samples', 'u4'),
+    ('running_h', 'f4'),         # hours with the compressor running
+    ('ambient_mean', 'f4'),
+    ('ambient_min', 'f4'),
+    ('ambient_max', 'f4'),
+    ('cop_mean', 'f4'),          # while running
+    ('comp_freq_mean', 'f4'),    # while running
+    ('comp_freq_max', 'u2'),
+    ('defrosts', 'u4'),          # defrost cycles started
+    ('fault_h', 'f4'),           # hours with any fault bit set
+    ('energy_kwh', 'f4'),        # consumed power of the device, integrated
+])
+
+
+def word_field(address):
+    return f'w{address:04X}'
+
+
+def _signedness(registers):
+    signed = {}
+    for reg in registers:
+        signed.setdefault(reg.address, reg.signed)
+    return signed
+
+
+def image_dtype(registers=REGISTERS, space=None):
+    """
+    Structured dtype over a raw image of space registers (default:
+    register_space(registers)), with one big-endian field per referenced
+    word at its offset.
+    """
+    signed = _signedness(registers)
+    addresses = sorted(signed)
+    return np.dtype({
+        'names': [word_field(a) for a in addresses],
+        'formats': ['>i2' if signed[a] else '>u2' for a in addresses],
+        'offsets': [a * 2 for a in addresses],
+        'itemsize': (space or register_space(registers)) * 2,
+    })
+
+
+def sample_dtype(registers=REGISTERS):
+    """Compact native-endian row: time, slave and the referenced words only."""
+    signed = _signedness(registers)
+    return np.dtype([('time', 'f8'), ('slave', 'u1')]
+                    + [(word_field(a), 'i2' if signed[a] else 'u2') for a in sorted(signed)])
+
+
+def load_captures(paths, registers=REGISTERS, chunk=10000):
+    """Samples (one row per poll cycle, ordered by time) from capture files, oldest file first."""
+    raw_dtype = image_dtype(registers)
+    dtype = sample_dtype(registers)
+    words = raw_dtype.names
+    parts = []
+    times, slaves, images = [], [], []
+
+    def flush():
+        raw = np.frombuffer(b''.join(images), dtype=raw_dtype)
+        part = np.empty(len(raw), dtype)
+        part['time'] = times
+        part['slave'] = slaves
+        for name in words:
+            part[name] = raw[name]
+        parts.append(part)
+        del times[:], slaves[:], images[:]
+
+    records = (record for path in paths for record in read_capture(path))
+    for slave, t, image in poll_images(records, raw_dtype.itemsize):
+        times.append(t)
+        slaves.append(slave)
+        images.append(image)
+        if len(images) == chunk:
+            flush()
+    if images:
+        flush()
+    samples = np.concatenate(parts) if parts else np.empty(0, dtype)
+    return samples[np.argsort(samples['time'], kind='stable')]
+
+
+def decode(samples, registers=REGISTERS):
+    """Register values as arrays, with the scaling and bit extraction of Decoder.decode."""
+    values = {}
+    for reg in registers:
+        words = samples[word_field(reg.address)]
+        if reg.bit is not None:
+            values[reg.name] = ((words >> reg.bit) & 1).astype(np.uint8)
+        elif reg.scale != 1:
+            values[reg.name] = words * np.float32(reg.scale)
+        else:
+            values[reg.name] = words
+    return values
+
+
+def slave_order(samples):
+    """
+    Indices that sort samples by slave, then time, and a mask over that
+    order that is True where the next sample belongs to the same slave.
+    """
+    order = np.lexsort((samples['time'], samples['slave']))
+    slaves = samples['slave'][order]
+    same = np.zeros(len(order), bool)
+    same[:-1] = slaves[:-1] == slaves[1:]
+    return order, same
+
+
+def intervals(samples, max_gap=120.0):
+    """
+    Seconds each sample stands for: the time to the next sample of the same
+    slave, or 0 across a gap longer than max_gap (plugin stopped, heat pump
+    not answering) and for the last sample.
+    """
+    order, same = slave_order(samples)
+    t = samples['time'][order]
+    dt = np.zeros(len(t))
+    dt[:-1] = np.diff(t)
+    dt[~same | (dt > max_gap)] = 0.0
+    out = np.empty_like(dt)
+    out[order] = dt
+    return out
+
+
+def rising_edges(samples, bits):
+    """True for samples where bits goes from 0 to 1 since the previous sample of the same slave."""
+    order, same = slave_order(samples)
+    b = bits[order]
+    edge = np.zeros(len(b), bool)
+    edge[1:] = same[:-1] & (b[:-1] == 0) & (b[1:] == 1)
+    out = np.empty_like(edge)
+    out[order] = edge
+    return out
+
+
+def daily(samples, values=None, utc_offset=0.0, max_gap=120.0):
+    """Per-day, per-slave aggregates as an array of DAILY rows; utc_offset in seconds."""
+    if values is None:
+        values = decode(samples)
+    if not len(samples):
+        return np.zeros(0, DAILY)
+    days = np.floor((samples['time'] + utc_offset) / 86400).astype(np.int64)
+    keys, group = np.unique(days * 256 + samples['slave'], return_inverse=True)
+    n = len(keys)
+    group = group.ravel()
+    count = np.bincount(group, minlength=n)
+    order = np.argsort(group, kind='stable')
+    starts = np.searchsorted(group[order], np.arange(n))
+
+    def total(x):
+        return np.bincount(group, weights=x, minlength=n)
+
+    def mean(x, where):
+        weight = total(where)
+        return np.divide(total(np.where(where, x, 0)), weight, out=np.full(n, np.nan), where=weight > 0)
+
+    dt = intervals(samples, max_gap)
+    running = values['comp_freq'] > 0
+    faults = np.zeros(len(samples), bool)
+    for address in FAULT_ADDRESSES:
+        faults |= samples[word_field(address)] != 0
+
+    rows = np.zeros(n, DAILY)
+    rows['day'] = (keys // 256).astype('datetime64[D]')
+    rows['slave'] = keys % 256
+    rows['samples'] = count
+    rows['running_h'] = total(dt * running) / 3600
+    ambient = values['ambient_temp']
+    rows['ambient_mean'] = total(ambient) / count
+    rows['ambient_min'] = np.minimum.reduceat(ambient[order], starts)
+    rows['ambient_max'] = np.maximum.reduceat(ambient[order], starts)
+    rows['cop_mean'] = mean(values['cop'], running)
+    rows['comp_freq_mean'] = mean(values['comp_freq'], running)
+    rows['comp_freq_max'] = np.maximum.reduceat(values['comp_freq'][order], starts)
+    rows['defrosts'] = total(rising_edges(samples, values['defrosting']))
+    rows['fault_h'] = total(dt * faults) / 3600
+    rows['energy_kwh'] = total(dt * values['cons_power']) / 3.6e6
+    return rows
+
+
+def cop_by_ambient(values, width=2.0):
+    """Mean COP while running per ambient temperature band of width C: (band start, samples, COP)."""
+    running = values['comp_freq'] > 0
+    bands = np.floor(values['ambient_temp'][running] / width).astype(np.int64)
+    keys, group, count = np.unique(bands, return_inverse=True, return_counts=True)
+    cop = np.bincount(group.ravel(), weights=values['cop'][running], minlength=len(keys)) / np.maximum(count, 1)
+    return keys * width, count, cop
+
+
+def freq_distribution(values, width=10):
+    """Samples per compressor frequency band of width Hz while running: (band start, samples)."""
+    freq = values['comp_freq']
+    count = np.bincount(freq[freq > 0] // width)
+    bands = np.nonzero(count)[0]
+    return bands * width, count[bands]
+
+
+def fault_changes(samples):
+    """
+    Every change of a fault word, as (time, slave, address, old, new) rows
+    ordered by time: the fault timeline of each heat pump.
+    """
+    order, same = slave_order(samples)
+    rows = []
+    for address in FAULT_ADDRESSES:
+        words = samples[word_field(address)][order]
+        changed = np.nonzero(same[:-1] & (words[:-1] != words[1:]))[0]
+        for i in changed:
+            row = samples[order[i + 1]]
+            rows.append((float(row['time']), int(row['slave']), address, int(words[i]), int(words[i + 1])))
+    rows.sort()
+    return rows
@@ -0,0 +1,61 @@
+"""
+Circuit breaker for an unreachable heat pump or gateway.
+"""
+
+import random
+
+
+CLOSED = 'closed'            # polling normally
+OPEN = 'open'                # not answering, waiting for the next probe
+HALF_OPEN = 'half-open'      # probe in progress
+
+
+class CircuitBreaker:
+    """
+    Tracks whether the heat pump answers.
+
+    After threshold failed polls in a row the breaker opens: no polls or
+    writes are sent until retry_at, when a single probe is allowed
+    (half-open). A successful probe closes the breaker again, a failed one
+    reopens it with twice the delay, up to max_delay. Each delay is spread by
+    +/- jitter so several plugins do not retry in lockstep.
+    """
+
+    def __init__(self, delay=5.0, max_delay=300.0, jitter=0.2, threshold=1, rng=None):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.threshold = threshold
+        self.random = rng or random.Random()
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0.0
+
+    def success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+
+    def failure(self, now):
+        """
+        Record a failed poll or probe.
+        Returns the delay until the next probe once the breaker is open, else None.
+        """
+        self.failures += 1
+        if self.state == CLOSED and self.failures < self.threshold:
+            return None
+        # the exponent is capped: a link that stays dead for days must not overflow the float
+        delay = min(self.delay * 2 ** min(self.trips, 32), self.max_delay)
+        delay *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        self.trips += 1
+        self.state = OPEN
+        self.retry_at = now + delay
+        return delay
+
+    def probe_due(self, now):
+        """True (and half-open) when the breaker is open and the next probe may be sent."""
+        if self.state == OPEN and now >= self.retry_at:
+            self.state = HALF_OPEN
+            return True
+        return False
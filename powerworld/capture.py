@@ -0,0 +1,194 @@
+"""
+Binary capture of Modbus traffic, to reproduce field issues and to
+benchmark the decode and publish path offline (tools/replay.py).
+
+A capture file starts with MAGIC and holds one record per answered
+request:
+
+    <d time> <B slave> <B request length> <B response length> request response
+
+with the request and response as PDUs (function code onwards), so RTU,
+Modbus TCP and serial captures look the same. A record with an empty
+request and response marks the end of a complete poll cycle of slave;
+reads outside a poll (read-back after a command, read-modify-write) are
+recorded as well but end no cycle. Files of format 1 have no markers.
+"""
+
+import os
+import struct
+import time
+
+
+MAGIC = b'PWCAP\x00\x02\n'
+MAGIC_V1 = b'PWCAP\x00\x01\n'      # without cycle markers
+RECORD = struct.Struct('<dBBB')
+
+
+class CaptureWriter:
+    """
+    Appends records to path through a write buffer, flushed at least every
+    flush_interval seconds. When the file reaches max_bytes it is renamed
+    to path + '.1' (replacing the previous one) and a new file is started,
+    so a capture never takes more than twice max_bytes on disk. An existing
+    file is continued after its last complete record.
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, flush_interval=10.0, buffering=64 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.buffering = buffering
+        self.records = 0
+        self.rotations = 0
+        self._file = None
+        self._size = 0
+        self._flushed = 0.0
+        self._open()
+
+    def _open(self):
+        if os.path.exists(self.path) and self._current_format():
+            # a record cut short (plugin crashed while writing) would shift everything appended after it
+            end = whole_length(self.path)
+            if end < os.path.getsize(self.path):
+                os.truncate(self.path, end)
+        self._file = open(self.path, 'ab', buffering=self.buffering)
+        self._size = self._file.tell()
+        if self._size and not self._current_format():
+            # left by an older version: keep it as .1 rather than mixing formats
+            self.rotate()
+            return
+        if self._size == 0:
+            self._file.write(MAGIC)
+            self._size = len(MAGIC)
+        self._flushed = time.monotonic()
+
+    def record(self, slave, pdus, responses, t=None):
+        """Append one record per (request, response) pair."""
+        t = time.time() if t is None else t
+        for pdu, response in zip(pdus, responses):
+            record = RECORD.pack(t, slave, len(pdu), len(response)) + pdu + response
+            self._file.write(record)
+            self._size += len(record)
+            self.records += 1
+        if self._size >= self.max_bytes:
+            self.rotate()
+        elif time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def mark_cycle(self, slave, t=None):
+        """Mark the end of a complete poll cycle of slave."""
+        self.record(slave, [b''], [b''], t)
+
+    def _current_format(self):
+        with open(self.path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+
+    def flush(self):
+        self._file.flush()
+        self._flushed = time.monotonic()
+
+    def rotate(self):
+        self._file.close()
+        os.replace(self.path, self.path + '.1')
+        self.rotations += 1
+        self._open()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_capture(path):
+    """
+    Yield (time, slave, request, response) from a capture file, with an
+    empty request and response for a cycle marker. A record cut short at
+    the end (the plugin was stopped while writing) is ignored. Raises
+    ValueError if path is not a capture file.
+
+    Format 1 files have no markers; they are inferred from the addresses
+    (see legacy_markers).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data.startswith(MAGIC_V1):
+        yield from legacy_markers(_records(data))
+    elif data.startswith(MAGIC):
+        yield from _records(data)
+    else:
+        raise ValueError(f"{path} is not a PowerWorld capture")
+
+
+def _records(data):
+    view = memoryview(data)
+    pos = len(MAGIC)
+    while pos + RECORD.size <= len(data):
+        t, slave, request_length, response_length = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        end = pos + request_length + response_length
+        if end > len(data):
+            break
+        yield t, slave, bytes(view[pos:pos + request_length]), bytes(view[pos + request_length:end])
+        pos = end
+
+
+def whole_length(path):
+    """Length of the capture file at path up to the end of its last complete record."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    pos = len(MAGIC)
+    while pos + RECORD.size <= len(data):
+        _, _, request_length, response_length = RECORD.unpack_from(data, pos)
+        end = pos + RECORD.size + request_length + response_length
+        if end > len(data):
+            break
+        pos = end
+    return pos
+
+
+def is_read(request, response):
+    return len(request) == 5 and request[0] == 3 and not response[0] & 0x80
+
+
+def legacy_markers(records):
+    """
+    records of a format 1 capture with the cycle markers it lacks: a poll
+    reads its blocks in ascending address order, so a read that does not
+    start above the previous one of the same slave begins the next cycle.
+    A read-back in the middle of a poll splits it; format 2 does not guess.
+    """
+    last = {}
+    for t, slave, request, response in records:
+        if is_read(request, response):
+            start = struct.unpack_from('>H', request, 1)[0]
+            if slave in last and start <= last[slave][0]:
+                yield last[slave][1], slave, b'', b''
+            last[slave] = (start, t)
+        yield t, slave, request, response
+    for slave, (start, t) in last.items():
+        yield t, slave, b'', b''
+
+
+def poll_images(records, size):
+    """
+    Rebuild the register image at each cycle marker in records, yielding
+    (slave, time, image) with image as bytes of size.
+
+    Every read response goes into the image of its slave, so registers not
+    read in a cycle keep their last value, as in the plugin. Writes,
+    exception responses and reads that do not fit in size bytes (recorded
+    with a register map larger than the one size was taken from) are
+    skipped; reads after the last marker of a slave (a cycle cut short) are
+    not yielded.
+    """
+    images = {}
+    for t, slave, request, response in records:
+        image = images.get(slave)
+        if image is None:
+            image = images[slave] = bytearray(size)
+        if not request:
+            yield slave, t, bytes(image)
+        elif is_read(request, response):
+            start = struct.unpack_from('>H', request, 1)[0] * 2
+            if start + len(response) - 2 <= size:
+                image[start:start + len(response) - 2] = response[2:]
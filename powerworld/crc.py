@@ -0,0 +1,40 @@
+"""
+CRC-16/Modbus (polynomial 0xA001 reflected, initial value 0xFFFF), table
+driven, so the plugin needs no extra Python module for RTU framing.
+"""
+
+
+def _table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+TABLE = _table()
+
+
+def crc16(data, crc=0xFFFF):
+    """
+    CRC of data (bytes, bytearray or memoryview). Pass the result of a
+    previous call as crc to continue over more bytes, e.g. as a frame
+    arrives in pieces. Over a frame including its own CRC the result is 0.
+    """
+    table = TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def add_crc(frame):
+    """Return frame with its CRC appended, low byte first."""
+    crc = crc16(frame)
+    return bytes(frame) + bytes((crc & 0xFF, crc >> 8))
+
+
+def check_crc(frame):
+    """True if the last two bytes of frame are its correct CRC."""
+    return len(frame) > 2 and crc16(frame) == 0
@@ -0,0 +1,229 @@
+"""
+Read-only HTTP endpoint that serves the latest snapshots from memory, so
+other consumers (exporters, Node-RED) do not need their own connection to
+the gateway.
+
+    GET /                   all heat pumps, JSON
+    GET /pump/<slave>       one heat pump, JSON
+    GET /pump/<slave>.bin   its raw register image (big-endian words from address 0)
+
+and from the in-memory history (option history), e.g. to look at a fault
+or defrost after the fact; start, end and at are Unix times:
+
+    GET /pump/<slave>/history?start=&end=                 times of the stored images
+    GET /pump/<slave>/history?register=<name>&start=&end=  one register over time
+    GET /pump/<slave>.bin?at=<time>                        the image read at or before that time
+
+Every response carries an ETag that changes with each new snapshot (and
+with each plugin start); a request with a matching If-None-Match gets 304
+Not Modified.
+"""
+
+import http.server
+import json
+import os
+import socketserver
+import threading
+import time
+import urllib.parse
+import zlib
+
+from .registers import REGISTERS
+
+
+def pump_json(pump):
+    """JSON-ready view of one heat pump: the latest poll result and the last good values."""
+    latest, good = pump.latest, pump.last_good
+    return {
+        'slave': pump.slave,
+        'seq': latest.seq if latest else 0,
+        'error': latest.error if latest else None,
+        'time': good.time if good else None,
+        'values': good.values if good else None,
+    }
+
+
+def register_series(reg, history, start, end):
+    """Times and scaled values of register reg in history over [start, end)."""
+    times, words = history.series(reg.address, start, end, reg.signed)
+    if reg.bit is not None:
+        values = [(word >> reg.bit) & 1 for word in words]
+    elif reg.scale != 1:
+        digits = 2 if reg.scale < 0.1 else 1
+        values = [round(word * reg.scale, digits) for word in words]
+    else:
+        values = list(words)
+    return {'register': reg.name, 'times': list(times), 'values': values}
+
+
+class SnapshotHandler(http.server.BaseHTTPRequestHandler):
+    server_version = 'PowerWorld'
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path.rstrip('/')
+        self.query = urllib.parse.parse_qs(url.query)
+        pumps = self.server.pumps
+        if path in ('', '/pump'):
+            etag = self.server.etag('-'.join(f'{p.slave}.{p.latest.seq if p.latest else 0}' for p in pumps))
+            self.reply(etag, 'application/json', lambda: self.server.render_all(etag))
+            return
+        name = path[len('/pump/'):] if path.startswith('/pump/') else ''
+        history = name.endswith('/history')
+        binary = name.endswith('.bin')
+        pump = self.server.find(name[:-len('/history')] if history else name[:-4] if binary else name)
+        if pump is None:
+            self.send_error(404)
+            return
+        if history or (binary and 'at' in self.query):
+            self.send_history(pump, binary)
+            return
+        latest, good = pump.latest, pump.last_good
+        if binary:
+            if good is None:
+                self.send_error(503, "no register image yet")
+                return
+            etag = self.server.etag(f'{pump.slave}.{good.seq}.bin')
+            self.reply(etag, 'application/octet-stream', lambda: good.data)
+        else:
+            etag = self.server.etag(f'{pump.slave}.{latest.seq if latest else 0}')
+            self.reply(etag, 'application/json', lambda: self.server.render(pump, etag))
+
+    def time_arg(self, name):
+        values = self.query.get(name)
+        return float(values[0]) if values else None
+
+    def send_history(self, pump, binary):
+        history = pump.history
+        if history is None:
+            self.send_error(404, "no history kept (option history)")
+            return
+        try:
+            start, end, at = self.time_arg('start'), self.time_arg('end'), self.time_arg('at')
+        except ValueError:
+            self.send_error(400, "start, end and at must be Unix times")
+            return
+        # the stored images only change with the next one appended
+        etag = self.server.etag(f'{pump.slave}.h{history.count}.{zlib.crc32(self.path.encode()):x}')
+        if binary:
+            found = history.image_at(at)
+            if found is None:
+                self.send_error(404, "no image at or before that time")
+                return
+            self.reply(etag, 'application/octet-stream', lambda: found[1])
+            return
+        names = self.query.get('register')
+        if names is None:
+            self.reply(etag, 'application/json', lambda: json.dumps(
+                dict(history.as_dict(), times=list(history.times_between(start, end)))).encode())
+            return
+        reg = self.server.registers.get(names[0])
+        if reg is None:
+            self.send_error(404, f"unknown register {names[0]}")
+            return
+        self.reply(etag, 'application/json', lambda: json.dumps(register_series(reg, history, start, end)).encode())
+
+    def reply(self, etag, content_type, body):
+        self.server.requests += 1
+        tags = [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]
+        if etag in tags or '*' in tags:
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        data = body()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SnapshotServerMixin:
+    """
+    Serves the snapshots of pumps; rendered JSON is kept per ETag, so any
+    number of readers of the same snapshot cost one json.dumps.
+    """
+
+    daemon_threads = True
+
+    def setup_snapshots(self, pumps, registers):
+        self.pumps = list(pumps)
+        self.registers = {reg.name: reg for reg in registers}
+        self.requests = 0
+        self.not_modified = 0
+        self._rendered = {}
+        self._thread = None
+        self._epoch = f'{int(time.time()):x}'
+
+    def etag(self, version):
+        return f'"{self._epoch}-{version}"'
+
+    def find(self, name):
+        for pump in self.pumps:
+            if name == str(pump.slave):
+                return pump
+        return None
+
+    def _cached(self, key, etag, make):
+        cached = self._rendered.get(key)
+        if cached is None or cached[0] != etag:
+            cached = self._rendered[key] = (etag, json.dumps(make()).encode())
+        return cached[1]
+
+    def render(self, pump, etag):
+        return self._cached(pump.slave, etag, lambda: pump_json(pump))
+
+    def render_all(self, etag):
+        return self._cached(None, etag, lambda: [pump_json(pump) for pump in self.pumps])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='PowerWorld endpoint', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join(5)
+        self.server_close()
+
+    def as_dict(self):
+        return {'requests': self.requests, 'not_modified': self.not_modified}
+
+
+class SnapshotServer(SnapshotServerMixin, http.server.ThreadingHTTPServer):
+    """The endpoint on a TCP port."""
+
+    def __init__(self, pumps, host='127.0.0.1', port=8470, registers=REGISTERS):
+        super().__init__((host, port), SnapshotHandler)
+        self.setup_snapshots(pumps, registers)
+
+
+class UnixSnapshotServer(SnapshotServerMixin, socketserver.ThreadingUnixStreamServer):
+    """The endpoint on a Unix socket, e.g. for consumers on the same host only."""
+
+    def __init__(self, pumps, path, registers=REGISTERS):
+        if os.path.exists(path):
+            os.unlink(path)     # left over from a plugin that did not stop cleanly
+        super().__init__(path, SnapshotHandler)
+        self.setup_snapshots(pumps, registers)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def create_server(pumps, bind, port, registers=REGISTERS):
+    """A UnixSnapshotServer if bind is a path, else a SnapshotServer on bind:port."""
+    if bind.startswith('/'):
+        return UnixSnapshotServer(pumps, bind, registers)
+    return SnapshotServer(pumps, bind, port, registers)
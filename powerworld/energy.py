@@ -0,0 +1,124 @@
+"""
+Energy counters and rolling COP, updated incrementally from each poll.
+"""
+
+import array
+
+
+WATER_HEAT = 1.163          # kWh per m3 of water and K (= W per l/h and K)
+
+
+def thermal_power(values):
+    """Heat output in W from the water flow (m3/h) and outlet minus inlet temperature; 0 when negative (defrost)."""
+    return max(values['waterflow'] * WATER_HEAT * (values['water_out_temp'] - values['water_in_temp']) * 1000, 0.0)
+
+
+class Rolling:
+    """
+    Heat and electrical energy over the last n buckets of seconds each,
+    for a COP over a sliding window. Buckets are two preallocated arrays;
+    the running sums are corrected when a bucket falls out of the window,
+    so adding a sample costs the same however long the window is.
+    """
+
+    def __init__(self, n, seconds):
+        self.n = n
+        self.seconds = seconds
+        self.heat = array.array('d', [0.0]) * n
+        self.elec = array.array('d', [0.0]) * n
+        self.heat_sum = 0.0
+        self.elec_sum = 0.0
+        self.bucket = None          # absolute number of the current bucket
+
+    def add(self, t, heat, elec):
+        bucket = int(t // self.seconds)
+        if self.bucket is None:
+            self.bucket = bucket
+        elif bucket > self.bucket:
+            for b in range(self.bucket + 1, min(bucket, self.bucket + self.n) + 1):
+                i = b % self.n
+                self.heat_sum -= self.heat[i]
+                self.elec_sum -= self.elec[i]
+                self.heat[i] = self.elec[i] = 0.0
+            self.bucket = bucket
+        elif bucket < self.bucket - self.n + 1:
+            return                  # older than the window (clock set back)
+        i = bucket % self.n
+        self.heat[i] += heat
+        self.elec[i] += elec
+        self.heat_sum += heat
+        self.elec_sum += elec
+
+    def ratio(self, min_elec=1.0):
+        """Heat over electrical energy in the window, or None below min_elec Wh of input."""
+        if self.elec_sum < min_elec:
+            return None
+        return max(self.heat_sum, 0.0) / self.elec_sum
+
+    def state(self):
+        return {'bucket': self.bucket, 'heat': list(self.heat), 'elec': list(self.elec)}
+
+    def restore(self, state):
+        if len(state['heat']) != self.n or len(state['elec']) != self.n:
+            return                  # window changed, start over
+        self.bucket = state['bucket']
+        self.heat = array.array('d', state['heat'])
+        self.elec = array.array('d', state['elec'])
+        self.heat_sum = sum(self.heat)
+        self.elec_sum = sum(self.elec)
+
+
+class EnergyMeter:
+    """
+    Wh counters of the compressor power, the consumed power of the device and
+    the heat output, integrated over the time between polls (the power of a
+    poll counts until the next one), plus the COP over cop_window seconds and
+    the seasonal COP over season_days, both from the integrated energy.
+
+    A gap longer than max_gap between two polls (plugin stopped, heat pump
+    not answering) is not counted. state() and restore() carry the counters
+    over a restart.
+    """
+
+    def __init__(self, cop_window=3600, season_days=365, max_gap=300.0):
+        self.max_gap = max_gap
+        self.compressor_wh = 0.0
+        self.device_wh = 0.0
+        self.heat_wh = 0.0
+        self.heat_w = 0.0
+        self.cop = Rolling(max(int(cop_window // 60), 1), 60)
+        self.scop = Rolling(season_days, 86400)
+        self._last = None           # (time, compressor W, device W, heat W)
+
+    def update(self, t, values):
+        heat = thermal_power(values)
+        if self._last is not None:
+            last, compressor, device, heat_w = self._last
+            dt = t - last
+            if 0 < dt <= self.max_gap:
+                hours = dt / 3600
+                self.compressor_wh += compressor * hours
+                self.device_wh += device * hours
+                self.heat_wh += heat_w * hours
+                self.cop.add(t, heat_w * hours, device * hours)
+                self.scop.add(t, heat_w * hours, device * hours)
+        self._last = (t, values['comp_power'], values['cons_power'], heat)
+        self.heat_w = heat
+
+    def state(self):
+        return {
+            'compressor_wh': self.compressor_wh,
+            'device_wh': self.device_wh,
+            'heat_wh': self.heat_wh,
+            'cop': self.cop.state(),
+            'scop': self.scop.state(),
+        }
+
+    def restore(self, state):
+        self.compressor_wh = state.get('compressor_wh', 0.0)
+        self.device_wh = state.get('device_wh', 0.0)
+        self.heat_wh = state.get('heat_wh', 0.0)
+        if 'cop' in state:
+            self.cop.restore(state['cop'])
+        if 'scop' in state:
+            self.scop.restore(state['scop'])
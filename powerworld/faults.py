@@ -0,0 +1,129 @@
+"""
+Fault codes of the seven fault registers (0x07-0x0D) and the index that
+reports every active one.
+"""
+
+import collections
+
+from .registers import REGISTERS
+
+
+Fault = collections.namedtuple('Fault', 'address bit code severity text')
+Fault.__doc__ = """
+One fault bit. severity is the level of the Domoticz alert device:
+1 = none, 2 = warning, 3 = unknown error, 4 = error. bit is None for the
+"unknown error" entry of a register, reported when a bit without an entry
+is set.
+"""
+
+FAULTS = (
+    Fault(0x07, 0, 'Er 14', 4, 'Water tank temperature failure'),
+    Fault(0x07, 1, 'Er 21', 4, 'Ambient temperature failure'),
+    Fault(0x07, 2, 'Er 16', 4, 'Evaporator coil temperature failure'),
+    Fault(0x07, 4, 'Er 27', 4, 'Water outlet temperature failure'),
+    Fault(0x07, 5, 'Er 05', 4, 'High pressure fault'),
+    Fault(0x07, 6, 'Er 06', 4, 'Low pressure fault'),
+    Fault(0x07, None, '', 3, 'Unknown error (1)'),
+    Fault(0x08, 0, 'Er 03', 4, 'Water flow fault'),
+    Fault(0x08, 2, 'Er 32', 4, 'Heating outlet water temperature too high'),
+    Fault(0x08, None, '', 3, 'Unknown error (2)'),
+    Fault(0x09, 1, 'Er 18', 4, 'Exhaust gas temperature failure'),
+    Fault(0x0A, 0, 'Er 15', 4, 'Water inlet temperature failure'),
+    Fault(0x0A, 1, 'Er 12', 4, 'Exhaust gas too high protection'),
+    Fault(0x0A, 5, 'Er 23', 4, 'Cooling outlet water overcooling'),
+    Fault(0x0A, 6, 'Er 29', 4, 'Suction gas temperature failure'),
+    Fault(0x0A, None, '', 3, 'Unknown error (4)'),
+    Fault(0x0B, 0, 'Er 69', 4, 'Pressure too low protection'),
+    Fault(0x0B, 2, 'Er 33', 4, 'Evaporator coil temperature too high'),
+    Fault(0x0B, 3, 'Er 42', 4, 'Cooling pipe temperature sensor fault'),
+    Fault(0x0B, 5, 'Er 72', 4, 'DC fan communication fault'),
+    Fault(0x0B, 7, 'Er 67', 4, 'Low pressure sensor fault'),
+    Fault(0x0B, None, '', 3, 'Unknown error (5)'),
+    Fault(0x0C, 4, '', 2, 'Secondary anti-freezing'),
+    Fault(0x0C, 5, '', 2, 'Level 1 anti-freezing'),
+    Fault(0x0C, None, '', 3, 'Unknown error (6)'),
+    Fault(0x0D, 4, 'Er 10', 4, 'communication fault with frequency module'),
+    Fault(0x0D, 5, 'Er 66', 4, 'DC fan 2 fault'),
+    Fault(0x0D, 6, 'Er 64', 4, 'DC fan 1 fault'),
+    Fault(0x0D, None, '', 3, 'Unknown error (7)'),
+)
+
+# the faults that switch on the anti-freezing device (Unit 25)
+ANTI_FREEZING = frozenset((0x0C, bit) for bit in (4, 5))
+
+# value names of the fault registers, in address order
+FAULT_VALUES = tuple(reg.name for reg in sorted(REGISTERS, key=lambda reg: reg.address)
+                     if reg.name.startswith('fault_'))
+
+
+ActiveFaults = collections.namedtuple('ActiveFaults', 'level text faults anti_freezing')
+ActiveFaults.__doc__ = """
+level is the highest severity of the active faults (1 if there are none),
+text their descriptions, most severe first, and faults the Fault entries.
+"""
+
+NO_FAULTS = ActiveFaults(1, 'None', (), False)
+
+
+def fault_label(fault):
+    return f'{fault.code} {fault.text}' if fault.code else fault.text
+
+
+class FaultIndex:
+    """
+    Decodes the fault words with a lookup table per register, indexed by
+    bit and built once, so only the bits that are set are visited. The
+    result for the last words is kept, and a poll with unchanged fault
+    words (the normal case) returns it without decoding anything.
+
+    Use one index per heat pump.
+    """
+
+    def __init__(self, faults=FAULTS, names=FAULT_VALUES):
+        self.names = names
+        addresses = sorted({fault.address for fault in faults})
+        if len(addresses) != len(names):
+            raise ValueError("one fault register per value name expected")
+        self._bits = []
+        self._unknown = []
+        for address in addresses:
+            bits = [None] * 16
+            unknown = None
+            for fault in faults:
+                if fault.address != address:
+                    continue
+                if fault.bit is None:
+                    unknown = fault
+                else:
+                    bits[fault.bit] = fault
+            self._bits.append(tuple(bits))
+            self._unknown.append(unknown)
+        self._words = None
+        self._active = NO_FAULTS
+
+    def decode(self, values):
+        """ActiveFaults for the fault words in the decoded values of a poll."""
+        words = tuple(values[name] for name in self.names)
+        if words == self._words:
+            return self._active
+        active = []
+        for word, bits, unknown in zip(words, self._bits, self._unknown):
+            missing = False
+            while word:
+                low = word & -word
+                fault = bits[low.bit_length() - 1]
+                if fault is None:
+                    missing = True
+                else:
+                    active.append(fault)
+                word ^= low
+            if missing and unknown is not None:
+                active.append(unknown)
+        if active:
+            active.sort(key=lambda fault: -fault.severity)
+            self._active = ActiveFaults(active[0].severity, ', '.join(fault_label(f) for f in active), tuple(active),
+                                        any((f.address, f.bit) in ANTI_FREEZING for f in active))
+        else:
+            self._active = NO_FAULTS
+        self._words = words
+        return self._active
@@ -0,0 +1,118 @@
+"""
+Recent raw register images in a fixed-size ring buffer, for looking back at
+a fault or defrost after the fact.
+"""
+
+import array
+import sys
+import threading
+
+
+class History:
+    """
+    The last capacity register images of size bytes each, with their times.
+
+    All slots are allocated up front in one bytearray (images as read, big
+    endian words from address 0) and one array('d') of times, so memory use
+    is fixed at capacity * (size + 8) bytes however long the plugin runs;
+    once full, each new image overwrites the oldest. Times are expected in
+    ascending order (time.time() of each poll), which lets range queries
+    binary-search instead of scanning.
+
+    append() is called by the poll worker, the queries may run on any
+    thread.
+    """
+
+    def __init__(self, capacity, size):
+        if capacity < 1 or size < 2 or size % 2:
+            raise ValueError("history needs at least one slot of whole registers")
+        self.capacity = capacity
+        self.size = size
+        self.data = bytearray(capacity * size)
+        self.times = array.array('d', [0.0]) * capacity
+        self.count = 0              # images appended since start
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def nbytes(self):
+        return len(self.data) + self.times.itemsize * len(self.times)
+
+    def append(self, t, image):
+        """Store image (size bytes) read at time t."""
+        if len(image) != self.size:
+            raise ValueError(f"image of {len(image)} bytes, expected {self.size}")
+        with self._lock:
+            slot = self.count % self.capacity
+            self.data[slot * self.size:(slot + 1) * self.size] = image
+            self.times[slot] = t
+            self.count += 1
+
+    def _first(self):
+        return self.count % self.capacity if self.count > self.capacity else 0
+
+    def _bisect(self, t, right=False):
+        """Number of stored images (oldest first) with a time before t (or at t, if right)."""
+        first, lo, hi = self._first(), 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            stamp = self.times[(first + mid) % self.capacity]
+            if stamp < t or right and stamp == t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _slots(self, start, end):
+        first = self._first()
+        lo = 0 if start is None else self._bisect(start)
+        hi = len(self) if end is None else self._bisect(end)
+        return [(first + i) % self.capacity for i in range(lo, hi)]
+
+    def times_between(self, start=None, end=None):
+        """Times of the images read in [start, end), oldest first."""
+        with self._lock:
+            return array.array('d', (self.times[slot] for slot in self._slots(start, end)))
+
+    def series(self, address, start=None, end=None, signed=False):
+        """
+        (times, values) of one register over [start, end), as array('d') and
+        array('H') (array('h') if signed).
+        """
+        if not 0 <= address < self.size // 2:
+            raise IndexError(f"register 0x{address:04X} outside the history")
+        with self._lock:
+            slots = self._slots(start, end)
+            words = memoryview(self.data).cast('H')
+            times = array.array('d', (self.times[slot] for slot in slots))
+            stride = self.size // 2
+            values = array.array('H', (words[slot * stride + address] for slot in slots))
+            words.release()
+        if sys.byteorder == 'little':
+            values.byteswap()
+        if signed:
+            values = array.array('h', values.tobytes())
+        return times, values
+
+    def image_at(self, t):
+        """(time, image) of the latest image read at or before t, or None."""
+        with self._lock:
+            i = self._bisect(t, right=True)
+            if i == 0:
+                return None
+            slot = (self._first() + i - 1) % self.capacity
+            return self.times[slot], bytes(self.data[slot * self.size:(slot + 1) * self.size])
+
+    def as_dict(self):
+        with self._lock:
+            first = self._first()
+            return {
+                'capacity': self.capacity,
+                'stored': len(self),
+                'bytes': self.nbytes,
+                'oldest': self.times[first] if self.count else None,
+                'newest': self.times[(self.count - 1) % self.capacity] if self.count else None,
+            }
+
@@ -0,0 +1,93 @@
+"""
+Plugin log with levels, lazy formatting, rate limiting of repeated
+messages and an in-memory ring of recent messages that can be dumped.
+"""
+
+import collections
+import time
+
+
+DEBUG = 10
+INFO = 20
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', ERROR: 'ERROR'}
+
+
+class Changes(dict):
+    """name -> value pairs, formatted as "name=value ..." only when a message is written out."""
+
+    def __str__(self):
+        return ' '.join(f'{name}={value}' for name, value in self.items()) or 'no changes'
+
+
+def changed_values(previous, current):
+    """Changes holding the entries of current that differ from previous (all of them if previous is None)."""
+    if previous is None:
+        return Changes(current)
+    return Changes((name, value) for name, value in current.items() if previous.get(name) != value)
+
+
+class Logger:
+    """
+    Messages are written with emit(level, text) when their level is at least
+    self.level; the text is only formatted (msg % args, like the logging
+    module) at that point. Every message, whatever the level, is also kept
+    unformatted in a ring of the last ring_size messages, so a debug trace
+    of the recent past is available on demand (dump()) without Debug being
+    on. The args must not be changed after the call.
+
+    A message logged with a key is written at most once per repeat seconds
+    per key; the next one written reports how many were held back.
+    """
+
+    def __init__(self, emit, level=INFO, ring_size=1000, repeat=300.0):
+        self.emit = emit
+        self.level = level
+        self.repeat = repeat
+        self.ring = collections.deque(maxlen=ring_size)
+        self.suppressed = 0
+        self._limits = {}           # key -> [time written, messages held back since]
+
+    def log(self, level, msg, *args, key=None):
+        self.ring.append((time.time(), level, msg, args))
+        if level < self.level:
+            return
+        note = ''
+        if key is not None:
+            now = time.monotonic()
+            limit = self._limits.get(key)
+            if limit is not None and now - limit[0] < self.repeat:
+                limit[1] += 1
+                self.suppressed += 1
+                return
+            if limit is not None and limit[1]:
+                note = f" ({limit[1]} more in the last {now - limit[0]:.0f} s)"
+            self._limits[key] = [now, 0]
+        self.emit(level, (msg % args if args else msg) + note)
+
+    def debug(self, msg, *args, key=None):
+        self.log(DEBUG, msg, *args, key=key)
+
+    def info(self, msg, *args, key=None):
+        self.log(INFO, msg, *args, key=key)
+
+    def error(self, msg, *args, key=None):
+        self.log(ERROR, msg, *args, key=key)
+
+    def lines(self):
+        """The ring, oldest first, as formatted lines."""
+        for t, level, msg, args in list(self.ring):
+            try:
+                text = msg % args if args else msg
+            except (TypeError, ValueError) as err:
+                text = f"{msg!r} {args!r} ({err})"
+            yield f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))}.{int(t % 1 * 1000):03d} " \
+                  f"{LEVEL_NAMES.get(level, level):<5} {text}"
+
+    def dump(self, path):
+        """Write the ring to path; returns the number of messages written."""
+        lines = list(self.lines())
+        with open(path, 'w') as f:
+            f.writelines(line + '\n' for line in lines)
+        return len(lines)
@@ -0,0 +1,107 @@
+"""
+Advanced settings from the "Options" hardware parameter (Mode6), written as
+key=value pairs separated by semicolons, e.g. "gap=4;max_block=60".
+"""
+
+
+DEFAULTS = {
+    'gap': 8,                # max. unused registers bridged inside one read
+    'max_block': 120,        # max. registers per read request
+    'fast': 10.0,            # seconds between reads of power, flow and compressor values
+    'normal': 30.0,          # seconds between reads of temperatures and states
+    'slow': 600.0,           # seconds between reads of configuration registers
+    'db_temp': 0.2,          # deadband for temperature devices (C)
+    'db_power': 10.0,        # deadband for power devices (W)
+    'db_current': 0.1,       # deadband for current devices (A)
+    'db_voltage': 2.0,       # deadband for voltage devices (V)
+    'max_age': 300,          # seconds after which an unchanged device is updated anyway
+    'rmw_age': 60,           # max. age (s) of a polled register value used for read-modify-write
+    'fc16': 1,               # 1 = write adjacent registers with one function 0x10 request
+    'backoff': 5.0,          # seconds before the first probe of an unreachable heat pump
+    'backoff_max': 300.0,    # max. seconds between probes, the delay doubles up to this
+    'timeout': 2.0,          # max. seconds to wait for a response (the actual deadline follows the measured RTT)
+    'min_timeout': 0.2,      # min. response deadline in seconds
+    'retries': 2,            # attempts per request
+    'min_gap': 0.005,        # min. quiet time in seconds between a response and the next request
+    'bus_load': 0.5,         # target share of time the bus is busy with our requests
+    'pipeline': 4,           # Modbus TCP: max. read requests in flight at once (1 = one at a time)
+    'baud': 9600,            # serial RS-485 only: baud rate
+    'parity': 'N',           # serial RS-485 only: N, E or O
+    'stopbits': 1,           # serial RS-485 only: 1 or 2
+    'stretch': 4.0,          # max. factor by which the poll periods are stretched to meet bus_load
+    'history': 24.0,         # hours of raw register images kept in memory per heat pump (0 = none)
+    'history_mb': 32.0,      # max. MB of memory for the history of all heat pumps together
+    'capture': 0.0,          # MB per capture file of recorded Modbus traffic (0 = do not record)
+    'http_port': 0,          # port of the read-only snapshot endpoint (0 = off, unless http_bind is a socket path)
+    'http_bind': '127.0.0.1',  # address of the snapshot endpoint, or the path of a Unix socket
+    'cop_window': 60.0,      # minutes over which the rolling COP (Unit 38) is computed
+    'register_map': '',      # register map file (tools/discover.py) in the plugin folder, instead of the built-in map
+}
+
+# allowed (min, max) of the numeric options; None is unbounded
+LIMITS = {
+    'gap': (0, 125),
+    'max_block': (1, 125),
+    'fast': (0.1, None),
+    'normal': (0.1, None),
+    'slow': (0.1, None),
+    'db_temp': (0.0, None),
+    'db_power': (0.0, None),
+    'db_current': (0.0, None),
+    'db_voltage': (0.0, None),
+    'max_age': (0, None),
+    'rmw_age': (0, None),
+    'fc16': (0, 1),
+    'backoff': (0.1, None),
+    'backoff_max': (0.1, None),
+    'timeout': (0.05, 60.0),
+    'min_timeout': (0.01, 60.0),
+    'retries': (1, 10),
+    'min_gap': (0.0, 1.0),
+    'bus_load': (0.01, 1.0),
+    'pipeline': (1, 16),
+    'baud': (300, 1000000),
+    'stopbits': (1, 2),
+    'stretch': (1.0, None),
+    'history': (0.0, None),
+    'history_mb': (0.0, None),
+    'capture': (0.0, None),
+    'http_port': (0, 65535),
+    'cop_window': (1.0, None),
+}
+
+
+def parse_options(text):
+    """
+    Return DEFAULTS updated with the values in text.
+    Raises ValueError for unknown keys, malformed values and values out of range.
+    """
+    options = dict(DEFAULTS)
+    for item in (text or '').split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        key, sep, value = item.partition('=')
+        key = key.strip()
+        if not sep or key not in DEFAULTS:
+            raise ValueError(f"unknown option '{item}'")
+        try:
+            options[key] = type(DEFAULTS[key])(value.strip())
+        except ValueError:
+            raise ValueError(f"invalid value for option '{key}': {value.strip()}") from None
+        low, high = LIMITS.get(key, (None, None))
+        if (low is not None and options[key] < low) or (high is not None and options[key] > high):
+            raise ValueError(f"option '{key}' must be {limit_text(low, high)}: {value.strip()}")
+    if options['parity'] not in ('N', 'E', 'O'):
+        raise ValueError(f"option 'parity' must be N, E or O: {options['parity']}")
+    if options['min_timeout'] > options['timeout']:
+        raise ValueError("option 'min_timeout' must not exceed 'timeout'")
+    if options['backoff'] > options['backoff_max']:
+        raise ValueError("option 'backoff' must not exceed 'backoff_max'")
+    return options
+
+
+def limit_text(low, high):
+    if high is None:
+        return f"at least {low}"
+    return f"between {low} and {high}"
@@ -0,0 +1,132 @@
+"""
+Request planner: turns the registers that are actually needed into the
+smallest set of function 0x03 (read holding registers) requests.
+"""
+
+import bisect
+import time
+
+
+MAX_READ_COUNT = 125         # Modbus limit for one function 0x03 request
+
+
+def needed_addresses(registers, units):
+    """Addresses of all registers that feed at least one of the given Units."""
+    units = set(units)
+    return {reg.address for reg in registers if units.intersection(reg.units)}
+
+
+def affected(registers, addresses):
+    """
+    Units fed by the given addresses, and every address that feeds one of
+    those Units (e.g. unit state and operation mode both drive Unit 1).
+    Returns (addresses, units).
+    """
+    units = {unit for reg in registers if reg.address in addresses for unit in reg.units}
+    return needed_addresses(registers, units) | set(addresses), units
+
+
+def plan_reads(addresses, max_gap=8, max_count=120, readable=None):
+    """
+    Merge addresses into (start, count) blocks.
+
+    Two addresses share a request when at most max_gap unused registers lie
+    between them and the block stays within max_count registers; reading a
+    few unused words is cheaper than the framing and turnaround of another
+    request. Scanning the sorted addresses greedily gives the minimum number
+    of requests for these two constraints. readable, if given, is a sorted
+    list of (start, count) ranges the heat pump answers (see
+    powerworld.regmap); a block never bridges the gap between two of them.
+    """
+    max_count = min(max_count, MAX_READ_COUNT)
+    starts = [start for start, count in readable] if readable else None
+    blocks = []
+    for address in sorted(set(addresses)):
+        if blocks:
+            start, count = blocks[-1]
+            if (address - (start + count) <= max_gap and address - start < max_count
+                    and (starts is None or bisect.bisect(starts, start) == bisect.bisect(starts, address))):
+                blocks[-1] = (start, address - start + 1)
+                continue
+        blocks.append((address, 1))
+    return blocks
+
+
+class Scheduler:
+    """
+    Polling schedule over the register tiers.
+
+    Each tier has its own period. On every tick the tiers that are due are
+    combined and read with one merged plan; the plans for each combination
+    of tiers are compiled once and cached. All periods are multiplied by
+    scale, which the poll worker raises when the bus is too busy.
+    """
+
+    def __init__(self, registers, units, periods, max_gap=8, max_count=120, readable=None):
+        self.periods = dict(periods)
+        self.max_gap = max_gap
+        self.max_count = max_count
+        self.readable = readable
+        self.addresses = {
+            tier: needed_addresses([reg for reg in registers if reg.tier == tier], units)
+            for tier in self.periods
+        }
+        self.scale = 1.0
+        self._next = {tier: 0.0 for tier in self.periods}
+        self._plans = {}
+
+    @property
+    def tick(self):
+        """Interval at which the worker should check for due tiers."""
+        return min(self.periods.values())
+
+    @property
+    def base_tier(self):
+        """The tier with the shortest period that has registers to read, or None."""
+        tiers = [tier for tier in self.periods if self.addresses[tier]]
+        return min(tiers, key=self.periods.get) if tiers else None
+
+    def probe_plan(self):
+        """
+        One-register read that shows whether the heat pump answers again: the
+        first register of the base tier, else the start of the first readable
+        range, else None.
+        """
+        tier = self.base_tier
+        if tier is not None:
+            return ((min(self.addresses[tier]), 1),)
+        if self.readable:
+            return ((self.readable[0][0], 1),)
+        return None
+
+    def max_age(self, address):
+        """
+        Age up to which the polled value of address is as fresh as this
+        schedule keeps it: the period of its tier plus one tick, or None if
+        it is not polled.
+        """
+        for tier, addresses in self.addresses.items():
+            if address in addresses:
+                return self.periods[tier] * self.scale + self.tick
+        return None
+
+    def next_due(self):
+        """Earliest time.monotonic() at which a tier becomes due."""
+        pending = [at for tier, at in self._next.items() if self.addresses[tier]]
+        return min(pending) if pending else time.monotonic() + self.tick
+
+    def due(self, now):
+        return frozenset(tier for tier, at in self._next.items() if at <= now and self.addresses[tier])
+
+    def plan(self, tiers):
+        plan = self._plans.get(tiers)
+        if plan is None:
+            addresses = set()
+            for tier in tiers:
+                addresses |= self.addresses[tier]
+            plan = self._plans[tiers] = plan_reads(addresses, self.max_gap, self.max_count, self.readable)
+        return plan
+
+    def done(self, tiers, now):
+        for tier in tiers:
+            self._next[tier] = now + self.periods[tier] * self.scale
@@ -0,0 +1,56 @@
+"""
+Change detection for Domoticz device updates.
+
+Every Devices[...].Update is a database write plus event-system work, so a
+Unit is only updated when its value actually changed.
+"""
+
+import time
+
+
+class PublishCache:
+    """
+    Last published (nValue, sValue, number, time) per Unit.
+
+    A value is published when nValue changes, when the numeric value moved
+    at least the deadband of its kind away from the last published one (or
+    sValue changed, for values without a deadband), or when the last update
+    is older than max_age so graphs keep getting points.
+    """
+
+    def __init__(self, deadbands, max_age):
+        self.deadbands = dict(deadbands)
+        self.max_age = max_age
+        self._last = {}
+        self.published = 0
+        self.suppressed = 0
+        self.published_total = 0
+        self.suppressed_total = 0
+
+    def changed(self, unit, nValue, sValue, kind=None, number=None, now=None):
+        now = time.monotonic() if now is None else now
+        last = self._last.get(unit)
+        if last is not None and now - last[3] < self.max_age and nValue == last[0]:
+            deadband = self.deadbands.get(kind, 0)
+            if deadband and number is not None and last[2] is not None:
+                unchanged = abs(number - last[2]) < deadband
+            else:
+                unchanged = sValue == last[1]
+            if unchanged:
+                self.suppressed += 1
+                return False
+        self._last[unit] = (nValue, sValue, number, now)
+        self.published += 1
+        return True
+
+    def forget(self, unit):
+        """Force the next update, e.g. after the device was changed from Domoticz."""
+        self._last.pop(unit, None)
+
+    def cycle(self):
+        """Return and reset the (published, suppressed) counters of this cycle."""
+        counts = (self.published, self.suppressed)
+        self.published_total += self.published
+        self.suppressed_total += self.suppressed
+        self.published = self.suppressed = 0
+        return counts
@@ -0,0 +1,148 @@
+"""
+PowerWorld register map and the decoder compiled from it.
+
+The register block is handled as an "image": the raw big-endian words exactly
+as the heat pump returns them, starting at address 0x0000.
+"""
+
+import collections
+import struct
+
+
+REGISTER_SPACE = 0x16F       # registers 0x0000-0x016E
+
+# polling tiers: fast changing values, temperatures and states, configuration
+TIERS = ('fast', 'normal', 'slow')
+
+# one-register read used to check that an unreachable heat pump answers again,
+# when its schedule does not name a register (see Scheduler.probe_plan)
+PROBE_PLAN = ((0x3F, 1),)
+
+
+Register = collections.namedtuple('Register', 'name address scale signed bit units tier',
+                                  defaults=(1, False, None, (), 'normal'))
+Register.__doc__ = """
+One decoded value.
+scale:  multiplier applied to the raw word (1 = keep the integer)
+signed: the word is a 16 bit two's-complement value
+bit:    extract a single bit instead of the whole word
+units:  Domoticz Units that are fed by this value
+tier:   polling tier, see TIERS
+"""
+
+
+REGISTERS = (
+    Register('defrosting', 0x03, bit=7, units=(24,)),
+    Register('chassis_heat', 0x05, bit=0, units=(33,)),
+    Register('three_way', 0x05, bit=6, units=(17,)),
+    Register('elec_boiler', 0x05, bit=7, units=(18,)),
+    Register('crank_heat', 0x06, bit=1, units=(34, 25)),
+    Register('fault_1', 0x07, units=(35,)),
+    Register('fault_2', 0x08, units=(35,)),
+    Register('fault_3', 0x09, units=(35,)),
+    Register('fault_4', 0x0A, units=(35,)),
+    Register('fault_5', 0x0B, units=(35,)),
+    Register('fault_6', 0x0C, units=(35, 25)),
+    Register('fault_7', 0x0D, units=(35,)),
+    Register('water_in_temp', 0x0E, 0.1, True, units=(2, 37, 38, 39)),
+    Register('boiler_temp', 0x0F, 0.1, True, units=(5,)),
+    Register('ambient_temp', 0x11, 0.5, True, units=(4,)),
+    Register('water_out_temp', 0x12, 0.1, True, units=(3, 37, 38, 39)),
+    Register('suction_gas_temp', 0x15, signed=True, units=(6,)),
+    Register('evap_temp', 0x16, signed=True, units=(7,)),
+    Register('internal_temp', 0x1A, signed=True, units=(8,)),
+    Register('discharge_temp', 0x1B, signed=True, units=(9,)),
+    Register('comp_freq', 0x1E, units=(20,), tier='fast'),
+    Register('dc_bus', 0x21, units=(19,)),
+    Register('comp_current', 0x23, units=(21,), tier='fast'),
+    Register('fan1', 0x26, units=(13,), tier='fast'),
+    Register('fan2', 0x27, units=(14,), tier='fast'),
+    Register('low_press_conv_temp', 0x28, 0.1, True, units=(10,)),
+    Register('water_pump_speed', 0x2A, 0.1, units=(16, 32), tier='fast'),
+    Register('low_press_val', 0x2B, 0.01, units=(23,)),
+    Register('comp_power', 0x2E, units=(22,), tier='fast'),
+    Register('waterflow', 0x30, 0.01, units=(29, 37, 38, 39), tier='fast'),
+    Register('mains_voltage', 0x31, units=(26,)),
+    Register('cons_current', 0x32, 0.1, units=(27,), tier='fast'),
+    Register('cons_power', 0x35, units=(28, 38, 39), tier='fast'),
+    Register('cop', 0x37, 0.1, units=(15,), tier='fast'),
+    Register('unit_state', 0x3F, bit=0, units=(1,)),
+    Register('powerful', 0x40, bit=4, units=(36,), tier='slow'),
+    Register('silent', 0x40, bit=5, units=(36,), tier='slow'),
+    Register('holiday', 0x41, bit=1, units=(36,), tier='slow'),
+    Register('operation_mode', 0x43, units=(1,)),
+    Register('hot_water_sp', 0xBE, units=(11,), tier='slow'),
+    Register('heating_sp', 0xC0, units=(12,), tier='slow'),
+    Register('pump_target', 0x15B, units=(30,), tier='slow'),
+    Register('pump_cycle', 0x15C, units=(31,), tier='slow'),
+)
+
+
+def register_space(registers=REGISTERS):
+    """Number of registers an image needs to hold all of registers, at least REGISTER_SPACE."""
+    return max(REGISTER_SPACE, max(reg.address for reg in registers) + 1)
+
+
+class Decoder:
+    """
+    Decoder compiled from a register table.
+
+    All words that are referenced are unpacked from the image with a single
+    precompiled struct (unused words are skipped as pad bytes), so every
+    register is converted exactly once per cycle, signed words directly as
+    'h'. Scaling and bit extraction are then applied per value.
+    """
+
+    def __init__(self, registers):
+        signedness = {}
+        for reg in registers:
+            if signedness.setdefault(reg.address, reg.signed) != reg.signed:
+                raise ValueError(f"register 0x{reg.address:04X} is declared both signed and unsigned")
+        self.addresses = tuple(sorted(signedness))
+
+        fmt = ['>']
+        pos = 0
+        for address in self.addresses:
+            if address > pos:
+                fmt.append(f'{(address - pos) * 2}x')
+            fmt.append('h' if signedness[address] else 'H')
+            pos = address + 1
+        self._struct = struct.Struct(''.join(fmt))
+
+        index = {address: i for i, address in enumerate(self.addresses)}
+        self._words = []
+        self._scaled = []
+        self._bits = []
+        for reg in registers:
+            i = index[reg.address]
+            if reg.bit is not None:
+                self._bits.append((reg.name, i, reg.bit))
+            elif reg.scale != 1:
+                self._scaled.append((reg.name, i, reg.scale, 2 if reg.scale < 0.1 else 1))
+            else:
+                self._words.append((reg.name, i))
+
+    @property
+    def size(self):
+        """Minimum image length in bytes."""
+        return self._struct.size
+
+    def decode(self, image):
+        words = self._struct.unpack_from(image)
+        values = {name: words[i] for name, i in self._words}
+        for name, i, scale, digits in self._scaled:
+            values[name] = round(words[i] * scale, digits)
+        for name, i, bit in self._bits:
+            values[name] = (words[i] >> bit) & 1
+        return values
+
+
+def frequency_mode(values):
+    """Selector level of the frequency mode device (Unit 36)."""
+    if values['holiday']:
+        return 40
+    if values['silent']:
+        return 30
+    if values['powerful']:
+        return 20
+    return 10
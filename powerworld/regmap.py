@@ -0,0 +1,112 @@
+"""
+Register map files: the registers of a heat pump model or firmware as JSON,
+written by tools/discover.py and loaded by the plugin (option register_map).
+
+    {
+      "readable": [[0, 112], [190, 177]],
+      "registers": [{"name": "water_in_temp", "address": 14, "scale": 0.1, "signed": true}, ...],
+      "absent": ["boiler_temp"],
+      "observed": [...]
+    }
+
+readable lists the (start, count) ranges the heat pump answers. A register
+entry replaces the built-in register of the same name; fields it leaves out
+(units, tier, ...) keep their built-in values. absent names built-in
+registers this heat pump does not have; a built-in register that the map
+does not list and that lies outside the readable ranges counts as absent
+too. observed holds what the sweep saw and is not used by the plugin.
+"""
+
+import json
+
+from .registers import REGISTERS, Decoder, Register
+
+
+def register_dict(reg):
+    entry = {'name': reg.name, 'address': reg.address}
+    if reg.scale != 1:
+        entry['scale'] = reg.scale
+    if reg.signed:
+        entry['signed'] = True
+    if reg.bit is not None:
+        entry['bit'] = reg.bit
+    entry['units'] = list(reg.units)
+    entry['tier'] = reg.tier
+    return entry
+
+
+def merge_ranges(ranges):
+    """Sorted (start, count) ranges with adjacent and overlapping ones joined."""
+    merged = []
+    for start, count in sorted(ranges):
+        if merged and start <= merged[-1][0] + merged[-1][1]:
+            last_start, last_count = merged[-1]
+            merged[-1] = (last_start, max(last_start + last_count, start + count) - last_start)
+        else:
+            merged.append((start, count))
+    return merged
+
+
+def dump_register_map(path, readable, registers=REGISTERS, absent=(), observed=()):
+    data = {
+        'readable': [list(r) for r in merge_ranges(readable)],
+        'registers': [register_dict(reg) for reg in registers],
+        'absent': sorted(absent),
+        'observed': list(observed),
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
+
+
+def load_register_map(path, base=REGISTERS):
+    """
+    Return (registers, readable, absent) from a register map file.
+
+    absent are the names of the registers the heat pump does not have. They
+    stay in registers, so every value the plugin uses is decoded, but with
+    no Units: they are never read and decode as 0, and the plugin leaves
+    the devices that depend on them alone.
+
+    Raises ValueError for an invalid file, conflicting registers or a
+    register of the map outside the readable ranges.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as err:
+        raise ValueError(f"cannot read register map {path}: {err}") from None
+    readable = merge_ranges(tuple(r) for r in data.get('readable', ()))
+    registers = {reg.name: reg for reg in base}
+    listed = set()
+    for entry in data.get('registers', ()):
+        entry = dict(entry)
+        name = entry.pop('name', None)
+        listed.add(name)
+        known = registers.get(name)
+        if known is None and 'address' not in entry:
+            raise ValueError(f"register map {path}: register {name!r} without address")
+        try:
+            fields = (known._asdict() if known else {'name': name})
+            fields.update(entry)
+            fields['units'] = tuple(fields.get('units', ()))
+            registers[name] = Register(**fields)
+        except TypeError as err:
+            raise ValueError(f"register map {path}: register {name!r}: {err}") from None
+    absent = set(data.get('absent', ())) - listed
+    for reg in registers.values():
+        if readable and reg.name not in listed and not is_readable(reg.address, readable):
+            absent.add(reg.name)
+    for name in absent:
+        if name in registers:
+            registers[name] = registers[name]._replace(units=())
+    registers = tuple(registers.values())
+    Decoder(registers)          # raises ValueError for a word declared both signed and unsigned
+    if readable:
+        for reg in registers:
+            if reg.name in listed and not is_readable(reg.address, readable):
+                raise ValueError(f"register map {path}: {reg.name} at 0x{reg.address:04X} is not readable")
+    return registers, readable or None, frozenset(absent & set(r.name for r in registers))
+
+
+def is_readable(address, readable):
+    return any(start <= address < start + count for start, count in readable)
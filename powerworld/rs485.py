@@ -0,0 +1,137 @@
+"""
+Direct Modbus RTU over a serial RS-485 adapter (e.g. /dev/ttyUSB0), using
+termios and os only.
+"""
+
+import os
+import select
+import termios
+
+from .transport import ModbusClient, RtuFramer, RtuFraming
+
+
+PARITY = {'N': 0, 'E': termios.PARENB, 'O': termios.PARENB | termios.PARODD}
+
+
+def char_time(baud, parity='N', stopbits=1):
+    """Seconds per character: start bit, 8 data bits, parity and stop bits."""
+    return (1 + 8 + (parity != 'N') + stopbits) / baud
+
+
+def silent_interval(baud, parity='N', stopbits=1):
+    """
+    The Modbus t3.5 frame gap. The specification fixes it at 1.75 ms above
+    19200 baud instead of letting it shrink with the character time.
+    """
+    if baud > 19200:
+        return 0.00175
+    return 3.5 * char_time(baud, parity, stopbits)
+
+
+class SerialConnection(RtuFraming, ModbusClient):
+    """
+    Modbus RTU master on a serial port.
+
+    The port is opened non-blocking in raw mode; responses are reassembled
+    by the same RtuFramer as for RTU over TCP, reading whatever has arrived
+    once select() reports the port readable. Between frames the bus is kept
+    silent for at least t3.5 (or the measured gap, if larger), and a
+    response deadline never drops below the time the request and the
+    response need on the wire at this baud rate.
+    """
+
+    def __init__(self, port, baud=9600, parity='N', stopbits=1, timeout=2.0, retries=2, log=None, estimator=None):
+        super().__init__(timeout, retries, log, estimator)
+        if parity not in PARITY:
+            raise ValueError(f"parity must be one of {', '.join(PARITY)}")
+        self.port = port
+        self.baud = int(baud)
+        self.parity = parity
+        self.stopbits = int(stopbits)
+        self.char = char_time(self.baud, parity, self.stopbits)
+        self.t35 = silent_interval(self.baud, parity, self.stopbits)
+        self.fd = None
+        self.framer = RtuFramer()
+        self.frames = {}
+
+    def open(self):
+        if self.fd is not None:
+            return
+        speed = getattr(termios, f'B{self.baud}', None)
+        if speed is None:
+            raise ValueError(f"unsupported baud rate {self.baud}")
+        try:
+            fd = os.open(self.port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        except OSError:
+            self.stats['connect_failures'] += 1
+            raise
+        try:
+            iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(fd)
+            cflag = termios.CS8 | termios.CREAD | termios.CLOCAL | PARITY[self.parity]
+            if self.stopbits == 2:
+                cflag |= termios.CSTOPB
+            cc[termios.VMIN] = 0
+            cc[termios.VTIME] = 0
+            termios.tcsetattr(fd, termios.TCSANOW, [termios.IGNBRK, 0, cflag, 0, speed, speed, cc])
+            termios.tcflush(fd, termios.TCIOFLUSH)
+        except (OSError, termios.error) as err:
+            os.close(fd)
+            self.stats['connect_failures'] += 1
+            raise OSError(f"cannot configure {self.port}: {err}") from None
+        self.fd = fd
+        self.stats['connects'] += 1
+        if self.stats['connects'] > 1:
+            self.log("Reopened serial port %s", self.port, key='reconnect')
+
+    def close(self):
+        if self.fd is None:
+            return
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+        self.fd = None
+        self.stats['disconnects'] += 1
+
+    def healthy(self):
+        """Discard bytes that arrived while idle (late answers, line noise)."""
+        if self.fd is None:
+            return False
+        try:
+            while select.select([self.fd], [], [], 0)[0]:
+                data = os.read(self.fd, 512)
+                if not data:
+                    break
+                self.stats['stray_bytes'] += len(data)
+        except OSError:
+            self.close()
+            return False
+        return True
+
+    def send(self, frame):
+        view = memoryview(frame)
+        while view:
+            select.select([], [self.fd], [], self.timeout)
+            n = os.write(self.fd, view)
+            view = view[n:]
+        # return once the frame is on the wire
+        try:
+            termios.tcdrain(self.fd)
+        except termios.error as err:
+            raise OSError(f"serial port {self.port}: {err}") from None
+        self.stats['bytes_sent'] += len(frame)
+
+    def recv_into(self, view, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            raise TimeoutError("no response from heat pump")
+        n = os.readv(self.fd, [view])
+        self.stats['bytes_received'] += n
+        return n
+
+    def response_timeout(self, size):
+        # time on the wire for a read request (8 bytes), the gap and the response (PDU + slave ID + CRC)
+        wire = (8 + size + 3) * self.char + self.t35
+        return max(self.estimator.timeout(size), wire + self.estimator.minimum)
+
+    def quiet_gap(self):
+        return max(self.estimator.gap(), self.t35)
@@ -0,0 +1,147 @@
+"""
+Transport and poll-cycle telemetry.
+
+The transport counts requests, retries, timeouts, bytes and round-trip
+times, the poll worker adds poll and decode timings and the plugin the time
+spent publishing. Everything is kept as counters and fixed-bucket
+histograms, so recording costs a few integer increments and nothing grows
+with uptime.
+"""
+
+import bisect
+import collections
+import time
+
+
+# bucket upper bounds in seconds: 1 ms ... 2 s, plus an overflow bucket
+BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+
+class Histogram:
+    """Count of values per bucket, with total and maximum."""
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile (the maximum for the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        """Summary in milliseconds."""
+        buckets = {f'<={bound * 1000:g}ms': n for bound, n in zip(self.bounds, self.counts)}
+        buckets[f'>{self.bounds[-1] * 1000:g}ms'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'mean_ms': round(self.mean() * 1000, 3),
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p90_ms': round(self.percentile(90) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+            'buckets': buckets,
+        }
+
+
+class Telemetry:
+    """
+    Per-cycle and cumulative statistics for one gateway connection.
+
+    record() is called by the poll worker for every snapshot and published()
+    by the plugin after it published one. The counters of the connection and
+    its framer are only read, never reset; cycle() reports how much each of
+    them moved since the previous call, for the whole connection or for the
+    requests of one slave.
+    """
+
+    def __init__(self, conn, window=100):
+        self.conn = conn
+        self.started = time.time()
+        self.poll = Histogram()
+        self.decode = Histogram()
+        self.publish = Histogram()
+        self.polls = 0
+        self.failed = 0
+        self.last_good = None
+        self.last_error = None
+        self.recent = collections.deque(maxlen=window)   # True for a failed poll
+        self._previous = {None: self.counters()}
+
+    def counters(self, slave=None):
+        if slave is None:
+            return self.conn.counters()
+        return dict(self.conn.slave_stats.get(slave) or dict.fromkeys(self.conn.COUNTERS, 0))
+
+    def record(self, snapshot):
+        """Add one snapshot (poll or refresh)."""
+        self.polls += 1
+        self.recent.append(snapshot.error is not None)
+        if snapshot.error is not None:
+            self.failed += 1
+            self.last_error = snapshot.error
+            return
+        self.last_good = snapshot.time
+        self.poll.add(snapshot.duration)
+        self.decode.add(snapshot.decode)
+
+    def published(self, seconds):
+        """Add the time the plugin took to publish a snapshot."""
+        self.publish.add(seconds)
+
+    def cycle(self, slave=None):
+        """Counter increments since the previous call for the same slave (None = the whole connection)."""
+        current = self.counters(slave)
+        previous = self._previous.get(slave) or dict.fromkeys(current, 0)
+        delta = {key: current[key] - previous[key] for key in current}
+        self._previous[slave] = current
+        return delta
+
+    def error_rate(self):
+        """Percentage of failed polls within the recent window."""
+        return 100.0 * sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def last_good_age(self, now=None):
+        """Seconds since the last successful poll, or since start-up."""
+        now = time.time() if now is None else now
+        return now - (self.last_good if self.last_good is not None else self.started)
+
+    def as_dict(self):
+        """Everything, for the JSON stats dump."""
+        return {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'uptime_s': round(time.time() - self.started, 1),
+            'polls': self.polls,
+            'failed_polls': self.failed,
+            'error_rate_pct': round(self.error_rate(), 1),
+            'last_good_age_s': round(self.last_good_age(), 1),
+            'last_error': self.last_error,
+            'transport': dict(self.conn.stats),
+            'slaves': {slave: dict(totals) for slave, totals in list(self.conn.slave_stats.items())},
+            'framing': dict(self.conn.framer.stats),
+            'rtt': self.conn.rtt.as_dict(),
+            'rtt_estimate': self.conn.estimator.as_dict(),
+            'poll': self.poll.as_dict(),
+            'decode': self.decode.as_dict(),
+            'publish': self.publish.as_dict(),
+        }
@@ -0,0 +1,105 @@
+"""
+Adaptive timing: response deadlines from measured round-trip times, and
+poll periods stretched to keep the bus load under a target.
+"""
+
+
+class RttEstimator:
+    """
+    Smoothed round-trip time and variance per response size, computed the
+    way TCP derives its retransmission timeout (RFC 6298):
+
+        rttvar = 3/4 rttvar + 1/4 |srtt - sample|
+        srtt   = 7/8 srtt + 1/8 sample
+        rto    = srtt + max(granularity, 4 rttvar)
+
+    A 250 register read takes noticeably longer on a 9600 baud bus than a
+    write echo, so responses are grouped by length (per bucket bytes). The
+    timeout is bounded by minimum and maximum; a size without samples uses
+    maximum. A timeout doubles the timeout of its size until the next
+    sample.
+    """
+
+    def __init__(self, minimum=0.2, maximum=2.0, granularity=0.01, bucket=64, min_gap=0.005):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.granularity = granularity
+        self.bucket = bucket
+        self.min_gap = min_gap
+        self._estimates = {}        # size class -> [srtt, rttvar, rto]
+
+    def sample(self, size, rtt):
+        est = self._estimates.get(size // self.bucket)
+        if est is None:
+            est = self._estimates[size // self.bucket] = [rtt, rtt / 2, 0.0]
+        else:
+            est[1] = 0.75 * est[1] + 0.25 * abs(est[0] - rtt)
+            est[0] = 0.875 * est[0] + 0.125 * rtt
+        est[2] = min(max(est[0] + max(self.granularity, 4 * est[1]), self.minimum), self.maximum)
+
+    def backoff(self, size):
+        est = self._estimates.get(size // self.bucket)
+        if est is not None:
+            est[2] = min(est[2] * 2, self.maximum)
+
+    def timeout(self, size):
+        """Deadline in seconds for a response of size bytes."""
+        est = self._estimates.get(size // self.bucket)
+        return est[2] if est is not None else self.maximum
+
+    def srtt(self, size):
+        est = self._estimates.get(size // self.bucket)
+        return est[0] if est is not None else self.maximum
+
+    def gap(self):
+        """
+        Quiet time between the end of a response and the next request.
+        An unsteady round-trip time means the bus is shared or the gateway is
+        busy, so the largest variance seen is left as extra room, bounded by
+        the fixed 0.1 s the transport used to wait.
+        """
+        spread = max((est[1] for est in self._estimates.values()), default=0.0)
+        return min(max(self.min_gap, spread), 0.1)
+
+    def as_dict(self):
+        return {f'<{(cls + 1) * self.bucket}B': {'srtt_ms': round(est[0] * 1000, 2),
+                                                 'rttvar_ms': round(est[1] * 1000, 2),
+                                                 'timeout_ms': round(est[2] * 1000, 2)}
+                for cls, est in sorted(self._estimates.items())}
+
+
+class BusLoad:
+    """
+    Scales the poll periods so the share of time the bus is busy with our
+    requests stays under target.
+
+    update() is given the total time spent in requests so far; once per
+    window the load of that window is measured, and scale (>= 1, at most
+    max_scale) is moved towards the value that would have met the target.
+    """
+
+    def __init__(self, target=0.5, max_scale=4.0, window=30.0):
+        self.target = target
+        self.max_scale = max_scale
+        self.window = window
+        self.scale = 1.0
+        self.load = 0.0
+        self._since = None
+        self._busy = 0.0
+
+    def update(self, busy, now):
+        """Return the current scale; busy is the cumulative busy time in seconds."""
+        if self._since is None:
+            self._since, self._busy = now, busy
+            return self.scale
+        elapsed = now - self._since
+        if elapsed < self.window:
+            return self.scale
+        self.load = (busy - self._busy) / elapsed
+        wanted = min(max(self.scale * self.load / self.target, 1.0), self.max_scale)
+        # move halfway, so a single busy window does not double the periods
+        self.scale = (self.scale + wanted) / 2
+        if abs(self.scale - 1.0) < 0.05:
+            self.scale = 1.0
+        self._since, self._busy = now, busy
+        return self.scale
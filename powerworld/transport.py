@@ -0,0 +1,508 @@
+"""
+Modbus masters for the RS-485 to LAN gateway: RTU framing over TCP, or
+Modbus TCP (MBAP) with pipelined requests.
+"""
+
+import itertools
+import select
+import socket
+import struct
+import time
+
+from .crc import add_crc, crc16
+from .logger import ERROR
+from .telemetry import Histogram
+from .timing import RttEstimator
+
+
+class ModbusException(Exception):
+    """Exception response (function | 0x80) returned by the heat pump."""
+
+    MESSAGES = {
+        1: 'illegal function',
+        2: 'illegal data address',
+        3: 'illegal data value',
+        4: 'slave device failure',
+        6: 'slave device busy',
+    }
+
+    def __init__(self, function, code):
+        self.function = function
+        self.code = code
+        super().__init__(f"function 0x{function:02X} rejected: {self.MESSAGES.get(code, f'exception {code}')}")
+
+
+def response_length(function, frame, have):
+    """
+    Total length of an RTU response, derived from its first bytes.
+    Returns None while not enough bytes are available to tell.
+    """
+    if have < 2:
+        return None
+    if frame[1] & 0x80:
+        return 5                        # id, function | 0x80, code, crc
+    if function in (3, 4):
+        return 5 + frame[2] if have >= 3 else None
+    return 8                            # write echo: id, function, address, value/count, crc
+
+
+class RtuFramer:
+    """
+    Reassembles one RTU response from a byte stream.
+
+    Bytes are collected in a reusable buffer until the frame length implied
+    by the function code and byte count is reached, however the gateway
+    splits the response into TCP segments. Bytes that cannot start the
+    expected response, and candidate frames that fail the CRC, are skipped
+    one byte at a time to resynchronise. The CRC is carried forward over
+    each piece as it arrives, so a complete frame is checked without going
+    over it again.
+    """
+
+    def __init__(self, size=512):
+        self.buffer = bytearray(size)
+        self.stats = {'fragmented': 0, 'crc_errors': 0, 'stray_bytes': 0}
+
+    def read(self, recv_into, slave, function, deadline):
+        """
+        Return the complete response frame for (slave, function).
+        recv_into(view, timeout) reads available bytes into view; the whole
+        response must arrive before deadline (time.monotonic()).
+        Raises ModbusException for an exception response.
+        """
+        buf = self.buffer
+        view = memoryview(buf)
+        have = 0
+        reads = 0
+        crc, checked = 0xFFFF, 0
+        while True:
+            while have:
+                if buf[0] != slave or (have >= 2 and buf[1] not in (function, function | 0x80)):
+                    self.stats['stray_bytes'] += 1
+                    buf[:have - 1] = buf[1:have]
+                    have -= 1
+                    crc, checked = 0xFFFF, 0
+                    continue
+                need = response_length(function, buf, have)
+                end = have if need is None else min(have, need)
+                crc = crc16(view[checked:end], crc)
+                checked = end
+                if need is None or have < need:
+                    break
+                if crc == 0:
+                    frame = bytes(view[:need])
+                    self.stats['stray_bytes'] += have - need
+                    if reads > 1:
+                        self.stats['fragmented'] += 1
+                    if frame[1] & 0x80:
+                        raise ModbusException(function, frame[2])
+                    return frame
+                self.stats['crc_errors'] += 1
+                buf[:have - 1] = buf[1:have]
+                have -= 1
+                crc, checked = 0xFFFF, 0
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or have == len(buf):
+                raise TimeoutError(f"incomplete response ({have} bytes)")
+            n = recv_into(view[have:], remaining)
+            if not n:
+                raise ConnectionError("connection closed by gateway")
+            have += n
+            reads += 1
+
+
+class MbapFramer:
+    """
+    Reads one Modbus TCP (MBAP) response from a byte stream: the 7-byte
+    header (transaction ID, protocol ID, length, unit ID) tells how many PDU
+    bytes follow. Uses a reusable buffer like RtuFramer; the stats have the
+    same keys, although TCP leaves no CRC to check.
+    """
+
+    def __init__(self, size=512):
+        self.buffer = bytearray(size)
+        self.stats = {'fragmented': 0, 'crc_errors': 0, 'stray_bytes': 0}
+
+    def read(self, recv_into, deadline):
+        """Return (transaction, unit, pdu) of the next response; the whole frame must arrive before deadline."""
+        view = memoryview(self.buffer)
+        have = 0
+        need = 7
+        reads = 0
+        while have < need:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"incomplete response ({have} bytes)")
+            n = recv_into(view[have:need], remaining)
+            if not n:
+                raise ConnectionError("connection closed by gateway")
+            have += n
+            reads += 1
+            if have == 7 and need == 7:
+                transaction, protocol, length, unit = struct.unpack_from('>HHHB', self.buffer)
+                if protocol != 0 or not 2 <= length <= len(self.buffer) - 6:
+                    # no way to find the next frame boundary in a TCP stream
+                    raise ConnectionError(f"invalid MBAP header {bytes(view[:7]).hex()}")
+                need = 6 + length
+        if reads > 2:
+            self.stats['fragmented'] += 1
+        return transaction, unit, bytes(view[7:need])
+
+
+class ModbusClient:
+    """
+    The part of a Modbus master that does not depend on the framing:
+    retries, statistics, response deadlines and the register functions.
+
+    Subclasses implement open(), close(), healthy() and
+    transact(slave, pdus, sizes), which sends request PDUs and returns the
+    response PDUs (function code onwards). pipeline is the number of
+    requests that transact() may be given at once.
+
+    Round-trip times go into the rtt histogram; retries, timeouts and bytes
+    are counted in stats. Response deadlines and the quiet time between
+    frames come from an RttEstimator, with timeout as the upper bound.
+    Answered requests are passed to recorder (a CaptureWriter), if set.
+    Messages go to log(msg, *args, level=, key=) with the arguments of
+    Logger.log, formatted only when they are written. slave_stats holds
+    the counters of COUNTERS per slave, for the traffic of its requests.
+    """
+
+    pipeline = 1
+    COUNTERS = ('requests', 'retries', 'timeouts', 'crc_errors', 'connects', 'bytes_sent', 'bytes_received')
+
+    def __init__(self, timeout=2.0, retries=2, log=None, estimator=None):
+        self.timeout = timeout
+        self.retries = max(int(retries), 1)  # exchange() needs at least one attempt
+        self.log = log or (lambda msg, *args, **kw: None)
+        self.estimator = estimator or RttEstimator(maximum=timeout)
+        self.stats = {
+            'connects': 0,
+            'connect_failures': 0,
+            'disconnects': 0,
+            'requests': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'failed_requests': 0,
+            'bytes_sent': 0,
+            'bytes_received': 0,
+            'stray_bytes': 0,
+        }
+        self.rtt = Histogram()
+        self.recorder = None
+        self.slave_stats = {}
+        self._quiet_since = 0.0
+
+    @property
+    def connections_saved(self):
+        """Requests that reused an open connection instead of a new one."""
+        return max(self.stats['requests'] - self.stats['connects'], 0)
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def healthy(self):
+        raise NotImplementedError
+
+    def transact(self, slave, pdus, sizes):
+        raise NotImplementedError
+
+    def response_timeout(self, size):
+        """Seconds to wait for a response PDU of size bytes."""
+        return self.estimator.timeout(size)
+
+    def quiet_gap(self):
+        """Seconds of silence between a response and the next request."""
+        return self.estimator.gap()
+
+    def wait_quiet(self):
+        """Keep the quiet gap after the previous response."""
+        wait = self._quiet_since + self.quiet_gap() - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def answered(self, size, sent):
+        rtt = time.monotonic() - sent
+        self.rtt.add(rtt)
+        self.estimator.sample(size, rtt)
+
+    def counters(self):
+        """The COUNTERS of the connection as a whole."""
+        counters = {key: self.stats.get(key, 0) for key in self.COUNTERS}
+        counters['crc_errors'] = self.framer.stats['crc_errors']
+        return counters
+
+    def exchange(self, slave, pdus, sizes):
+        """
+        Send request PDUs to slave and return the response PDUs, which are
+        expected to be sizes bytes long. Transport errors are retried;
+        exception responses are not. The connection is dropped on transport
+        errors and timeouts, so a late response can not be mistaken for the
+        answer to the next request. What the exchange added to the counters
+        is also added to slave_stats of slave.
+        """
+        before = self.counters()
+        try:
+            return self._exchange(slave, pdus, sizes)
+        finally:
+            totals = self.slave_stats.get(slave)
+            if totals is None:
+                totals = self.slave_stats[slave] = dict.fromkeys(self.COUNTERS, 0)
+            for key, value in self.counters().items():
+                totals[key] += value - before[key]
+
+    def _exchange(self, slave, pdus, sizes):
+        for attempt in range(self.retries):
+            try:
+                if not self.healthy():
+                    self.open()
+                self.wait_quiet()
+                try:
+                    responses = self.transact(slave, pdus, sizes)
+                finally:
+                    self._quiet_since = time.monotonic()
+            except OSError as err:
+                if isinstance(err, TimeoutError):
+                    self.stats['timeouts'] += 1
+                    for size in sizes:
+                        self.estimator.backoff(size)
+                self.close()
+                if attempt + 1 == self.retries:
+                    self.stats['failed_requests'] += 1
+                    raise
+                self.stats['retries'] += 1
+                self.log("Modbus request 0x%02X failed, retrying: %s", pdus[0][0], err, key='retry')
+                # let a late answer to the failed request pass the bus first
+                time.sleep(min(self.estimator.srtt(sizes[0]), self.timeout / 4))
+            else:
+                if self.recorder is not None:
+                    self._record(self.recorder.record, slave, pdus, responses)
+                return responses
+
+    def mark_cycle(self, slave, t=None):
+        """Mark the end of a complete poll cycle of slave in the capture, if one is recorded."""
+        if self.recorder is not None:
+            self._record(self.recorder.mark_cycle, slave, t)
+
+    def _record(self, write, *args):
+        try:
+            write(*args)
+        except OSError as err:
+            # a full disk must not stop the polling
+            self.log("Capture stopped: %s", err, level=ERROR)
+            self.recorder = None
+
+    def request(self, slave, function, data, size=5):
+        """Send function + data to slave and return the response PDU of size bytes."""
+        return self.exchange(slave, [bytes((function,)) + data], [size])[0]
+
+    def read_blocks(self, slave, blocks):
+        """
+        Function 0x03 for each (start, count) block; returns the raw
+        big-endian register data per block. Up to pipeline requests are
+        outstanding at once.
+        """
+        blocks = list(blocks)
+        data = []
+        for i in range(0, len(blocks), self.pipeline):
+            chunk = blocks[i:i + self.pipeline]
+            pdus = [struct.pack('>BHH', 3, start, count) for start, count in chunk]
+            responses = self.exchange(slave, pdus, [2 + count * 2 for start, count in chunk])
+            for (start, count), resp in zip(chunk, responses):
+                if resp[1] != count * 2:
+                    raise ValueError(f"read 0x{start:04X}+{count}: got {resp[1]} bytes")
+                data.append(resp[2:2 + resp[1]])
+        return data
+
+    def read_registers(self, slave, start, count):
+        """Function 0x03; returns the raw big-endian register data."""
+        return self.read_blocks(slave, [(start, count)])[0]
+
+    def write_register(self, slave, address, value):
+        """Function 0x06; the device must echo the request."""
+        data = struct.pack('>HH', address, value)
+        resp = self.request(slave, 6, data)
+        if resp[1:5] != data:
+            raise ValueError(f"write 0x{address:04X} not confirmed")
+
+    def write_registers(self, slave, start, values):
+        """Function 0x10 (write multiple registers); the device must confirm start and count."""
+        head = struct.pack('>HH', start, len(values))
+        resp = self.request(slave, 16, head + struct.pack(f'>B{len(values)}H', len(values) * 2, *values))
+        if resp[1:5] != head:
+            raise ValueError(f"write 0x{start:04X}+{len(values)} not confirmed")
+
+
+class TcpClient(ModbusClient):
+    """
+    Long-lived TCP connection to the gateway, shared by all reads and writes.
+
+    The socket is opened on first use and kept until it fails. Pacing of
+    new attempts after a failure is left to the poll worker's circuit
+    breaker, so a dead gateway is not flooded with new sessions.
+    """
+
+    def __init__(self, host, port, timeout=2.0, retries=2, log=None, estimator=None):
+        super().__init__(timeout, retries, log, estimator)
+        self.host = host
+        self.port = int(port)
+        self.sock = None
+
+    def open(self):
+        if self.sock is not None:
+            return
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError:
+            self.stats['connect_failures'] += 1
+            raise
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.sock = sock
+        self.stats['connects'] += 1
+        if self.stats['connects'] > 1:
+            self.log("Reconnected to gateway %s:%s", self.host, self.port, key='reconnect')
+
+    def close(self):
+        if self.sock is None:
+            return
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        self.sock = None
+        self.stats['disconnects'] += 1
+
+    def healthy(self):
+        """
+        Check an idle socket before reuse.
+        A readable idle socket is either closed by the peer (recv returns b'')
+        or holds the tail of an earlier response, which is discarded.
+        """
+        if self.sock is None:
+            return False
+        try:
+            while select.select([self.sock], [], [], 0)[0]:
+                data = self.sock.recv(512)
+                if not data:
+                    self.close()
+                    return False
+                self.stats['stray_bytes'] += len(data)
+        except OSError:
+            self.close()
+            return False
+        return True
+
+    def send(self, frame):
+        self.sock.sendall(frame)
+        self.stats['bytes_sent'] += len(frame)
+
+    def recv_into(self, view, timeout):
+        self.sock.settimeout(timeout)
+        try:
+            n = self.sock.recv_into(view)
+        except socket.timeout:
+            raise TimeoutError("no response from heat pump") from None
+        self.stats['bytes_received'] += n
+        return n
+
+
+class RtuFraming:
+    """
+    Modbus RTU framing (slave ID, PDU, CRC) on top of send() and
+    recv_into(); one request at a time, responses reassembled by an
+    RtuFramer.
+
+    The read requests of a plan are the same every cycle, so complete
+    request frames are kept in self.frames by (slave, PDU) and the CRC of
+    each is computed only once.
+    """
+
+    max_frames = 256
+
+    def request_frame(self, slave, pdu):
+        frame = self.frames.get((slave, pdu))
+        if frame is None:
+            if len(self.frames) >= self.max_frames:
+                # writes carry values, so do not let them pile up
+                self.frames.clear()
+            frame = self.frames[slave, pdu] = add_crc(bytes((slave,)) + pdu)
+        return frame
+
+    def transact(self, slave, pdus, sizes):
+        responses = []
+        for pdu, size in zip(pdus, sizes):
+            if responses:
+                self.wait_quiet()
+            self.stats['requests'] += 1
+            sent = time.monotonic()
+            self.send(self.request_frame(slave, pdu))
+            try:
+                frame = self.framer.read(self.recv_into, slave, pdu[0], sent + self.response_timeout(size))
+            except ModbusException:
+                self.answered(size, sent)
+                raise
+            self.answered(size, sent)
+            self._quiet_since = time.monotonic()
+            responses.append(frame[1:-2])
+        return responses
+
+
+class GatewayConnection(RtuFraming, TcpClient):
+    """Modbus RTU over TCP: RTU frames passed through the gateway unchanged."""
+
+    def __init__(self, host, port, timeout=2.0, retries=2, log=None, estimator=None):
+        super().__init__(host, port, timeout, retries, log, estimator)
+        self.framer = RtuFramer()
+        self.frames = {}
+
+
+class ModbusTcpConnection(TcpClient):
+    """
+    Modbus TCP: MBAP header instead of CRC, with transaction IDs.
+
+    Up to pipeline requests are sent back to back and their responses are
+    matched by transaction ID in whatever order they arrive; responses to
+    unknown IDs (e.g. late answers to a request that timed out) are
+    skipped. Use pipeline=1 for gateways that handle one request at a time.
+    """
+
+    def __init__(self, host, port, timeout=2.0, retries=2, log=None, estimator=None, pipeline=1):
+        super().__init__(host, port, timeout, retries, log, estimator)
+        self.pipeline = max(int(pipeline), 1)
+        self.framer = MbapFramer()
+        self._transactions = itertools.count(1)
+
+    def transact(self, slave, pdus, sizes):
+        pending = {}
+        frames = bytearray()
+        for i, pdu in enumerate(pdus):
+            transaction = next(self._transactions) & 0xFFFF
+            pending[transaction] = i
+            frames += struct.pack('>HHHB', transaction, 0, len(pdu) + 1, slave) + pdu
+        self.stats['requests'] += len(pdus)
+        sent = time.monotonic()
+        self.send(frames)
+        # the gateway answers one request after the other on the bus
+        deadline = sent + sum(self.response_timeout(size) for size in sizes)
+        responses = [None] * len(pdus)
+        previous = sent
+        while pending:
+            transaction, unit, pdu = self.framer.read(self.recv_into, deadline)
+            i = pending.get(transaction)
+            if i is None or unit != slave:
+                self.framer.stats['stray_bytes'] += 7 + len(pdu)
+                continue
+            del pending[transaction]
+            # time on the bus for this request alone
+            self.answered(sizes[i], previous)
+            previous = time.monotonic()
+            responses[i] = pdu
+        for request, pdu in zip(pdus, responses):
+            if pdu[0] & 0x80:
+                raise ModbusException(request[0], pdu[1])
+        return responses
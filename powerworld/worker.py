@@ -0,0 +1,280 @@
+"""
+Background worker that owns all traffic on the Modbus bus.
+
+Polls and writes both run on this thread, so the Domoticz plugin thread never
+waits on network I/O and requests never overlap on the RS-485 bus. The result
+of each poll is handed over as an immutable Snapshot.
+"""
+
+import array
+import collections
+import queue
+import threading
+import time
+
+from .breaker import CLOSED, CircuitBreaker
+from .logger import ERROR, INFO
+from .registers import PROBE_PLAN
+from .telemetry import Telemetry
+from .timing import BusLoad
+
+
+Snapshot = collections.namedtuple('Snapshot', 'seq time data values error duration tiers units cpu decode',
+                                  defaults=(None, 0.0, 0.0))
+Snapshot.__doc__ = """
+Result of one poll cycle.
+data is the raw register image (bytes) and values the decoded registers, or
+both are None when the poll failed, in which case error holds the reason.
+tiers are the register tiers that were read in this cycle. units is None
+for a poll, or the Units affected by a targeted refresh after a write.
+duration is the wall time and cpu the worker CPU time of the cycle, decode
+the part of it spent decoding the image.
+"""
+
+
+class Pump:
+    """
+    Everything the worker keeps for one heat pump (slave ID) on the bus:
+    its register image and read times, polling schedule, circuit breaker,
+    latest and last good snapshot and, optionally, a History of recent
+    images.
+
+    image holds the raw words from address 0 and is kept between polls, so
+    registers of tiers that were not due keep their last value; stamps holds
+    the time.monotonic() at which each register was last read. The plugin
+    may replace scheduler at any time.
+    """
+
+    def __init__(self, slave, scheduler, image_size, breaker=None, history=None):
+        self.slave = slave
+        self.scheduler = scheduler
+        self.image = bytearray(image_size)
+        self.stamps = array.array('d', [float('-inf')]) * (image_size // 2)
+        self.breaker = breaker or CircuitBreaker()
+        self.history = history
+        self.latest = None
+        self.last_good = None
+        self.seq = 0
+
+    def wake_at(self):
+        """Time at which this pump next needs the bus."""
+        if self.breaker.state == CLOSED:
+            return self.scheduler.next_due()
+        return self.breaker.retry_at
+
+
+class PollWorker(threading.Thread):
+    """
+    Polls the heat pumps on one bus and runs queued jobs in between.
+
+    The tiers that each pump's scheduler reports as due are read block by
+    block with poll(conn, slave, plan, image), taking turns between the
+    pumps, so one pump with a long cycle does not hold up the others; queued
+    jobs (writes) go first between any two requests. A connection that
+    pipelines requests is given conn.pipeline blocks per turn. When all
+    blocks of a pump are in, its image is decoded with decode(image) on this
+    thread, and the image is added to the pump's history.
+
+    The latest result of a pump is published by replacing pump.latest, which
+    is a single reference assignment and therefore safe to read from the
+    plugin thread without locking. Log messages are queued in self.messages
+    and written out by the plugin thread, since the Domoticz API must not be
+    called from here. Every snapshot is also recorded in self.telemetry.
+
+    A failed poll opens the pump's breaker. While it is open nothing is sent
+    to that pump except a single-register probe when the breaker allows one;
+    its queued jobs are dropped. Polling resumes as soon as a probe succeeds.
+
+    self.load stretches all polling periods when the requests keep the bus
+    busier than its target.
+    """
+
+    def __init__(self, conn, poll, decode, pumps, load=None):
+        super().__init__(name='PowerWorld poll', daemon=True)
+        self.conn = conn
+        self.poll = poll
+        self.decode = decode
+        self.pumps = list(pumps)
+        self.load = load or BusLoad()
+        self.messages = collections.deque(maxlen=100)
+        self._jobs = queue.Queue()
+        self._stopping = threading.Event()
+        self._submitted = 0
+        self._turn = 0
+        self.jobs_done = 0
+        self.telemetry = Telemetry(conn)
+        # transport messages are generated on this thread as well
+        conn.log = self.log
+
+    def log(self, msg, *args, level=INFO, key=None):
+        """Queue a message for the plugin's Logger; formatted there, if it is written at all."""
+        self.messages.append((level, msg, args, key))
+
+    def drain_messages(self):
+        while self.messages:
+            yield self.messages.popleft()
+
+    def submit(self, pump, job):
+        """
+        Queue job(conn) for pump to run on the worker thread between requests.
+        Returns a ticket; the job has finished once jobs_done reaches it.
+        """
+        self._submitted += 1
+        self._jobs.put((pump, job))
+        return self._submitted
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._jobs.put(None)  # wake up the thread
+        if self.is_alive():
+            self.join(timeout)
+        self.conn.close()
+
+    def run(self):
+        next_poll = time.monotonic()
+        while not self._stopping.is_set():
+            try:
+                item = self._jobs.get(timeout=max(next_poll - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+            if item is not None:
+                self._run_job(*item)
+                continue
+            if self._stopping.is_set():
+                break
+            try:
+                self.poll_round()
+            except Exception as err:
+                # polling must go on whatever went wrong in one round
+                self.log("PowerWorld poll error: %s", err, level=ERROR, key='poll error')
+            next_poll = min(pump.wake_at() for pump in self.pumps)
+        # do not lose writes that were queued just before shutdown
+        self._run_pending_jobs()
+
+    def poll_round(self):
+        """Probe the pumps whose breaker allows it, then read all due tiers, interleaved."""
+        now = time.monotonic()
+        # start with a different pump every round
+        self._turn = (self._turn + 1) % len(self.pumps)
+        cycles = []
+        for pump in self.pumps[self._turn:] + self.pumps[:self._turn]:
+            if pump.breaker.state != CLOSED:
+                if pump.breaker.probe_due(now):
+                    self.probe(pump)
+                continue
+            # use one scheduler for the whole cycle
+            scheduler = pump.scheduler
+            tiers = scheduler.due(now)
+            if tiers:
+                cycles.append(self._cycle(pump, scheduler, scheduler.plan(tiers), now, tiers))
+        while cycles:
+            for cycle in list(cycles):
+                if next(cycle, None) is None:
+                    cycles.remove(cycle)
+            if self._stopping.is_set():
+                break
+            self._run_pending_jobs()
+
+    def refresh(self, pump, plan, units):
+        """
+        Read plan of pump right away and publish a snapshot for the given Units only.
+        Used after a write, on the worker thread.
+        """
+        for _ in self._cycle(pump, None, plan, time.monotonic(), frozenset(), frozenset(units)):
+            pass
+        return pump.latest.error is None
+
+    def probe(self, pump):
+        """Read one register to find out whether the heat pump answers again."""
+        try:
+            self.poll(self.conn, pump.slave, pump.scheduler.probe_plan() or PROBE_PLAN, pump.image)
+        except Exception as err:
+            self._failed(pump, err)
+            return False
+        pump.breaker.success()
+        self.log("Heat pump %s answers again, polling resumed", pump.slave, key=('answers again', pump.slave))
+        return True
+
+    def _cycle(self, pump, scheduler, plan, started, tiers, units=None):
+        """
+        Generator that reads conn.pipeline blocks of plan per step and, after
+        the last block, stores the snapshot in pump.latest. scheduler is None
+        for a refresh, which does not count as a poll of its tiers.
+        """
+        cpu = 0.0
+        data, values, error = None, None, None
+        decode = 0.0
+        try:
+            plan = list(plan)
+            step = self.conn.pipeline
+            for i in range(0, len(plan), step):
+                cpu -= time.thread_time()
+                self.poll(self.conn, pump.slave, plan[i:i + step], pump.image)
+                now = time.monotonic()
+                for start, count in plan[i:i + step]:
+                    pump.stamps[start:start + count] = array.array('d', [now]) * count
+                cpu += time.thread_time()
+                yield i
+            cpu -= time.thread_time()
+            now = time.monotonic()
+            data = bytes(pump.image)
+            values = self.decode(data)
+            decode = time.monotonic() - now
+            cpu += time.thread_time()
+        except Exception as err:
+            cpu += time.thread_time()
+            data, error = None, str(err)
+        pump.seq += 1
+        snapshot = Snapshot(pump.seq, time.time(), data, values, error, time.monotonic() - started, tiers, units,
+                            cpu, decode)
+        # one image per poll of the fastest tier, so the history covers its slots times that period;
+        # read-backs and the extra rounds of slower tiers are left out
+        if error is None and pump.history is not None and scheduler is not None and scheduler.base_tier in tiers:
+            pump.history.append(snapshot.time, data)
+        self.telemetry.record(snapshot)
+        if error is None:
+            pump.last_good = snapshot
+        pump.latest = snapshot
+        if error is not None:
+            self._failed(pump, error)
+        elif scheduler is not None:
+            self.conn.mark_cycle(pump.slave, snapshot.time)
+            scheduler.scale = self._adapt()
+            scheduler.done(tiers, started)
+            pump.breaker.success()
+
+    def _adapt(self):
+        previous = self.load.scale
+        scale = self.load.update(self.conn.rtt.total, time.monotonic())
+        if abs(scale - previous) >= 0.1:
+            self.log("Bus load %.0f %%, poll periods scaled by %.1f", self.load.load * 100, scale, key='bus load')
+        return scale
+
+    def _failed(self, pump, error):
+        delay = pump.breaker.failure(time.monotonic())
+        if delay is not None:
+            self.log("Heat pump %s not reachable (%s), next attempt in %.0f s", pump.slave, error, delay,
+                     key=('unreachable', pump.slave))
+            # do not keep a half-dead session to the gateway while nobody answers
+            if all(p.breaker.state != CLOSED for p in self.pumps):
+                self.conn.close()
+
+    def _run_pending_jobs(self):
+        while True:
+            try:
+                item = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                self._run_job(*item)
+
+    def _run_job(self, pump, job):
+        if pump.breaker.state != CLOSED:
+            self.log("PowerWorld command dropped: heat pump %s not reachable", pump.slave)
+            self.jobs_done += 1
+            return
+        try:
+            job(self.conn)
+        except Exception as err:
+            self.log("PowerWorld command error: %s", err, level=ERROR)
+        self.jobs_done += 1
@@ -0,0 +1,105 @@
+"""
+Write engine: read-modify-write from the cached register image and batched
+function 0x10 writes.
+"""
+
+import array
+import collections
+import time
+
+from .logger import DEBUG
+from .planner import plan_reads
+from .transport import ModbusException
+
+
+RegisterWrite = collections.namedtuple('RegisterWrite', 'address value set_mask clear_mask',
+                                       defaults=(None, 0, 0))
+RegisterWrite.__doc__ = """
+One register change: either an absolute value, or bits to set/clear in the
+current value of the register.
+"""
+
+
+def adjacent_runs(values):
+    """Split {address: value} into (start, [values]) runs of consecutive addresses."""
+    runs = []
+    for address in sorted(values):
+        if runs and runs[-1][0] + len(runs[-1][1]) == address:
+            runs[-1][1].append(values[address])
+        else:
+            runs.append((address, [values[address]]))
+    return runs
+
+
+class WriteEngine:
+    """
+    Applies RegisterWrites on the worker thread.
+
+    Bit changes take the current register value from the poll image when it
+    was read less than max_age seconds ago, or less than the scheduler
+    allows for a register it polls (a configuration register of the slow
+    tier is as fresh as its period); only stale registers are read first,
+    merged with the scheduler's gap, block size and readable ranges into as
+    few requests as possible. Registers that would not change are skipped,
+    adjacent registers are written with one function 0x10 frame and every
+    write is checked against the device's response. Written values are
+    stored back into the image.
+    """
+
+    def __init__(self, image, stamps, max_age=60, use_fc16=True):
+        self.image = image
+        self.stamps = stamps
+        self.max_age = max_age
+        self.use_fc16 = use_fc16
+
+    def current(self, address):
+        return (self.image[address * 2] << 8) | self.image[address * 2 + 1]
+
+    def store(self, start, values, now):
+        for i, value in enumerate(values):
+            self.image[(start + i) * 2:(start + i) * 2 + 2] = value.to_bytes(2, 'big')
+        self.stamps[start:start + len(values)] = array.array('d', [now]) * len(values)
+
+    def age_limit(self, address, scheduler=None):
+        polled = scheduler.max_age(address) if scheduler is not None else None
+        return self.max_age if polled is None else max(self.max_age, polled)
+
+    def execute(self, conn, slave, writes, scheduler=None):
+        now = time.monotonic()
+        stale = [w.address for w in writes
+                 if w.value is None and now - self.stamps[w.address] > self.age_limit(w.address, scheduler)]
+        if scheduler is not None:
+            plan = plan_reads(stale, scheduler.max_gap, scheduler.max_count, scheduler.readable)
+        else:
+            plan = plan_reads(stale)
+        for start, count in plan:
+            data = conn.read_registers(slave, start, count)
+            self.image[start * 2:(start + count) * 2] = data
+            self.stamps[start:start + count] = array.array('d', [time.monotonic()]) * count
+
+        values = {}
+        for w in writes:
+            if w.value is not None:
+                values[w.address] = int(w.value) & 0xFFFF
+                continue
+            old = self.current(w.address)
+            new = (old | w.set_mask) & ~w.clear_mask & 0xFFFF
+            if new != old:
+                values[w.address] = new
+
+        for start, run in adjacent_runs(values):
+            conn.log("Write: slave %s 0x%04X = %s", slave, start, run, level=DEBUG)
+            if len(run) > 1 and self.use_fc16:
+                try:
+                    conn.write_registers(slave, start, run)
+                    self.store(start, run, time.monotonic())
+                    continue
+                except ModbusException as err:
+                    if err.code != 1:
+                        raise
+                    conn.log("Heat pump does not support function 0x10, using single register writes")
+                    self.use_fc16 = False
+            for i, value in enumerate(run):
+                conn.write_register(slave, start + i, value)
+                self.store(start + i, [value], time.monotonic())
+        return values
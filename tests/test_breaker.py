@@ -0,0 +1,63 @@
+from powerworld.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def breaker(**kwargs):
+    return CircuitBreaker(jitter=0.0, **kwargs)
+
+
+def test_opens_on_failure():
+    b = breaker(delay=5, max_delay=300)
+    assert b.failure(100.0) == 5
+    assert b.state == OPEN
+    assert b.retry_at == 105.0
+
+
+def test_threshold():
+    b = breaker(threshold=3)
+    assert b.failure(0.0) is None
+    assert b.failure(0.0) is None
+    assert b.state == CLOSED
+    assert b.failure(0.0) is not None
+    assert b.state == OPEN
+
+
+def test_probe_due():
+    b = breaker(delay=5)
+    b.failure(100.0)
+    assert not b.probe_due(104.9)
+    assert b.state == OPEN
+    assert b.probe_due(105.0)
+    assert b.state == HALF_OPEN
+    assert not b.probe_due(106.0)
+
+
+def test_failed_probe_doubles_delay():
+    b = breaker(delay=5, max_delay=30)
+    delays = []
+    for _ in range(5):
+        delays.append(b.failure(0.0))
+        b.probe_due(float('inf'))
+    assert delays == [5, 10, 20, 30, 30]
+
+
+def test_success_closes_and_resets():
+    b = breaker(delay=5)
+    b.failure(0.0)
+    b.failure(0.0)
+    b.probe_due(100.0)
+    b.success()
+    assert b.state == CLOSED
+    assert b.failure(200.0) == 5
+
+
+def test_long_outage():
+    b = breaker(delay=5, max_delay=300)
+    for _ in range(5000):
+        delay = b.failure(0.0)
+    assert delay == 300
+
+
+def test_jitter_bounds():
+    b = CircuitBreaker(delay=10, max_delay=10, jitter=0.2)
+    for _ in range(100):
+        assert 8 <= b.failure(0.0) <= 12
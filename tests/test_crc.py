@@ -0,0 +1,27 @@
+from powerworld.crc import add_crc, check_crc, crc16
+
+
+def test_check_value():
+    # CRC-16/MODBUS check value over "123456789"
+    assert crc16(b'123456789') == 0x4B37
+
+
+def test_request_frame():
+    # read 10 holding registers from 0x0000 of slave 1
+    assert add_crc(bytes.fromhex('01030000000A')) == bytes.fromhex('01030000000AC5CD')
+
+
+def test_continued_over_pieces():
+    frame = add_crc(bytes.fromhex('010304000100020003'))
+    crc = 0xFFFF
+    for i in range(0, len(frame), 3):
+        crc = crc16(memoryview(frame)[i:i + 3], crc)
+    assert crc == 0
+    assert crc16(frame[5:], crc16(frame[:5])) == crc16(frame)
+
+
+def test_check_crc():
+    frame = add_crc(b'\x01\x06\x00\x3F\x00\x01')
+    assert check_crc(frame)
+    assert not check_crc(frame[:-1] + bytes([frame[-1] ^ 1]))
+    assert not check_crc(b'\xFF')
@@ -0,0 +1,145 @@
+import pytest
+
+from powerworld.faults import FAULT_VALUES, NO_FAULTS, FaultIndex
+
+
+# ---------- previous implementation, kept here as the reference ----------
+
+def legacy_interpret_errors(f1, f2, f3, f4, f5, f6, f7):
+    level = 1
+    text = "None"
+
+    def bit(v, b):
+        return (int(v) >> b) & 0x1 == 1
+
+    if f1 != 0:
+        level = 4
+        if bit(f1, 0):
+            text = 'Er 14 Water tank temperature failure'
+        elif bit(f1, 1):
+            text = 'Er 21 Ambient temperature failure'
+        elif bit(f1, 2):
+            text = 'Er 16 Evaporator coil temperature failure'
+        elif bit(f1, 4):
+            text = 'Er 27 Water outlet temperature failure'
+        elif bit(f1, 5):
+            text = 'Er 05 High pressure fault'
+        elif bit(f1, 6):
+            text = 'Er 06 Low pressure fault'
+        else:
+            level, text = 3, 'Unknown error (1)'
+
+    if f2 != 0:
+        level = 4
+        if bit(f2, 0):
+            text = 'Er 03 Water flow fault'
+        elif bit(f2, 2):
+            text = 'Er 32 Heating outlet water temperature too high'
+        else:
+            level, text = 3, 'Unknown error (2)'
+
+    if f3 != 0:
+        if bit(f3, 1):
+            level, text = 4, 'Er 18 Exhaust gas temperature failure'
+
+    if f4 != 0:
+        level = 4
+        if bit(f4, 0):
+            text = 'Er 15 Water inlet temperature failure'
+        elif bit(f4, 1):
+            text = 'Er 12 Exhaust gas too high protection'
+        elif bit(f4, 5):
+            text = 'Er 23 Cooling outlet water overcooling'
+        elif bit(f4, 6):
+            text = 'Er 29 Suction gas temperature failure'
+        else:
+            level, text = 3, 'Unknown error (4)'
+
+    if f5 != 0:
+        level = 4
+        if bit(f5, 0):
+            text = 'Er 69 Pressure too low protection'
+        elif bit(f5, 2):
+            text = 'Er 33 Evaporator coil temperature too high'
+        elif bit(f5, 3):
+            text = 'Er 42 Cooling pipe temperature sensor fault'
+        elif bit(f5, 5):
+            text = 'Er 72 DC fan communication fault'
+        elif bit(f5, 7):
+            text = 'Er 67 Low pressure sensor fault'
+        else:
+            level, text = 3, 'Unknown error (5)'
+
+    if f6 != 0:
+        if bit(f6, 4):
+            level, text = 2, 'Secondary anti-freezing'
+        elif bit(f6, 5):
+            level, text = 2, 'Level 1 anti-freezing'
+        else:
+            level, text = 3, 'Unknown error (6)'
+
+    if f7 != 0:
+        level = 4
+        if bit(f7, 4):
+            text = 'Er 10 communication fault with frequency module'
+        elif bit(f7, 5):
+            text = 'Er 66 DC fan 2 fault'
+        elif bit(f7, 6):
+            text = 'Er 64 DC fan 1 fault'
+        else:
+            level, text = 3, 'Unknown error (7)'
+
+    return level, text
+
+
+# ---------------------------------------------------------------------------
+
+def words(**set_words):
+    values = dict.fromkeys(FAULT_VALUES, 0)
+    values.update(set_words)
+    return values
+
+
+def test_no_faults():
+    assert FaultIndex().decode(words()) is NO_FAULTS
+
+
+@pytest.mark.parametrize('register', range(7))
+@pytest.mark.parametrize('bit', range(16))
+def test_single_bit_as_legacy(register, bit):
+    """With one fault bit set the index reports what the previous code did."""
+    fault_words = [0] * 7
+    fault_words[register] = 1 << bit
+    active = FaultIndex().decode(dict(zip(FAULT_VALUES, fault_words)))
+    assert (active.level, active.text) == legacy_interpret_errors(*fault_words)
+
+
+@pytest.mark.parametrize('register', range(7))
+def test_several_bits_of_one_register(register):
+    """The fault the previous code reported is among the ones the index reports, at the highest level."""
+    index = FaultIndex()
+    for word in range(1, 0x100):
+        fault_words = [0] * 7
+        fault_words[register] = word
+        active = index.decode(dict(zip(FAULT_VALUES, fault_words)))
+        level, text = legacy_interpret_errors(*fault_words)
+        if level == 1:
+            assert active is NO_FAULTS
+        else:
+            assert text in active.text.split(', ')
+            assert active.level == max(fault.severity for fault in active.faults)
+
+
+def test_all_active_reported():
+    active = FaultIndex().decode(words(fault_1=0x01, fault_2=0x01, fault_6=0x10))
+    assert active.level == 4
+    assert active.text == ('Er 14 Water tank temperature failure, Er 03 Water flow fault, '
+                           'Secondary anti-freezing')
+    assert active.anti_freezing
+
+
+def test_unchanged_words_not_decoded_again():
+    index = FaultIndex()
+    first = index.decode(words(fault_4=0x02))
+    assert index.decode(words(fault_4=0x02)) is first
+    assert index.decode(words()) is NO_FAULTS
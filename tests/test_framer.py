@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from powerworld.crc import add_crc
+from powerworld.transport import ModbusException, RtuFramer
+
+
+RESPONSE = add_crc(bytes.fromhex('0103040001FFFE'))
+
+
+def feed(*pieces):
+    """recv_into that returns the pieces one per call, then 0 (connection closed)."""
+    pieces = list(pieces)
+
+    def recv_into(view, timeout):
+        if not pieces:
+            return 0
+        piece = pieces.pop(0)
+        view[:len(piece)] = piece
+        return len(piece)
+    return recv_into
+
+
+def read(*pieces, slave=1, function=3):
+    framer = RtuFramer()
+    return framer, framer.read(feed(*pieces), slave, function, time.monotonic() + 1)
+
+
+def test_whole_frame():
+    framer, frame = read(RESPONSE)
+    assert frame == RESPONSE
+    assert framer.stats == {'fragmented': 0, 'crc_errors': 0, 'stray_bytes': 0}
+
+
+def test_fragments():
+    framer, frame = read(*(RESPONSE[i:i + 1] for i in range(len(RESPONSE))))
+    assert frame == RESPONSE
+    assert framer.stats['fragmented'] == 1
+
+
+def test_stray_bytes_before_frame():
+    framer, frame = read(b'\x00\x7F' + RESPONSE[:4], RESPONSE[4:])
+    assert frame == RESPONSE
+    assert framer.stats['stray_bytes'] == 2
+
+
+def test_bad_crc_skipped():
+    corrupt = RESPONSE[:-1] + bytes([RESPONSE[-1] ^ 0xFF])
+    framer, frame = read(corrupt, RESPONSE)
+    assert frame == RESPONSE
+    assert framer.stats['crc_errors'] == 1
+
+
+def test_exception_response():
+    with pytest.raises(ModbusException) as info:
+        read(add_crc(b'\x01\x83\x02'))
+    assert info.value.function == 3
+    assert info.value.code == 2
+
+
+def test_other_slave_ignored():
+    other = add_crc(bytes.fromhex('0203020005'))
+    framer, frame = read(other + RESPONSE)
+    assert frame == RESPONSE
+
+
+def test_closed_mid_frame():
+    with pytest.raises(ConnectionError):
+        read(RESPONSE[:4])
+
+
+def test_deadline():
+    framer = RtuFramer()
+    with pytest.raises(TimeoutError):
+        framer.read(feed(RESPONSE[:4]), 1, 3, time.monotonic() - 1)
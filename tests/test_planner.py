@@ -0,0 +1,50 @@
+from powerworld.planner import MAX_READ_COUNT, Scheduler, affected, plan_reads
+from powerworld.registers import REGISTERS
+
+
+def test_merge_within_gap():
+    assert plan_reads({0x0E, 0x12, 0x11, 0x40}, max_gap=8) == [(0x0E, 5), (0x40, 1)]
+
+
+def test_gap_too_wide():
+    assert plan_reads({0x00, 0x0A}, max_gap=8) == [(0x00, 1), (0x0A, 1)]
+    assert plan_reads({0x00, 0x09}, max_gap=8) == [(0x00, 10)]
+
+
+def test_max_count():
+    assert plan_reads(range(10), max_gap=8, max_count=4) == [(0, 4), (4, 4), (8, 2)]
+    assert plan_reads(range(200), max_count=500)[0] == (0, MAX_READ_COUNT)
+
+
+def test_not_merged_across_unreadable():
+    readable = [(0x00, 0x10), (0x11, 0x100)]
+    assert plan_reads({0x0E, 0x12}, max_gap=8, readable=readable) == [(0x0E, 1), (0x12, 1)]
+    assert plan_reads({0x0E, 0x0F}, max_gap=8, readable=readable) == [(0x0E, 2)]
+    assert plan_reads({0x12, 0x16}, max_gap=8, readable=readable) == [(0x12, 5)]
+
+
+def test_empty():
+    assert plan_reads(()) == []
+
+
+def test_affected():
+    # unit_state (0x3F) and operation_mode (0x43) both feed Unit 1
+    addresses, units = affected(REGISTERS, {0x3F})
+    assert units == {1}
+    assert addresses == {0x3F, 0x43}
+
+
+def test_scheduler_probe_plan():
+    periods = {'fast': 10, 'normal': 30, 'slow': 600}
+    scheduler = Scheduler(REGISTERS, {1, 36}, periods)
+    assert scheduler.base_tier == 'normal'
+    assert scheduler.probe_plan() == ((0x3F, 1),)
+    scheduler = Scheduler(REGISTERS, set(), periods, readable=[(0x10, 0x20)])
+    assert scheduler.probe_plan() == ((0x10, 1),)
+    assert Scheduler(REGISTERS, set(), periods).probe_plan() is None
+
+
+def test_scheduler_max_age():
+    scheduler = Scheduler(REGISTERS, {36}, {'fast': 10, 'normal': 30, 'slow': 600})
+    assert scheduler.max_age(0x40) == 610
+    assert scheduler.max_age(0x3F) is None
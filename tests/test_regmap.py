@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from powerworld.registers import REGISTER_SPACE, REGISTERS
+from powerworld.regmap import dump_register_map, load_register_map, merge_ranges
+
+
+def test_merge_ranges():
+    assert merge_ranges([(10, 5), (0, 4), (4, 2), (12, 10)]) == [(0, 6), (10, 12)]
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'map.json'
+    dump_register_map(path, [(0, REGISTER_SPACE)], REGISTERS)
+    registers, readable, absent = load_register_map(path)
+    assert registers == REGISTERS
+    assert readable == [(0, REGISTER_SPACE)]
+    assert absent == frozenset()
+
+
+def test_absent_registers(tmp_path):
+    path = tmp_path / 'map.json'
+    boiler = next(reg for reg in REGISTERS if reg.name == 'boiler_temp')
+    readable = [(0, boiler.address), (boiler.address + 1, REGISTER_SPACE - boiler.address - 1)]
+    dump_register_map(path, readable, [reg for reg in REGISTERS if reg is not boiler], ['boiler_temp'])
+    registers, loaded, absent = load_register_map(path)
+    assert absent == {'boiler_temp'}
+    assert loaded == readable
+    by_name = {reg.name: reg for reg in registers}
+    assert by_name['boiler_temp'].units == ()
+    assert by_name['water_in_temp'] == next(reg for reg in REGISTERS if reg.name == 'water_in_temp')
+
+
+def test_unlisted_unreadable_register_is_absent(tmp_path):
+    path = tmp_path / 'map.json'
+    path.write_text(json.dumps({'readable': [[0, 0x100]], 'registers': []}))
+    registers, readable, absent = load_register_map(path)
+    assert absent == {'pump_target', 'pump_cycle'}
+
+
+def test_moved_register(tmp_path):
+    path = tmp_path / 'map.json'
+    path.write_text(json.dumps({'registers': [{'name': 'ambient_temp', 'address': 0x120}]}))
+    registers, readable, absent = load_register_map(path)
+    ambient = next(reg for reg in registers if reg.name == 'ambient_temp')
+    assert ambient.address == 0x120
+    assert ambient.signed and ambient.units
+    assert readable is None
+
+
+def test_listed_register_not_readable(tmp_path):
+    path = tmp_path / 'map.json'
+    path.write_text(json.dumps({'readable': [[0, 0x10]], 'registers': [{'name': 'ambient_temp', 'address': 0x11}]}))
+    with pytest.raises(ValueError, match='not readable'):
+        load_register_map(path)
+
+
+@pytest.mark.parametrize('content', ['{', '{"registers": [{"name": "new_value"}]}',
+                                     '{"registers": [{"name": "fan1", "colour": 1}]}'])
+def test_invalid(tmp_path, content):
+    path = tmp_path / 'map.json'
+    path.write_text(content)
+    with pytest.raises(ValueError):
+        load_register_map(path)
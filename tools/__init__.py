@@ -0,0 +1,4 @@
+"""
+Development tools for the PowerWorld plugin. Run from the plugin folder,
+e.g. python3 -m tools.bench_decoder
+"""
@@ -0,0 +1,93 @@
+"""
+Offline analysis of captured poll cycles: per-day figures, COP against
+ambient temperature, compressor frequency distribution and fault timeline.
+Needs NumPy (pip3 install numpy); the plugin does not.
+
+    python3 -m tools.analyze powerworld_capture.bin.1 powerworld_capture.bin [--save samples.npy] [--csv daily.csv]
+    python3 -m tools.analyze samples.npy
+
+Converting captures is the slow part; --save keeps the samples as a compact
+.npy file that later runs load (memory-mapped) in no time.
+"""
+
+import argparse
+import csv
+import datetime
+import time
+
+import numpy as np
+
+from powerworld.analysis import DAILY, cop_by_ambient, daily, decode, fault_changes, freq_distribution, load_captures
+
+
+def load(paths):
+    if len(paths) == 1 and paths[0].endswith('.npy'):
+        return np.load(paths[0], mmap_mode='r')
+    return load_captures(paths)
+
+
+def write_csv(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(DAILY.names)
+        for row in rows:
+            values = [row[name].item() for name in DAILY.names[1:]]
+            writer.writerow([str(row['day'])] + [round(v, 3) if isinstance(v, float) else v for v in values])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='capture files (oldest first) or one .npy file saved before')
+    parser.add_argument('--save', help='write the samples to this .npy file')
+    parser.add_argument('--csv', help='write the per-day figures to this CSV file')
+    parser.add_argument('--slave', type=int, help='only this slave ID')
+    parser.add_argument('--utc-offset', type=float, help='hours added to UTC to split days (default: local time)')
+    parser.add_argument('--max-gap', type=float, default=120.0,
+                        help='seconds without a sample after which time stops counting for hours and energy')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    samples = load(args.paths)
+    loaded = time.perf_counter()
+    if args.slave is not None:
+        samples = samples[samples['slave'] == args.slave]
+    if args.save:
+        np.save(args.save, samples)
+    if not len(samples):
+        print("no poll cycles found")
+        return
+    offset = args.utc_offset * 3600 if args.utc_offset is not None else time.localtime().tm_gmtoff
+    values = decode(samples)
+    rows = daily(samples, values, offset, args.max_gap)
+    bands, band_samples, cop = cop_by_ambient(values)
+    freqs, freq_samples = freq_distribution(values)
+    changes = fault_changes(samples)
+    done = time.perf_counter()
+
+    print(f"{len(samples)} poll cycles, loaded in {loaded - started:.2f} s, analysed in {done - loaded:.2f} s")
+    print()
+    print(f"{'day':<10} {'slave':>5} {'samples':>7} {'run h':>6} {'amb':>6} {'min':>6} {'max':>6} "
+          f"{'COP':>5} {'Hz':>5} {'maxHz':>5} {'defr':>4} {'flt h':>6} {'kWh':>7}")
+    for row in rows:
+        print(f"{str(row['day']):<10} {row['slave']:>5} {row['samples']:>7} {row['running_h']:>6.1f} "
+              f"{row['ambient_mean']:>6.1f} {row['ambient_min']:>6.1f} {row['ambient_max']:>6.1f} "
+              f"{row['cop_mean']:>5.2f} {row['comp_freq_mean']:>5.1f} {row['comp_freq_max']:>5} "
+              f"{row['defrosts']:>4} {row['fault_h']:>6.2f} {row['energy_kwh']:>7.2f}")
+    print()
+    print("COP by ambient temperature (compressor running):")
+    for band, n, value in zip(bands, band_samples, cop):
+        print(f"  {band:>5.0f} .. {band + 2:>3.0f} C: {value:5.2f} ({n} samples)")
+    print("Compressor frequency (running):")
+    total = max(int(freq_samples.sum()), 1)
+    for freq, n in zip(freqs, freq_samples):
+        print(f"  {freq:>3} .. {freq + 10:>3} Hz: {n / total * 100:5.1f} %")
+    print(f"Fault word changes: {len(changes)}")
+    for t, slave, address, old, new in changes[-20:]:
+        stamp = datetime.datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"  {stamp} slave {slave} 0x{address:04X}: 0x{old:04X} -> 0x{new:04X}")
+    if args.csv:
+        write_csv(rows, args.csv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark: built-in CRC-16/Modbus and cached request frames against
+the modbus-crc package (skipped if it is not installed).
+
+    python3 -m tools.bench_crc [--number N]
+"""
+
+import argparse
+import random
+import struct
+import timeit
+
+from powerworld.crc import add_crc, check_crc
+from powerworld.planner import plan_reads
+from powerworld.registers import REGISTERS
+
+try:
+    import modbus_crc
+except ImportError:
+    modbus_crc = None
+
+
+def read_requests(slave=1):
+    """The read request frames (without CRC) of a full poll."""
+    blocks = plan_reads(sorted({reg.address for reg in REGISTERS}))
+    return [bytes((slave,)) + struct.pack('>BHH', 3, start, count) for start, count in blocks]
+
+
+def sample_response(words=120, seed=1):
+    rnd = random.Random(seed)
+    pdu = struct.pack(f'>BB{words}H', 3, words * 2, *(rnd.randrange(0, 2000) for _ in range(words)))
+    return bytes((1,)) + pdu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    requests = read_requests()
+    response = add_crc(sample_response())
+    frames = {}
+    for request in requests:
+        frames[request] = add_crc(request)
+
+    cases = [
+        ('build requests', lambda: [add_crc(r) for r in requests]),
+        ('cached requests', lambda: [frames[r] for r in requests]),
+        (f'check {len(response)}B', lambda: check_crc(response)),
+    ]
+    if modbus_crc is not None:
+        mismatch = [r.hex() for r in requests if modbus_crc.add_crc(r) != add_crc(r)]
+        print(f"frames differing from modbus-crc: {mismatch or 'none'}")
+        cases += [
+            ('modbus-crc build', lambda: [modbus_crc.add_crc(r) for r in requests]),
+            (f'modbus-crc {len(response)}B', lambda: modbus_crc.check_crc(response)),
+        ]
+    else:
+        print("modbus-crc not installed, comparing the built-in paths only")
+
+    print(f"{len(requests)} read requests per full poll")
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=args.number, repeat=5))
+        print(f"{name:>18}: {best / args.number * 1e6:8.2f} us")
+
+
+if __name__ == '__main__':
+    main()
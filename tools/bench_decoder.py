@@ -0,0 +1,120 @@
+"""
+Micro-benchmark: compiled register decoder against the previous hex-string path.
+
+    python3 -m tools.bench_decoder [--number N]
+"""
+
+import argparse
+import random
+import struct
+import timeit
+
+from powerworld.registers import REGISTERS, REGISTER_SPACE, Decoder, frequency_mode
+
+
+# ---------- previous implementation, kept here as the reference ----------
+
+def legacy_get_single_data(inputstring, startaddress, factor):
+    start = int(startaddress, 16) * 4
+    end = start + 4
+    out_hex = inputstring[start:end]
+    value = int(out_hex, 16)
+    if factor > 0:
+        value = round(value * factor, 1)
+    if value > 65280:
+        value = value - 65535
+    return value
+
+
+def legacy_bit(x, bit_number):
+    return (int(x) >> bit_number) & 0x1
+
+
+def legacy_decode(image):
+    raw_data = image.hex().upper()
+    g = legacy_get_single_data
+    out = {}
+    out['unit_state'] = legacy_bit(g(raw_data, '003F', 0), 0)
+    out['operation_mode'] = g(raw_data, '0043', 0)
+    out['water_in_temp'] = round(g(raw_data, '000E', 0.10), 1)
+    out['water_out_temp'] = round(g(raw_data, '0012', 0.10), 1)
+    out['ambient_temp'] = round(g(raw_data, '0011', 0.50), 1)
+    out['boiler_temp'] = round(g(raw_data, '000F', 0.10), 1)
+    out['suction_gas_temp'] = g(raw_data, '0015', 0)
+    out['evap_temp'] = g(raw_data, '0016', 0)
+    out['internal_temp'] = g(raw_data, '001A', 0)
+    out['discharge_temp'] = g(raw_data, '001B', 0)
+    out['low_press_conv_temp'] = round(g(raw_data, '0028', 0.10), 1)
+    out['hot_water_sp'] = g(raw_data, '00BE', 0)
+    out['heating_sp'] = g(raw_data, '00C0', 0)
+    out['fan1'] = g(raw_data, '0026', 0)
+    out['fan2'] = g(raw_data, '0027', 0)
+    out['cop'] = round(g(raw_data, '0037', 0.10), 1)
+    out['water_pump_speed'] = round(g(raw_data, '002A', 0.10), 1)
+    out['three_way'] = legacy_bit(g(raw_data, '0005', 0), 6)
+    out['elec_boiler'] = legacy_bit(g(raw_data, '0005', 0), 7)
+    out['dc_bus'] = g(raw_data, '0021', 0)
+    out['comp_freq'] = g(raw_data, '001E', 0)
+    out['comp_current'] = g(raw_data, '0023', 0)
+    out['comp_power'] = g(raw_data, '002E', 0)
+    out['low_press_val'] = round(g(raw_data, '002B', 0.01), 2)
+    out['defrosting'] = legacy_bit(g(raw_data, '0003', 0), 7)
+    out['mains_voltage'] = g(raw_data, '0031', 0)
+    out['cons_current'] = round(g(raw_data, '0032', 0.10), 1)
+    out['cons_power'] = g(raw_data, '0035', 0)
+    out['waterflow'] = round(g(raw_data, '0030', 0.01), 2)
+    out['pump_target'] = g(raw_data, '015B', 0)
+    out['pump_cycle'] = g(raw_data, '015C', 0)
+    out['chassis_heat'] = legacy_bit(g(raw_data, '0005', 0), 0)
+    out['crank_heat'] = legacy_bit(g(raw_data, '0006', 0), 1)
+    for i, address in enumerate(('0007', '0008', '0009', '000A', '000B', '000C', '000D')):
+        out[f'fault_{i + 1}'] = g(raw_data, address, 0)
+    freq = 10
+    if legacy_bit(g(raw_data, '0040', 0), 4) == 1:
+        freq = 20
+    if legacy_bit(g(raw_data, '0040', 0), 5) == 1:
+        freq = 30
+    if legacy_bit(g(raw_data, '0041', 0), 1) == 1:
+        freq = 40
+    out['freq_mode'] = freq
+    return out
+
+
+# ---------------------------------------------------------------------------
+
+def sample_image(seed=1):
+    rnd = random.Random(seed)
+    words = [rnd.randrange(0, 2000) for _ in range(REGISTER_SPACE)]
+    words[0x11] = -14 & 0xFFFF   # -7.0 C ambient, exercises the sign handling
+    return struct.pack(f'>{REGISTER_SPACE}H', *words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    image = sample_image()
+    decoder = Decoder(REGISTERS)
+
+    def compiled():
+        values = decoder.decode(image)
+        values['freq_mode'] = frequency_mode(values)
+        return values
+
+    old = legacy_decode(image)
+    new = compiled()
+    differences = sorted(k for k in old if old[k] != new[k])
+    print(f"values differing from the legacy path: {differences or 'none'}")
+    print(f"  ambient_temp legacy={old['ambient_temp']} compiled={new['ambient_temp']}")
+
+    results = {}
+    for name, fn in (('legacy hex', lambda: legacy_decode(image)), ('compiled', compiled)):
+        best = min(timeit.repeat(fn, number=args.number, repeat=5))
+        results[name] = best / args.number * 1e6
+        print(f"{name:>12}: {results[name]:8.2f} us per cycle")
+    print(f"     speedup: {results['legacy hex'] / results['compiled']:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Sweep the register space of a heat pump, watch which registers change and
+write a register map that the plugin can load (option register_map).
+
+    python3 -m tools.discover --host 192.168.1.50 --port 1470 --slave 1 --end 0x200 --out powerworld_map.json
+    python3 -m tools.discover --protocol serial --serial-port /dev/ttyUSB0 --samples 60 --interval 5
+
+The space is read in blocks of up to --max-block registers. Where the heat
+pump rejects a block with "illegal data address", the start and end of
+the unreadable stretch are found by bisection; what answers is merged
+into ranges, and the snapshots after the sweep read those ranges in as
+few requests as possible. While sampling, every changed register is printed
+with the bits that toggled; type a note and Enter to mark a moment (e.g.
+"DHW on") in the output, to line up changes with what you did on the unit.
+"""
+
+import argparse
+import select
+import sys
+import time
+
+from powerworld.planner import MAX_READ_COUNT
+from powerworld.regmap import dump_register_map, merge_ranges
+from powerworld.registers import REGISTERS
+from powerworld.rs485 import SerialConnection
+from powerworld.transport import GatewayConnection, ModbusException, ModbusTcpConnection
+
+
+def sweep(conn, slave, start, end, max_block=MAX_READ_COUNT):
+    """
+    Read [start, end) and return (readable ranges, {address: value}, requests).
+
+    A block rejected with exception 2 (or 3, which some firmware returns for
+    a count reaching past the map) holds a hole. Its first unreadable
+    register is found by bisecting the readable part in front of it, and
+    the end of the hole by probing single registers at doubling distances
+    and bisecting between the last one rejected and the first one that
+    answers; everything in between is taken as unreadable. A hole costs
+    about log2(max_block) + 2 * log2(its length) requests, not one per
+    register. The sweep continues with a new block after the hole.
+    """
+    readable = []
+    values = {}
+    requests = 0
+
+    def read(first, count, keep=True):
+        nonlocal requests
+        requests += 1
+        try:
+            data = conn.read_registers(slave, first, count)
+        except ModbusException as err:
+            if err.code not in (2, 3):
+                raise
+            return False
+        if keep:
+            readable.append((first, count))
+            for i in range(count):
+                values[first + i] = int.from_bytes(data[i * 2:i * 2 + 2], 'big')
+        return True
+
+    address = start
+    while address < end:
+        count = min(max_block, end - address)
+        if read(address, count):
+            address += count
+            continue
+        # [address, address + low) answers, [address, address + high) does not
+        low, high = 0, count
+        while high - low > 1:
+            middle = (low + high) // 2
+            if read(address + low, middle - low):
+                low = middle
+            else:
+                high = middle
+        # address + low is the first unreadable register; look for the next one that answers
+        last, step = address + low, 1
+        address = end
+        while last < end - 1:
+            probe = min(last + step, end - 1)
+            if read(probe, 1, keep=False):
+                while probe - last > 1:
+                    middle = (last + probe) // 2
+                    if read(middle, 1, keep=False):
+                        probe = middle
+                    else:
+                        last = middle
+                address = probe
+                break
+            last, step = probe, step * 2
+    return merge_ranges(readable), values, requests
+
+
+def snapshot_plan(readable, max_block=MAX_READ_COUNT):
+    """The readable ranges cut into the fewest blocks of at most max_block registers."""
+    return [(a, min(max_block, start + count - a)) for start, count in readable
+            for a in range(start, start + count, max_block)]
+
+
+def read_snapshot(conn, slave, plan):
+    values = {}
+    for (start, count), data in zip(plan, conn.read_blocks(slave, plan)):
+        for i in range(count):
+            values[start + i] = int.from_bytes(data[i * 2:i * 2 + 2], 'big')
+    return values
+
+
+def read_marks():
+    """Lines typed on the terminal since the last call."""
+    marks = []
+    while sys.stdin.isatty() and select.select([sys.stdin], [], [], 0)[0]:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        marks.append(line.strip())
+    return marks
+
+
+def watch(conn, slave, plan, first, samples, interval):
+    """Take samples snapshots and print the changes; returns {address: (changes, toggled bits, last value)}."""
+    seen = {address: [0, 0, value] for address, value in first.items()}
+    names = {reg.address: reg.name for reg in REGISTERS}
+    for _ in range(samples):
+        time.sleep(interval)
+        stamp = time.strftime('%H:%M:%S')
+        for mark in read_marks():
+            print(f"{stamp} --- {mark}")
+        for address, value in read_snapshot(conn, slave, plan).items():
+            entry = seen[address]
+            if value != entry[2]:
+                toggled = value ^ entry[2]
+                bits = ' '.join(f"{'+' if value >> b & 1 else '-'}{b}" for b in range(16) if toggled >> b & 1)
+                print(f"{stamp} 0x{address:04X} {names.get(address, ''):<20} {entry[2]:>5} -> {value:>5}  bits {bits}")
+                entry[0] += 1
+                entry[1] |= toggled
+                entry[2] = value
+    return seen
+
+
+def connect(args):
+    log = lambda msg, *args, **kw: print(msg % args if args else msg, file=sys.stderr)
+    if args.protocol == 'serial':
+        return SerialConnection(args.serial_port, args.baud, args.parity, args.stopbits, args.timeout, log=log)
+    if args.protocol == 'tcp':
+        return ModbusTcpConnection(args.host, args.port, args.timeout, log=log, pipeline=args.pipeline)
+    return GatewayConnection(args.host, args.port, args.timeout, log=log)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--protocol', choices=('rtu', 'tcp', 'serial'), default='rtu',
+                        help='rtu = Modbus RTU over TCP, tcp = Modbus TCP, serial = RS-485 adapter')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1470)
+    parser.add_argument('--serial-port', default='/dev/ttyUSB0')
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--parity', default='N')
+    parser.add_argument('--stopbits', type=int, default=1)
+    parser.add_argument('--pipeline', type=int, default=4, help='Modbus TCP: requests in flight at once')
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--slave', type=int, default=1)
+    parser.add_argument('--start', type=lambda v: int(v, 0), default=0)
+    parser.add_argument('--end', type=lambda v: int(v, 0), default=0x200, help='first address not swept')
+    parser.add_argument('--max-block', type=int, default=MAX_READ_COUNT)
+    parser.add_argument('--samples', type=int, default=0, help='snapshots to take after the sweep')
+    parser.add_argument('--interval', type=float, default=5.0, help='seconds between snapshots')
+    parser.add_argument('--out', help='write the register map to this file')
+    args = parser.parse_args()
+
+    conn = connect(args)
+    try:
+        started = time.monotonic()
+        readable, values, requests = sweep(conn, args.slave, args.start, args.end, args.max_block)
+        plan = snapshot_plan(readable, args.max_block)
+        print(f"Swept 0x{args.start:04X}-0x{args.end - 1:04X} in {requests} requests "
+              f"({time.monotonic() - started:.1f} s); a snapshot takes {len(plan)} requests")
+        for start, count in readable:
+            print(f"  readable 0x{start:04X}-0x{start + count - 1:04X} ({count} registers)")
+        for reg in REGISTERS:
+            if reg.address not in values:
+                print(f"  {reg.name} (0x{reg.address:04X}) is not readable, marked absent; check its address for this firmware")
+        seen = watch(conn, args.slave, plan, values, args.samples, args.interval) if args.samples else {}
+    finally:
+        conn.close()
+
+    observed = []
+    for address, value in sorted(values.items()):
+        changes, toggled, last = seen.get(address, (0, 0, value))
+        if value or changes:
+            observed.append({'address': address, 'value': last, 'changes': changes,
+                             'bits': [b for b in range(16) if toggled >> b & 1]})
+    if args.out:
+        known = [reg for reg in REGISTERS if reg.address in values]
+        absent = [reg.name for reg in REGISTERS if reg.address not in values]
+        dump_register_map(args.out, readable, known, absent, observed)
+        print(f"Register map written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+End-to-end benchmark: runs the real BasePlugin against the simulator.
+
+Domoticz, Devices and Parameters are replaced by small stand-ins so the
+plugin runs outside Domoticz. The heartbeat is called at a fast, fixed rate
+and the tier periods are shortened through the Options parameter, so a
+few seconds cover many poll cycles.
+
+    python3 -m tools.harness --duration 10 --latency 0.02 --fragment 0.3
+"""
+
+import argparse
+import importlib
+import json
+import sys
+import time
+import types
+
+from tools.simulator import HeatPumpModel, Simulator
+
+
+class StubDevice:
+    def __init__(self, devices, Name, Unit, Type=0, Subtype=0, Switchtype=0, Image=0, Options=None, Used=0,
+                 **kwargs):
+        self._devices = devices
+        self.Name = Name
+        self.Unit = Unit
+        self.Type = Type
+        self.SubType = Subtype
+        self.SwitchType = Switchtype
+        self.Image = Image
+        self.Options = Options or {}
+        self.Used = Used
+        self.nValue = 0
+        self.sValue = ''
+        self.TimedOut = 0
+        self.updates = 0
+
+    def Create(self):
+        self._devices[self.Unit] = self
+
+    def Update(self, nValue=0, sValue='', TimedOut=0, **kwargs):
+        self.nValue = nValue
+        self.sValue = sValue
+        self.TimedOut = TimedOut
+        self.updates += 1
+
+    def Refresh(self):
+        pass
+
+    def Delete(self):
+        self._devices.pop(self.Unit, None)
+
+
+def stub_domoticz(devices, log):
+    """Module object standing in for the Domoticz API."""
+    module = types.ModuleType('Domoticz')
+    module.Log = module.Status = lambda msg: log.append(('log', msg))
+    module.Error = lambda msg: log.append(('error', msg))
+    module.Debug = lambda msg: log.append(('debug', msg))
+    module.Heartbeat = lambda seconds: log.append(('heartbeat', seconds))
+    module.Device = lambda **kwargs: StubDevice(devices, **kwargs)
+    stored = {}
+
+    def configuration(new=None):
+        if new is not None:
+            stored.clear()
+            stored.update(new)
+        return dict(stored)
+
+    module.Configuration = configuration
+    return module
+
+
+def load_plugin(devices, parameters, log):
+    """Import plugin.py with the stand-ins installed, as Domoticz would."""
+    sys.modules['Domoticz'] = stub_domoticz(devices, log)
+    sys.modules.pop('plugin', None)
+    plugin = importlib.import_module('plugin')
+    plugin.Devices = devices
+    plugin.Parameters = parameters
+    return plugin
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(args):
+    slaves = [int(slave) for slave in args.slaves.split(',')]
+    sim = Simulator(HeatPumpModel(slaves, seed=args.seed), latency=args.latency, jitter=args.jitter,
+                    fragment=args.fragment, corrupt=args.corrupt, drop=args.drop,
+                    sessions=args.sessions, seed=args.seed, protocol='tcp' if args.protocol == 'tcp' else 'rtu')
+    if args.protocol == 'serial':
+        serial_port = sim.start_pty()
+    else:
+        serial_port = ''
+        sim.start()
+    devices = {}
+    log = []
+    parameters = {
+        'Address': sim.address[0], 'Port': str(sim.address[1]), 'Mode1': args.slaves, 'Mode2': 'Normal',
+        'Mode3': {'tcp': 'TCP', 'serial': 'Serial'}.get(args.protocol, 'RTU'), 'Mode4': '', 'Mode5': '', 'Mode6': args.options,
+        'HomeFolder': '', 'SerialPort': serial_port,
+    }
+    plugin = load_plugin(devices, parameters, log)
+    plugin.onStart()
+    worker = plugin._plugin.worker
+
+    snapshots = {}
+    heartbeat_cpu = []
+    commands = 0
+    levels = (10, 20, 30, 40)
+    started = time.monotonic()
+    next_command = started + args.command_interval if args.command_interval else float('inf')
+    while time.monotonic() - started < args.duration:
+        cpu = time.thread_time()
+        plugin.onHeartbeat()
+        heartbeat_cpu.append(time.thread_time() - cpu)
+        for pump in worker.pumps:
+            snapshot = pump.latest
+            if snapshot is not None:
+                snapshots.setdefault((pump.slave, snapshot.seq), snapshot)
+        if time.monotonic() >= next_command:
+            plugin.onCommand(36, 'Set Level', levels[commands % len(levels)], 0)
+            commands += 1
+            next_command += args.command_interval
+        time.sleep(args.heartbeat)
+    plugin.onStop()
+    sim.stop()
+
+    polls = [s for s in snapshots.values() if s.units is None]
+    good = [s for s in polls if s.error is None]
+    refreshes = [s for s in snapshots.values() if s.units is not None]
+    latency = [s.duration * 1000 for s in good]
+    cycles = max(len(polls), 1)
+    updates = sum(device.updates for device in devices.values())
+    return {
+        'duration_s': round(time.monotonic() - started, 2),
+        'poll_cycles': len(polls),
+        'failed_cycles': len(polls) - len(good),
+        'commands': commands,
+        'refreshes': len(refreshes),
+        'latency_ms': {p: round(percentile(latency, p), 2) for p in (50, 90, 99, 100)},
+        'refresh_latency_ms_p50': round(percentile([s.duration * 1000 for s in refreshes], 50), 2),
+        'connections_opened': sim.stats['connections'],
+        'connections_refused': sim.stats['refused'],
+        'requests': sim.stats['requests'],
+        'bytes_on_wire': sim.stats['bytes_in'] + sim.stats['bytes_out'],
+        'bytes_per_cycle': round((sim.stats['bytes_in'] + sim.stats['bytes_out']) / cycles, 1),
+        'device_updates': updates,
+        'device_updates_per_cycle': round(updates / cycles, 2),
+        'worker_cpu_ms_per_cycle': round(sum(s.cpu for s in good) * 1000 / max(len(good), 1), 3),
+        'heartbeat_cpu_ms_total': round(sum(heartbeat_cpu) * 1000, 2),
+        'errors': [msg for kind, msg in log if kind == 'error' or (kind == 'log' and 'error:' in msg)][-5:],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run')
+    parser.add_argument('--heartbeat', type=float, default=0.02, help='seconds between onHeartbeat calls')
+    parser.add_argument('--options', default='fast=0.25;normal=0.75;slow=5;max_age=5',
+                        help='plugin Options parameter (Mode6)')
+    parser.add_argument('--command-interval', type=float, default=0.0,
+                        help='send a frequency mode command every N seconds (0 = never)')
+    parser.add_argument('--protocol', choices=('rtu', 'tcp', 'serial'), default='rtu',
+                        help='rtu = Modbus RTU over TCP, tcp = Modbus TCP, serial = RTU on a pseudo terminal')
+    parser.add_argument('--slaves', default='1', help='comma separated slave IDs to simulate and poll')
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--fragment', type=float, default=0.0)
+    parser.add_argument('--corrupt', type=float, default=0.0)
+    parser.add_argument('--drop', type=float, default=0.0)
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:>28}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Replay a capture through the plugin's decode and publish path, as fast as
+possible and without a heat pump.
+
+The register image of every poll cycle is rebuilt from the read responses
+(see poll_images), then decoded and published to stand-in devices, as the
+plugin does with a snapshot. A capture taken with a register map is
+replayed with the same map: --options "register_map=powerworld_map.json".
+
+    python3 -m tools.replay powerworld_capture.bin.1 powerworld_capture.bin [--repeat N] [--devices]
+"""
+
+import argparse
+import time
+
+from powerworld.capture import poll_images, read_capture
+from powerworld.options import parse_options
+from powerworld.regmap import load_register_map
+from powerworld.registers import register_space
+from powerworld.worker import Snapshot
+from tools.harness import load_plugin
+
+
+def replay(paths, options='', repeat=1):
+    records = [record for path in paths for record in read_capture(path)]
+    slaves = sorted({record[1] for record in records})
+    devices = {}
+    log = []
+    parameters = {'Address': '', 'Port': '', 'Mode1': ','.join(map(str, slaves)), 'Mode2': 'Normal',
+                  'Mode3': 'RTU', 'Mode5': 'Off', 'Mode6': options, 'HomeFolder': '', 'SerialPort': ''}
+    plugin = load_plugin(devices, parameters, log)
+    bp = plugin._plugin
+    bp.options = parse_options(options)
+    bp.slaves = slaves
+    for index, slave in enumerate(slaves):
+        bp.create_devices(index * plugin.UNIT_STRIDE, f"Pump {slave} " if index else "")
+    bp.used_units = frozenset(unit for unit, device in devices.items() if device.Used)
+    if bp.options['register_map']:
+        bp.registers, bp.readable, _ = load_register_map(bp.options['register_map'])
+    bp.decoder = plugin.Decoder(bp.registers)
+    bp.cache = bp.create_cache()
+    offsets = {slave: index * plugin.UNIT_STRIDE for index, slave in enumerate(slaves)}
+
+    work = list(poll_images(records, register_space(bp.registers) * 2))
+    decode = publish = 0.0
+    seq = 0
+    for _ in range(repeat):
+        for slave, t, image in work:
+            seq += 1
+            started = time.perf_counter()
+            values = bp.decoder.decode(image)
+            decoded = time.perf_counter()
+            bp.publish(offsets[slave], Snapshot(seq, t, image, values, None, 0.0, frozenset(), None))
+            decode += decoded - started
+            publish += time.perf_counter() - decoded
+    n = max(seq, 1)
+    updates = sum(device.updates for device in devices.values())
+    report = {
+        'records': len(records),
+        'slaves': slaves,
+        'cycles': seq,
+        'span_s': round(records[-1][0] - records[0][0], 1) if records else 0.0,
+        'decode_us_per_cycle': round(decode / n * 1e6, 2),
+        'publish_us_per_cycle': round(publish / n * 1e6, 2),
+        'cycles_per_s': round(seq / max(decode + publish, 1e-9)),
+        'device_updates': updates,
+        'device_updates_per_cycle': round(updates / n, 2),
+        'errors': [msg for kind, msg in log if kind == 'error'][-5:],
+    }
+    return report, devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='+', help='capture files, oldest first')
+    parser.add_argument('--options', default='', help='plugin Options parameter (Mode6), e.g. deadbands')
+    parser.add_argument('--repeat', type=int, default=1, help='replay the capture N times (for timing)')
+    parser.add_argument('--devices', action='store_true', help='print the final value of every device')
+    args = parser.parse_args()
+
+    report, devices = replay(args.paths, args.options, args.repeat)
+    for key, value in report.items():
+        print(f"{key:>26}: {value}")
+    if args.devices:
+        for unit, device in sorted(devices.items()):
+            print(f"{unit:>4} {device.Name:<40} {device.nValue:>4} {device.sValue}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+PowerWorld heat pump simulator speaking Modbus RTU over TCP or Modbus TCP.
+
+Serves the register space 0x0000-0x016E for one or more slave IDs and can
+inject latency, jitter, fragmented responses, CRC corruption, dropped
+connections and a gateway session limit.
+
+    python3 -m tools.simulator --port 1470 --latency 0.03 --fragment 0.2
+    python3 -m tools.simulator --port 502 --protocol tcp
+"""
+
+import argparse
+import array
+import os
+import random
+import socket
+import struct
+import threading
+import time
+import tty
+
+from powerworld.crc import add_crc, check_crc
+from powerworld.registers import REGISTER_SPACE
+
+
+# plausible values for a running R290 unit in heating mode
+DEFAULTS = {
+    0x05: 0x0040,                # three-way valve
+    0x0E: 352,                   # water inlet 35.2 C
+    0x0F: 481,                   # boiler 48.1 C
+    0x11: -8 & 0xFFFF,           # ambient -4.0 C
+    0x12: 398,                   # water outlet 39.8 C
+    0x15: 2, 0x16: -6 & 0xFFFF, 0x1A: 31, 0x1B: 68,
+    0x1E: 52,                    # compressor 52 Hz
+    0x21: 380,
+    0x23: 6,
+    0x26: 610, 0x27: 590,
+    0x28: -41 & 0xFFFF,
+    0x2A: 850,                   # water pump 85.0 %
+    0x2B: 412,
+    0x2E: 1350,                  # compressor power W
+    0x30: 124,                   # 1.24 m3/h
+    0x31: 231,
+    0x32: 68,
+    0x35: 1480,                  # device power W
+    0x37: 38,                    # COP 3.8
+    0x3F: 0x0001,                # unit on
+    0x43: 1,                     # heating
+    0xBE: 50,
+    0xC0: 40,
+    0x15B: 0,
+    0x15C: 5,
+}
+
+# registers that wander a little on every request, with their step size
+NOISY = {0x0E: 2, 0x12: 2, 0x11: 1, 0x1E: 1, 0x23: 1, 0x2E: 15, 0x30: 2, 0x32: 2, 0x35: 15, 0x37: 1}
+
+
+class HeatPumpModel:
+    """Register state of one or more simulated heat pumps (Modbus PDU level)."""
+
+    def __init__(self, slaves=(1,), seed=None, holes=()):
+        self.random = random.Random(seed)
+        self.holes = frozenset(holes)   # addresses that answer "illegal data address", like unused areas of a real map
+        self.registers = {}
+        for slave in slaves:
+            regs = array.array('H', bytes(REGISTER_SPACE * 2))
+            for address, value in DEFAULTS.items():
+                regs[address] = value
+            self.registers[slave] = regs
+        self.lock = threading.Lock()
+
+    def drift(self, regs):
+        for address, step in NOISY.items():
+            value = regs[address] - 0x10000 if regs[address] & 0x8000 else regs[address]
+            value += self.random.randint(-step, step)
+            regs[address] = value & 0xFFFF
+
+    def handle(self, slave, pdu):
+        """Return the response PDU for a request PDU, or None if the slave does not exist."""
+        regs = self.registers.get(slave)
+        if regs is None:
+            return None
+        function = pdu[0]
+        with self.lock:
+            if function == 3:
+                start, count = struct.unpack_from('>HH', pdu, 1)
+                if not 1 <= count <= 125:
+                    return bytes((0x83, 3))
+                if start + count > REGISTER_SPACE or not self.holes.isdisjoint(range(start, start + count)):
+                    return bytes((0x83, 2))
+                self.drift(regs)
+                return bytes((3, count * 2)) + struct.pack(f'>{count}H', *regs[start:start + count])
+            if function == 6:
+                address, value = struct.unpack_from('>HH', pdu, 1)
+                if address >= REGISTER_SPACE:
+                    return bytes((0x86, 2))
+                regs[address] = value
+                return bytes(pdu[:5])
+            if function == 16:
+                start, count = struct.unpack_from('>HH', pdu, 1)
+                if start + count > REGISTER_SPACE:
+                    return bytes((0x90, 2))
+                regs[start:start + count] = array.array('H', struct.unpack_from(f'>{count}H', pdu, 6))
+                return bytes(pdu[:5])
+        return bytes((function | 0x80, 1))
+
+
+def request_length(frame, have):
+    """Length of an RTU request frame, or None if more bytes are needed."""
+    if have < 2:
+        return None
+    if frame[1] == 16:
+        return 9 + frame[6] if have >= 7 else None
+    return 8
+
+
+def mbap_length(frame, have):
+    """Length of a Modbus TCP request frame, or None if more bytes are needed."""
+    if have < 6:
+        return None
+    return 6 + struct.unpack_from('>H', frame, 4)[0]
+
+
+class PtyLink:
+    """The master side of a pseudo terminal, used like a connected socket."""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def recv(self, size):
+        try:
+            return os.read(self.fd, size)
+        except OSError:         # EIO once the slave side is closed
+            return b''
+
+    def sendall(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Simulator:
+    """
+    RTU-over-TCP (protocol 'rtu') or Modbus TCP (protocol 'tcp') server in
+    front of a HeatPumpModel. Fault injection probabilities are per
+    response; Modbus TCP requests that arrive together are answered one
+    after the other, as a gateway in front of a serial bus does.
+    """
+
+    def __init__(self, model=None, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 fragment=0.0, corrupt=0.0, drop=0.0, sessions=4, seed=None, protocol='rtu'):
+        self.model = model or HeatPumpModel(seed=seed)
+        self.protocol = protocol
+        self.latency = latency
+        self.jitter = jitter
+        self.fragment = fragment
+        self.corrupt = corrupt
+        self.drop = drop
+        self.sessions = sessions
+        self.random = random.Random(seed)
+        self.stats = {'connections': 0, 'refused': 0, 'dropped': 0, 'requests': 0,
+                      'bytes_in': 0, 'bytes_out': 0}
+        self._active = 0
+        self._lock = threading.Lock()
+        self._server = socket.create_server((host, port))
+        self.address = self._server.getsockname()
+        self._stopping = False
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='simulator', daemon=True).start()
+        return self
+
+    def start_pty(self):
+        """
+        Serve RTU on a pseudo terminal instead of TCP, as a heat pump on a
+        serial line. Returns the device path to open as the serial port.
+        """
+        master, slave = os.openpty()
+        tty.setraw(master)
+        self._pty_slave = slave     # keep one slave fd open, or the master reads EIO
+        with self._lock:
+            self._active += 1
+            self.stats['connections'] += 1
+        threading.Thread(target=self._session, args=(PtyLink(master),), name='simulator pty', daemon=True).start()
+        return os.ttyname(slave)
+
+    def stop(self):
+        self._stopping = True
+        self._server.close()
+
+    def serve_forever(self):
+        while not self._stopping:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                break
+            with self._lock:
+                if self._active >= self.sessions:
+                    self.stats['refused'] += 1
+                    client.close()
+                    continue
+                self._active += 1
+                self.stats['connections'] += 1
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._session, args=(client,), daemon=True).start()
+
+    def _session(self, client):
+        buf = bytearray()
+        try:
+            while not self._stopping:
+                data = client.recv(512)
+                if not data:
+                    break
+                self.stats['bytes_in'] += len(data)
+                buf += data
+                while True:
+                    length = mbap_length if self.protocol == 'tcp' else request_length
+                    need = length(buf, len(buf))
+                    if need is None or len(buf) < need:
+                        break
+                    frame, buf = bytes(buf[:need]), buf[need:]
+                    if self.protocol == 'tcp':
+                        slave, pdu = frame[6], frame[7:]
+                    elif check_crc(frame):
+                        slave, pdu = frame[0], frame[1:-2]
+                    else:
+                        continue    # a real slave stays silent on a bad CRC
+                    if not self._respond(client, frame, slave, pdu):
+                        return
+        except OSError:
+            pass
+        finally:
+            client.close()
+            with self._lock:
+                self._active -= 1
+
+    def _respond(self, client, frame, slave, pdu):
+        self.stats['requests'] += 1
+        pdu = self.model.handle(slave, pdu)
+        if pdu is None:
+            return True
+        rnd = self.random
+        if rnd.random() < self.drop:
+            self.stats['dropped'] += 1
+            return False
+        if self.protocol == 'tcp':
+            resp = bytearray(frame[:4] + struct.pack('>HB', len(pdu) + 1, slave) + pdu)
+        else:
+            resp = bytearray(add_crc(bytes((slave,)) + pdu))
+            if rnd.random() < self.corrupt:
+                resp[-1] ^= 0x5A
+        delay = self.latency + rnd.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if len(resp) > 4 and rnd.random() < self.fragment:
+            cuts = sorted(rnd.sample(range(1, len(resp)), 2))
+            for part in (resp[:cuts[0]], resp[cuts[0]:cuts[1]], resp[cuts[1]:]):
+                client.sendall(part)
+                time.sleep(0.002)
+        else:
+            client.sendall(resp)
+        self.stats['bytes_out'] += len(resp)
+        return True
+
+
+def parse_holes(text):
+    holes = set()
+    for item in filter(None, text.split(',')):
+        first, _, last = item.partition('-')
+        holes.update(range(int(first, 0), int(last or first, 0) + 1))
+    return holes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1470)
+    parser.add_argument('--protocol', choices=('rtu', 'tcp'), default='rtu',
+                        help='rtu = Modbus RTU over TCP, tcp = Modbus TCP')
+    parser.add_argument('--pty', action='store_true', help='serve RTU on a pseudo terminal instead of TCP')
+    parser.add_argument('--slaves', default='1', help='comma separated slave IDs')
+    parser.add_argument('--latency', type=float, default=0.0, help='response delay in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random delay in seconds')
+    parser.add_argument('--fragment', type=float, default=0.0, help='probability of a split response')
+    parser.add_argument('--corrupt', type=float, default=0.0, help='probability of a bad CRC')
+    parser.add_argument('--drop', type=float, default=0.0, help='probability of closing the connection')
+    parser.add_argument('--sessions', type=int, default=4, help='max. concurrent TCP sessions')
+    parser.add_argument('--holes', default='', help='unreadable addresses, e.g. 0x70-0x9F,0x100')
+    args = parser.parse_args()
+
+    model = HeatPumpModel([int(s) for s in args.slaves.split(',')], holes=parse_holes(args.holes))
+    sim = Simulator(model, args.host, args.port, args.latency, args.jitter, args.fragment,
+                    args.corrupt, args.drop, args.sessions, protocol=args.protocol)
+    try:
+        if args.pty:
+            print(f"PowerWorld simulator on serial port {sim.start_pty()}, Ctrl-C to stop")
+            while True:
+                time.sleep(1)
+        print(f"PowerWorld simulator on {sim.address[0]}:{sim.address[1]}, Ctrl-C to stop")
+        sim.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(sim.stats)
+
+
+if __name__ == '__main__':
+    main()